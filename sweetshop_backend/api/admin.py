@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import User, Sweet, Purchase
+from .inventory import set_stock
+from .models import User, Sweet, Purchase, Reservation, SweetSalesDaily, CategorySalesDaily
+from .renditions import rendition_urls
 
 # Register your models here.
 
@@ -21,16 +23,52 @@ class SweetAdmin(admin.ModelAdmin):
     list_per_page = 20
     
     def image_preview(self, obj):
+        thumb = rendition_urls(obj).get('thumb')
+        if thumb:
+            return format_html(
+                '<picture><source srcset="{}" type="image/webp" />'
+                '<img src="{}" width="50" height="50" style="border-radius: 5px;" /></picture>',
+                thumb['webp'], thumb['fallback']
+            )
         if obj.image:
             return format_html('<img src="{}" width="50" height="50" style="border-radius: 5px;" />', obj.image.url)
         return 'No Image'
     image_preview.short_description = 'Image'
     image_preview.allow_tags = True
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'quantity' in form.changed_data:
+            set_stock(obj, obj.quantity)
 
 @admin.register(Purchase)
 class PurchaseAdmin(admin.ModelAdmin):
     list_display = ['user', 'sweet', 'quantity', 'total_price', 'purchase_date']
+    list_select_related = ['user', 'sweet']
     list_filter = ['purchase_date']
     search_fields = ['user__name', 'sweet__name']
     ordering = ['-purchase_date']
     list_per_page = 20
+
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'sweet', 'quantity', 'expires_at', 'created_at']
+    list_select_related = ['user', 'sweet']
+    list_filter = ['expires_at']
+    search_fields = ['user__name', 'sweet__name']
+    list_per_page = 20
+
+@admin.register(SweetSalesDaily)
+class SweetSalesDailyAdmin(admin.ModelAdmin):
+    list_display = ['day', 'sweet', 'quantity', 'revenue', 'purchases']
+    list_filter = ['day']
+    list_select_related = ['sweet']
+    ordering = ['-day']
+    list_per_page = 20
+
+@admin.register(CategorySalesDaily)
+class CategorySalesDailyAdmin(admin.ModelAdmin):
+    list_display = ['day', 'category', 'quantity', 'revenue', 'purchases']
+    list_filter = ['day', 'category']
+    ordering = ['-day']
+    list_per_page = 20
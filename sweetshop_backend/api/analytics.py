@@ -0,0 +1,133 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CategorySalesDaily, Purchase, SweetSalesDaily
+
+# Rollups are upserted with INSERT ... ON CONFLICT, which SQLite and PostgreSQL
+# both understand, so concurrent purchases on the same day add up in the
+# database instead of racing on a read-modify-write.
+SWEET_UPSERT_SQL = f"""
+    INSERT INTO {SweetSalesDaily._meta.db_table} (day, sweet_id, quantity, revenue, purchases)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (day, sweet_id) DO UPDATE SET
+        quantity = {SweetSalesDaily._meta.db_table}.quantity + excluded.quantity,
+        revenue = {SweetSalesDaily._meta.db_table}.revenue + excluded.revenue,
+        purchases = {SweetSalesDaily._meta.db_table}.purchases + excluded.purchases
+"""
+
+CATEGORY_UPSERT_SQL = f"""
+    INSERT INTO {CategorySalesDaily._meta.db_table} (day, category, quantity, revenue, purchases)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (day, category) DO UPDATE SET
+        quantity = {CategorySalesDaily._meta.db_table}.quantity + excluded.quantity,
+        revenue = {CategorySalesDaily._meta.db_table}.revenue + excluded.revenue,
+        purchases = {CategorySalesDaily._meta.db_table}.purchases + excluded.purchases
+"""
+
+
+def _apply(by_sweet, by_category):
+    """Add per-(day, sweet) and per-(day, category) totals to the rollup tables"""
+    with connection.cursor() as cursor:
+        if by_sweet:
+            cursor.executemany(SWEET_UPSERT_SQL, [
+                (day.isoformat(), sweet_id, quantity, str(revenue), purchases)
+                for (day, sweet_id), (quantity, revenue, purchases) in by_sweet.items()
+            ])
+        if by_category:
+            cursor.executemany(CATEGORY_UPSERT_SQL, [
+                (day.isoformat(), category, quantity, str(revenue), purchases)
+                for (day, category), (quantity, revenue, purchases) in by_category.items()
+            ])
+
+
+class _Totals:
+    """Per-(day, sweet) and per-(day, category) sums, ready for _apply"""
+
+    def __init__(self):
+        self.by_sweet = defaultdict(lambda: [0, Decimal('0'), 0])
+        self.by_category = defaultdict(lambda: [0, Decimal('0'), 0])
+
+    def add(self, day, sweet_id, category, quantity, revenue, purchases):
+        for totals in (self.by_sweet[day, sweet_id], self.by_category[day, category or '']):
+            totals[0] += quantity
+            totals[1] += Decimal(revenue)
+            totals[2] += purchases
+
+    def apply(self):
+        _apply(self.by_sweet, self.by_category)
+
+
+def record_sales(purchases, sign=1):
+    """Add purchases to the rollups (sign=-1 takes them out again).
+
+    Call inside the transaction that writes the purchases so the rollups never
+    disagree with the purchases table.
+    """
+    totals = _Totals()
+    for purchase in purchases:
+        totals.add(
+            timezone.localdate(purchase.purchase_date), purchase.sweet_id, purchase.sweet.category,
+            sign * purchase.quantity, sign * Decimal(purchase.total_price), sign
+        )
+    totals.apply()
+
+
+def backfill_sales(batch_size=10000):
+    """Rebuild the rollups from the purchases table, one id range per transaction.
+
+    Yields the number of purchases processed after every batch. Purchases made
+    while the backfill runs are counted by record_sales, not twice.
+    """
+    with transaction.atomic():
+        SweetSalesDaily.objects.all().delete()
+        CategorySalesDaily.objects.all().delete()
+        last_id = Purchase.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+
+    processed = 0
+    for start in range(0, last_id, batch_size):
+        rows = (
+            Purchase.objects.order_by()
+            .filter(id__gt=start, id__lte=min(start + batch_size, last_id))
+            .annotate(day=TruncDate('purchase_date'))
+            .values('day', 'sweet_id', 'sweet__category')
+            .annotate(quantity_sum=Sum('quantity'), revenue_sum=Sum('total_price'), purchase_count=Count('id'))
+        )
+        totals = _Totals()
+        for row in rows:
+            totals.add(
+                row['day'], row['sweet_id'], row['sweet__category'],
+                row['quantity_sum'], row['revenue_sum'], row['purchase_count']
+            )
+            processed += row['purchase_count']
+        with transaction.atomic():
+            totals.apply()
+        yield processed
+
+
+GROUPINGS = {
+    'day': (CategorySalesDaily, ['day']),
+    'category': (CategorySalesDaily, ['category']),
+    'sweet': (SweetSalesDaily, ['sweet_id', 'sweet__name']),
+}
+
+
+def sales_report(start, end, group_by='day'):
+    """Quantity, revenue and purchase count between two dates (inclusive), from the rollups"""
+    model, keys = GROUPINGS[group_by]
+    rows = (
+        model.objects.filter(day__gte=start, day__lte=end)
+        .values(*keys)
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'), purchases=Sum('purchases'))
+        .order_by(*keys)
+    )
+    results = []
+    for row in rows:
+        if 'sweet__name' in row:
+            row['sweet_name'] = row.pop('sweet__name')
+        results.append(row)
+    return results
@@ -0,0 +1,92 @@
+"""Async versions of the read-heavy public endpoints.
+
+Served instead of their api.views counterparts when settings.ASYNC_VIEWS is on,
+so under ASGI (sweetshop_backend.asgi) these requests stay on the event loop
+instead of hopping through the sync thread executor. Response bodies match the
+sync views. Less common modes (cursor pages) are delegated to the sync view.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, ValidationError
+
+from . import views
+from .authentication import CachedJWTAuthentication
+from .cache import aget_cached_catalog
+from .filters import compute_catalog_facets, filter_sweets, parse_catalog_filters
+from .models import Sweet, Purchase
+from .pagination import cursor_requested
+from .replicas import replica_reads
+from .serializers import SweetSerializer, PurchaseSerializer
+
+
+@require_GET
+@replica_reads
+async def get_sweets(request):
+    """Get all sweets (public endpoint)"""
+    if cursor_requested(request):
+        return await sync_to_async(views.get_sweets)(request)
+
+    try:
+        filters = parse_catalog_filters(request)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+
+    async def build():
+        queryset = filter_sweets(Sweet.objects.all(), filters)
+        return [views._sweet_to_dict(sweet, request) async for sweet in queryset]
+
+    sweets_data = await aget_cached_catalog(
+        'public', build,
+        request.build_absolute_uri('/'),
+        sorted((name, str(value)) for name, value in filters.items() if name != 'facets'),
+    )
+    if filters['facets']:
+        facets = await aget_cached_catalog('facets', sync_to_async(compute_catalog_facets))
+        return JsonResponse({'results': sweets_data, 'facets': facets})
+    return JsonResponse(sweets_data, safe=False)
+
+
+@require_GET
+@replica_reads
+async def get_sweet_detail(request, sweet_id):
+    """Get specific sweet details (public endpoint)"""
+    try:
+        sweet = await Sweet.objects.aget(id=sweet_id)
+    except Sweet.DoesNotExist:
+        return JsonResponse({
+            'error': 'Sweet not found'
+        }, status=404)
+    return JsonResponse(SweetSerializer(sweet, context={'request': request}).data)
+
+
+async def _aget_user(request):
+    """The bearer token's user if there is one, else the session user"""
+    authenticated = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    if authenticated is not None:
+        return authenticated[0]
+    return await request.auser()
+
+
+def _unauthorized(request, detail):
+    """401 with the challenge DRF sends for the first authentication class"""
+    response = JsonResponse(detail, status=401, safe=False)
+    response['WWW-Authenticate'] = CachedJWTAuthentication().authenticate_header(request)
+    return response
+
+
+@require_GET
+async def get_user_purchases(request):
+    """Get purchases for current user"""
+    if cursor_requested(request):
+        return await sync_to_async(views.get_user_purchases)(request)
+
+    try:
+        user = await _aget_user(request)
+    except AuthenticationFailed as e:
+        return _unauthorized(request, e.detail)
+    if not user.is_authenticated:
+        return _unauthorized(request, {'detail': NotAuthenticated.default_detail})
+
+    purchases = [purchase async for purchase in Purchase.objects.for_listing().filter(user=user)]
+    return JsonResponse(PurchaseSerializer(purchases, many=True).data, safe=False)
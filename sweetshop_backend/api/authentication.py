@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+
+# The fields request.user needs on the hot path: permission checks (is_active,
+# is_staff, role) and the profile (UserSerializer). Other fields are deferred
+# and load from the database on first access.
+CACHED_USER_FIELDS = ('id', 'email', 'name', 'role', 'created_at', 'is_active', 'is_staff', 'is_superuser')
+
+# Model.from_db() expects the values in field definition order
+_FIELD_NAMES = [field.attname for field in User._meta.concrete_fields if field.attname in CACHED_USER_FIELDS]
+
+
+def _user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def get_cached_user(user_id):
+    """The user with this id, read from the cache or loaded (and cached) on a miss"""
+    values = cache.get(_user_key(user_id))
+    if values is None:
+        values = User.objects.filter(id=user_id).values_list(*_FIELD_NAMES).first()
+        if values is None:
+            return None
+        cache.set(_user_key(user_id), values, settings.AUTH_USER_CACHE_TIMEOUT)
+    return User.from_db('default', _FIELD_NAMES, values)
+
+
+def forget_user(user_id):
+    cache.delete(_user_key(user_id))
+
+
+def invalidate_user(user_id):
+    """Drop the cached user now and again once the current transaction commits.
+
+    The second delete covers a request that re-cached the old row before the
+    change was visible to it.
+    """
+    forget_user(user_id)
+    transaction.on_commit(lambda: forget_user(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWT authentication that resolves the token's user from the cache.
+
+    A verified access token plus a warm cache authenticates a request without
+    any query. Saving or deleting a User invalidates its entry (see
+    api.signals); queryset.update() does not, so such changes show up after
+    AUTH_USER_CACHE_TIMEOUT at the latest.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Needs the password hash, which is not worth caching
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
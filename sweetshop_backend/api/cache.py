@@ -0,0 +1,89 @@
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from .replicas import reading_replica
+
+# The catalog cache is a regular Django cache alias, so the backend is chosen in
+# settings.CACHES: LocMemCache for a single process, FileBasedCache or
+# DatabaseCache to share one catalog between all workers. The version key has
+# an alias of its own, so payloads crowding the catalog alias cannot evict it.
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def get_catalog_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'catalog')]
+
+
+def get_catalog_version_cache():
+    return caches[getattr(settings, 'CATALOG_VERSION_CACHE_ALIAS', 'catalog-version')]
+
+
+def get_catalog_version():
+    """Current catalog version, initialising it if the backend lost it"""
+    cache = get_catalog_version_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Start from the clock so a lost version never points back at old payloads
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog payload"""
+    cache = get_catalog_version_cache()
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_catalog():
+    """Bump the catalog version once the current transaction commits"""
+    transaction.on_commit(bump_catalog_version)
+
+
+def _catalog_key(version, name, parts):
+    # Parts are normalized filters and URLs; hash them into a short, backend-safe key
+    digest = hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+    return f'catalog:{version}:{name}:{digest}'
+
+
+def _payload_timeout():
+    # A replica may lag behind the write that bumped the version; keep what it
+    # returned only as long as clients are pinned to the primary after a write
+    return settings.REPLICA_PIN_SECONDS if reading_replica() else DEFAULT_TIMEOUT
+
+
+def get_cached_catalog(name, build, *parts):
+    """Return the payload cached under the current catalog version, building it on a miss"""
+    cache = get_catalog_cache()
+    key = _catalog_key(get_catalog_version(), name, parts)
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        cache.set(key, payload, timeout=_payload_timeout())
+    return payload
+
+
+async def aget_cached_catalog(name, abuild, *parts):
+    """Async get_cached_catalog; abuild is a coroutine function"""
+    cache = get_catalog_cache()
+    # In-memory caches do not block, so skip the thread hop of sync_to_async() and aget()
+    if isinstance(get_catalog_version_cache(), LocMemCache):
+        version = get_catalog_version()
+    else:
+        version = await sync_to_async(get_catalog_version)()
+    key = _catalog_key(version, name, parts)
+    payload = cache.get(key) if isinstance(cache, LocMemCache) else await cache.aget(key)
+    if payload is None:
+        payload = await abuild()
+        await cache.aset(key, payload, timeout=_payload_timeout())
+    return payload
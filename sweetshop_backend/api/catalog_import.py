@@ -0,0 +1,110 @@
+import csv
+import json
+
+from django.db import transaction
+
+from .inventory import adjust_stock, stock_levels
+from .models import Sweet
+from .serializers import SweetImportSerializer
+
+UPDATABLE_FIELDS = ('description', 'category', 'price')
+
+
+def read_rows(stream, file_format):
+    """Yield (row number, dict or error message) from a CSV or NDJSON text stream, one row at a time"""
+    if file_format == 'csv':
+        for number, row in enumerate(csv.DictReader(stream), start=1):
+            # Empty cells mean "not given", so they keep the current value on updates
+            yield number, {key: value for key, value in row.items() if key and value not in ('', None)}
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, f'invalid JSON: {e}'
+            continue
+        yield number, row if isinstance(row, dict) else 'expected a JSON object'
+
+
+def _apply_batch(batch):
+    """Upsert one batch ({name: (row number, data)}) in a single transaction; returns (created, updated)"""
+    with transaction.atomic():
+        existing = {}
+        # With duplicate names already in the table, the oldest sweet is the one updated
+        for sweet in Sweet.objects.filter(name__in=list(batch)).order_by('-id'):
+            existing[sweet.name] = sweet
+
+        to_create, to_update, fields, stock = [], [], set(), {}
+        for name, (_, data) in batch.items():
+            sweet = existing.get(name)
+            if sweet is None:
+                to_create.append(Sweet(**data))
+                continue
+            for field in UPDATABLE_FIELDS:
+                if field in data:
+                    setattr(sweet, field, data[field])
+                    fields.add(field)
+            if 'quantity' in data:
+                stock[sweet.id] = data['quantity']
+            to_update.append(sweet)
+
+        Sweet.objects.bulk_create(to_create)
+        if fields:
+            Sweet.objects.bulk_update(to_update, sorted(fields))
+        if stock:
+            # Applied as a change from the current level, so purchases and cart
+            # holds committed since the SELECT are kept, and sharded sweets
+            # get the stock in their shards
+            levels = {sweet.id: sweet.quantity for sweet in existing.values() if sweet.id in stock}
+            sharded = [sweet.id for sweet in existing.values() if sweet.id in stock and sweet.stock_shards]
+            if sharded:
+                levels.update(stock_levels(sharded))
+            adjust_stock(
+                {sweet_id: quantity - levels[sweet_id] for sweet_id, quantity in stock.items()},
+                invalidate=False,  # the caller bumps the catalog version once at the end
+            )
+    return len(to_create), len(to_update)
+
+
+def import_sweets(rows, batch_size=1000):
+    """Upsert sweets by name from (row number, data) pairs, batch_size rows per transaction.
+
+    Yields a progress dict after every batch: running totals of rows, created
+    and updated, plus the (row number, message) errors of that batch. Sweets
+    are written with bulk_create/bulk_update, which send no signals, so the
+    caller invalidates the catalog once at the end.
+    """
+    totals = {'rows': 0, 'created': 0, 'updated': 0}
+    batch, errors = {}, []
+
+    def flush():
+        created, updated = _apply_batch(batch)
+        totals['created'] += created
+        totals['updated'] += updated
+        progress = {**totals, 'errors': list(errors)}
+        batch.clear()
+        errors.clear()
+        return progress
+
+    for number, data in rows:
+        totals['rows'] += 1
+        if isinstance(data, str):
+            errors.append((number, data))
+        else:
+            serializer = SweetImportSerializer(data=data)
+            if serializer.is_valid():
+                # A later row for the same name within a batch wins
+                batch.pop(serializer.validated_data['name'], None)
+                batch[serializer.validated_data['name']] = (number, serializer.validated_data)
+            else:
+                errors.append((number, _error_message(serializer.errors)))
+        if len(batch) >= batch_size:
+            yield flush()
+    if batch or errors or not totals['rows']:
+        yield flush()
+
+
+def _error_message(errors):
+    return '; '.join(f"{field}: {' '.join(map(str, messages))}" for field, messages in errors.items())
@@ -0,0 +1,77 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import Purchase
+
+# (column, values_list() lookup) of every exported purchase row
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('purchase_date', 'purchase_date'),
+    ('user_id', 'user_id'),
+    ('user_name', 'user__name'),
+    ('user_email', 'user__email'),
+    ('sweet_id', 'sweet_id'),
+    ('sweet_name', 'sweet__name'),
+    ('category', 'sweet__category'),
+    ('quantity', 'quantity'),
+    ('total_price', 'total_price'),
+]
+
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+# Spreadsheets run cells starting with these as formulas; names and emails are user input
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def export_rows(start=None, end=None, chunk_size=2000):
+    """Purchases between two dates (inclusive, local time) as tuples, fetched chunk_size rows at a time.
+
+    values_list() plus iterator() keeps memory flat: no model instances, no
+    result cache, and the range filter can use the purchase_date index.
+    """
+    queryset = Purchase.objects.order_by('id')
+    if start is not None:
+        queryset = queryset.filter(purchase_date__gte=timezone.make_aware(datetime.combine(start, time.min)))
+    if end is not None:
+        queryset = queryset.filter(purchase_date__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+    return queryset.values_list(*(lookup for _, lookup in EXPORT_COLUMNS)).iterator(chunk_size=chunk_size)
+
+
+class _Line:
+    """File-like object whose write() hands back the line csv.writer formatted"""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow([column for column, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow([_cell(value) for value in row])
+
+
+def render_ndjson(rows):
+    columns = [column for column, _ in EXPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(columns, map(_text, row)))) + '\n'
+
+
+RENDERERS = {'csv': render_csv, 'ndjson': render_ndjson}
+
+
+def _cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return _text(value)
+
+
+def _text(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (int, str)) or value is None:
+        return value
+    return str(value)  # Decimal
@@ -0,0 +1,93 @@
+from decimal import Decimal
+
+from django.db.models import Count, Q
+from rest_framework import serializers
+
+from .cache import get_cached_catalog
+from .models import Sweet
+
+# Price buckets for catalog facets: (label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    ('0-100', None, Decimal('100')),
+    ('100-200', Decimal('100'), Decimal('200')),
+    ('200-500', Decimal('200'), Decimal('500')),
+    ('500+', Decimal('500'), None),
+]
+
+
+class CatalogFilterSerializer(serializers.Serializer):
+    """Query parameters accepted by the public catalog endpoints"""
+    category = serializers.CharField(required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    in_stock = serializers.BooleanField(required=False)
+    facets = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, attrs):
+        if 'min_price' in attrs and 'max_price' in attrs and attrs['min_price'] > attrs['max_price']:
+            raise serializers.ValidationError('min_price cannot be greater than max_price')
+        return attrs
+
+
+def parse_catalog_filters(request):
+    """Validated catalog filters from the query string; raises ValidationError"""
+    # A plain dict so a missing boolean means "not given" rather than False
+    serializer = CatalogFilterSerializer(data=request.GET.dict())
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+def filter_sweets(queryset, filters):
+    if 'category' in filters:
+        queryset = queryset.filter(category=filters['category'])
+    if 'min_price' in filters:
+        queryset = queryset.filter(price__gte=filters['min_price'])
+    if 'max_price' in filters:
+        queryset = queryset.filter(price__lte=filters['max_price'])
+    if filters.get('in_stock') is True:
+        queryset = queryset.filter(quantity__gt=0)
+    elif filters.get('in_stock') is False:
+        queryset = queryset.filter(quantity__lte=0)
+    return queryset
+
+
+def _price_bucket_filter(lower, upper):
+    condition = Q()
+    if lower is not None:
+        condition &= Q(price__gte=lower)
+    if upper is not None:
+        condition &= Q(price__lt=upper)
+    return condition
+
+
+def compute_catalog_facets():
+    """Counts per category, price bucket and stock state from one GROUP BY query"""
+    rows = Sweet.objects.order_by().values('category').annotate(
+        total=Count('id'),
+        in_stock=Count('id', filter=Q(quantity__gt=0)),
+        **{
+            f'bucket_{index}': Count('id', filter=_price_bucket_filter(lower, upper))
+            for index, (label, lower, upper) in enumerate(PRICE_BUCKETS)
+        }
+    )
+
+    categories = {}
+    price = {label: 0 for label, lower, upper in PRICE_BUCKETS}
+    stock = {'in_stock': 0, 'sold_out': 0}
+    for row in rows:
+        categories[row['category']] = row['total']
+        for index, (label, lower, upper) in enumerate(PRICE_BUCKETS):
+            price[label] += row[f'bucket_{index}']
+        stock['in_stock'] += row['in_stock']
+        stock['sold_out'] += row['total'] - row['in_stock']
+
+    return {
+        'category': categories,
+        'price': price,
+        'stock': stock,
+    }
+
+
+def get_catalog_facets():
+    """Catalog facets, cached alongside the catalog version"""
+    return get_cached_catalog('facets', compute_catalog_facets)
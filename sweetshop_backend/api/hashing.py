@@ -0,0 +1,128 @@
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.exceptions import PermissionDenied
+
+from .models import User
+
+# Password hashing (PBKDF2, tens of ms of CPU) runs on its own small thread
+# pool, so a login or registration burst can use at most
+# PASSWORD_HASHING_WORKERS cores and leaves the rest to catalog requests.
+# Requests beyond PASSWORD_HASHING_WORKERS + PASSWORD_HASHING_MAX_PENDING are
+# refused before any hashing happens: the API views answer them with 429, and
+# other logins (the Django admin) fail like a wrong password.
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+_stats = {'hashed': 0, 'shed': 0, 'throttled': 0, 'hash_seconds': 0.0, 'wait_seconds': 0.0}
+
+
+class PoolFull(Exception):
+    """The hashing pool and its queue are full, so the attempt was shed"""
+
+
+def _get_pool():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = settings.PASSWORD_HASHING_WORKERS
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hashing')
+            _slots = threading.BoundedSemaphore(workers + settings.PASSWORD_HASHING_MAX_PENDING)
+            atexit.register(_executor.shutdown, wait=False)
+    return _executor, _slots
+
+
+def record(name, value=1):
+    with _lock:
+        _stats[name] += value
+
+
+def hashing_stats():
+    """Counters since startup: hashed, shed (pool full), throttled (per client), seconds spent"""
+    with _lock:
+        return dict(_stats)
+
+
+def _timed(function, args, submitted):
+    started = time.perf_counter()
+    try:
+        return function(*args)
+    finally:
+        finished = time.perf_counter()
+        record('wait_seconds', started - submitted)
+        record('hash_seconds', finished - started)
+        record('hashed')
+
+
+def run_hashing(function, *args):
+    """Run function(*args) on the hashing pool and wait for its result.
+
+    Raises PoolFull right away when the pool and its queue are full.
+    With PASSWORD_HASHING_WORKERS = 0 the function runs inline, unbounded.
+    """
+    if not settings.PASSWORD_HASHING_WORKERS:
+        return _timed(function, args, time.perf_counter())
+
+    executor, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        record('shed')
+        raise PoolFull
+    try:
+        future = executor.submit(_timed, function, args, time.perf_counter())
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future.result()
+
+
+def hash_password(raw_password):
+    return run_hashing(make_password, raw_password)
+
+
+class PooledHashingBackend(ModelBackend):
+    """ModelBackend that checks passwords on the hashing pool.
+
+    The user lookup and the save of an upgraded hash stay on the request
+    thread and its database connection; only the hashing moves. Unknown
+    emails still pay for one hash, like ModelBackend, so response times do
+    not reveal which accounts exist.
+
+    A shed attempt is a refused login (PermissionDenied, which authenticate()
+    turns into None and user_login_failed); request.hashing_pool_full tells
+    the caller it may retry.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            return self._check_password(username, password)
+        except PoolFull:
+            if request is not None:
+                request.hashing_pool_full = True
+            raise PermissionDenied
+
+    def _check_password(self, username, password):
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            hash_password(password)
+            return None
+        outdated = []
+        if not run_hashing(check_password, password, user.password, outdated.append):
+            return None
+        if outdated:
+            # Hashed with an older hasher or fewer iterations than now configured
+            user.password = hash_password(password)
+            user.save(update_fields=['password'])
+        return user if self.user_can_authenticate(user) else None
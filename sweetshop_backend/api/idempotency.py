@@ -0,0 +1,153 @@
+import functools
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+# Clients may send an Idempotency-Key header with a purchase or checkout. The
+# first request with a key runs the view and its response is stored for
+# IDEMPOTENCY_TTL seconds; repeats are answered from the store, so a retried
+# purchase is neither re-validated nor charged twice. While the first request
+# is still running, a marker in the store makes duplicates wait for its result
+# (woken by an Event within this process, polling the store across processes)
+# instead of queueing on the same rows.
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+POLL_SECONDS = 0.05
+
+_in_flight = {}  # store key -> Event set when the first request finishes
+_lock = threading.Lock()
+
+_stats = {'executed': 0, 'replayed': 0, 'coalesced': 0, 'conflicts': 0}
+
+
+def _record(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def idempotency_stats():
+    """Counters since startup: executed, replayed, coalesced (waited for an in-flight request), conflicts"""
+    with _lock:
+        return dict(_stats)
+
+
+def get_idempotency_cache():
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE_ALIAS', 'default')]
+
+
+def _client(request):
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f"ip:{request.META.get('REMOTE_ADDR')}"
+
+
+def _store_key(request, key):
+    # Keys are only unique per client and endpoint; hash them into a backend-safe key
+    digest = hashlib.sha256(f'{_client(request)}:{request.path}:{key}'.encode()).hexdigest()
+    return f'idempotency:{digest}'
+
+
+def _fingerprint(request):
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def _error(message, status_code):
+    return Response({'error': message}, status=status_code)
+
+
+def _replay(entry):
+    status_code, data = entry['response']
+    response = Response(data, status=status_code)
+    response[REPLAY_HEADER] = 'true'
+    return response
+
+
+def _storable(response):
+    # Server errors, throttling and in-progress answers may succeed on a retry
+    return (
+        isinstance(response, Response)
+        and response.status_code < 500
+        and response.status_code not in (status.HTTP_409_CONFLICT, status.HTTP_429_TOO_MANY_REQUESTS)
+    )
+
+
+def _execute(view, request, args, kwargs, cache, store_key, fingerprint):
+    event = threading.Event()
+    with _lock:
+        _in_flight[store_key] = event
+    stored = False
+    try:
+        response = view(request, *args, **kwargs)
+        if _storable(response):
+            cache.set(store_key, {'fingerprint': fingerprint, 'response': (response.status_code, response.data)},
+                      timeout=settings.IDEMPOTENCY_TTL)
+            stored = True
+        return response
+    finally:
+        if not stored:
+            # Let the next request with this key run the view again
+            cache.delete(store_key)
+        with _lock:
+            _in_flight.pop(store_key, None)
+        event.set()
+        _record('executed')
+
+
+def idempotent(view):
+    """Answer repeats of a request with the same Idempotency-Key from the first response.
+
+    Goes below @api_view, so request is a DRF Request and errors are Responses.
+    Requests without the header run as usual.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error(f'{HEADER} must be at most {MAX_KEY_LENGTH} characters', status.HTTP_400_BAD_REQUEST)
+
+        cache = get_idempotency_cache()
+        store_key = _store_key(request, key)
+        fingerprint = _fingerprint(request)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        waited = False
+        while True:
+            # add() is atomic, so exactly one request per key gets to run the view
+            if cache.add(store_key, {'fingerprint': fingerprint, 'response': None},
+                         timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+                return _execute(view, request, args, kwargs, cache, store_key, fingerprint)
+
+            entry = cache.get(store_key)
+            if entry is None:
+                continue  # the first request failed or its marker expired; try to run it
+            if entry['fingerprint'] != fingerprint:
+                _record('conflicts')
+                return _error(f'{HEADER} was already used with a different request',
+                              status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if entry['response'] is not None:
+                _record('coalesced' if waited else 'replayed')
+                return _replay(entry)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _record('conflicts')
+                response = _error(f'A request with this {HEADER} is still in progress',
+                                  status.HTTP_409_CONFLICT)
+                response['Retry-After'] = '1'
+                return response
+            waited = True
+            with _lock:
+                event = _in_flight.get(store_key)
+            if event is not None:
+                event.wait(remaining)
+            else:
+                time.sleep(min(remaining, POLL_SECONDS))
+    return wrapper
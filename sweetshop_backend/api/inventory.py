@@ -0,0 +1,154 @@
+import functools
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Cast, Coalesce
+
+from .cache import invalidate_catalog
+from .models import StockShard, Sweet
+
+# Stock of most sweets is Sweet.quantity, changed with conditional UPDATEs.
+# A hot sweet can be sharded (shard_stock): its stock is split over N
+# StockShard rows, and each purchase takes from a random shard with enough
+# left, so concurrent buyers lock different rows. When no shard has enough,
+# the stock is pooled and split evenly again.
+#
+# Sweet.quantity of a sharded sweet is the sum of its shards, refreshed at
+# most every STOCK_SHARD_REFRESH_SECONDS (once after the first change in
+# each interval), so the catalog, its cache and its filters read one column
+# while purchases never write the sweet row.
+
+
+def take_stock(sweet_id, quantity):
+    """Take quantity of a sweet's stock if there is enough; False if not, or no such sweet"""
+    decrement = Cast(F('quantity') - quantity, IntegerField())
+    if Sweet.objects.filter(id=sweet_id, stock_shards=0, quantity__gte=quantity).update(quantity=decrement):
+        return True
+    # A random shard that still has enough, picked and decremented in one statement
+    shard = StockShard.objects.filter(sweet_id=sweet_id, quantity__gte=quantity).order_by('?').values('id')[:1]
+    if StockShard.objects.filter(id=Subquery(shard), quantity__gte=quantity).update(quantity=decrement):
+        _shards_changed(sweet_id)
+        return True
+    # No single shard has enough (or the sweet is not sharded): pool what is left
+    return rebalance(sweet_id, take=quantity)
+
+
+def rebalance(sweet_id, take=0):
+    """Pool a sweet's shards, take `take` out of the total and split the rest evenly.
+
+    Returns False, changing nothing, when the total is less than take.
+    """
+    with transaction.atomic():
+        shards = list(StockShard.objects.select_for_update().filter(sweet_id=sweet_id).order_by('shard'))
+        total = sum(shard.quantity for shard in shards)
+        if not shards or total < take:
+            return False
+        base, extra = divmod(int(total - take), len(shards))
+        for index, shard in enumerate(shards):
+            shard.quantity = base + (index < extra)
+        StockShard.objects.bulk_update(shards, ['quantity'])
+        _shards_changed(sweet_id)
+    return True
+
+
+def adjust_stock(changes, invalidate=True):
+    """Add {sweet_id: delta} to stock unconditionally (returned or already-checked stock).
+
+    invalidate=False leaves the catalog version alone, for callers that bump it
+    once themselves after many changes.
+    """
+    changes = {sweet_id: delta for sweet_id, delta in changes.items() if delta}
+    if not changes:
+        return
+    sharded = set(Sweet.objects.filter(id__in=list(changes), stock_shards__gt=0).values_list('id', flat=True))
+    plain = {sweet_id: delta for sweet_id, delta in changes.items() if sweet_id not in sharded}
+    if plain:
+        Sweet.objects.filter(id__in=list(plain)).update(quantity=Case(
+            *(When(id=sweet_id, then=F('quantity') + delta) for sweet_id, delta in plain.items()),
+            default=F('quantity')
+        ))
+    for sweet_id in sharded:
+        delta = changes[sweet_id]
+        if delta < 0 and rebalance(sweet_id, take=-delta):
+            continue
+        # Returned stock goes to the emptiest shard; an unchecked shortfall to the fullest
+        order = 'quantity' if delta > 0 else '-quantity'
+        shard_id = StockShard.objects.filter(sweet_id=sweet_id).order_by(order).values_list('id', flat=True).first()
+        StockShard.objects.filter(id=shard_id).update(quantity=F('quantity') + delta)
+        _shards_changed(sweet_id)
+    if invalidate:
+        invalidate_catalog()
+
+
+def stock_levels(sweet_ids):
+    """Exact stock of each sweet: its quantity, or the sum of its shards"""
+    levels = dict(Sweet.objects.filter(id__in=sweet_ids).values_list('id', 'quantity'))
+    levels.update(
+        StockShard.objects.filter(sweet_id__in=sweet_ids).order_by().values('sweet_id')
+        .annotate(total=Sum('quantity')).values_list('sweet_id', 'total')
+    )
+    return levels
+
+
+def shard_stock(sweet_id, shards, quantity=None):
+    """Split a sweet's stock (or quantity, to restock) over shards rows; 0 puts it back in the sweet"""
+    with transaction.atomic():
+        sweet = Sweet.objects.select_for_update().only('id', 'quantity', 'stock_shards').get(id=sweet_id)
+        if quantity is None:
+            quantity = stock_levels([sweet_id])[sweet_id]
+        StockShard.objects.filter(sweet_id=sweet_id).delete()
+        if shards:
+            base, extra = divmod(quantity, shards)
+            StockShard.objects.bulk_create([
+                StockShard(sweet_id=sweet_id, shard=index, quantity=base + (index < extra))
+                for index in range(shards)
+            ])
+        Sweet.objects.filter(id=sweet.id).update(quantity=quantity, stock_shards=shards)
+        invalidate_catalog()
+    return quantity
+
+
+def set_stock(sweet, quantity):
+    """Make quantity a sweet's stock, after an edit of its quantity (API or admin)"""
+    if sweet.stock_shards:
+        # Purchases take from the shards, so new stock has to go there too
+        shard_stock(sweet.id, sweet.stock_shards, quantity=quantity)
+        return
+    Sweet.objects.filter(id=sweet.id).update(quantity=quantity)
+    invalidate_catalog()
+
+
+def refresh_summed_quantity(sweet_id):
+    """Copy the sum of a sharded sweet's shards into Sweet.quantity"""
+    total = StockShard.objects.filter(sweet_id=OuterRef('id')).order_by().values('sweet_id').annotate(
+        total=Sum('quantity')
+    ).values('total')
+    Sweet.objects.filter(id=sweet_id, stock_shards__gt=0).update(quantity=Coalesce(Subquery(total), 0))
+    invalidate_catalog()
+
+
+def _refresh_later(sweet_id):
+    try:
+        refresh_summed_quantity(sweet_id)
+    finally:
+        connection.close()
+
+
+def _schedule_refresh(sweet_id, interval):
+    # The first committed change in an interval schedules one refresh at its end, which sees all of them
+    if cache.add(f'stock-shards:refresh:{sweet_id}', 1, timeout=interval):
+        timer = threading.Timer(interval, _refresh_later, args=(sweet_id,))
+        timer.daemon = True
+        timer.start()
+
+
+def _shards_changed(sweet_id):
+    interval = settings.STOCK_SHARD_REFRESH_SECONDS
+    if not interval:
+        refresh_summed_quantity(sweet_id)
+        return
+    # Claimed after commit, so a rolled-back change does not hold off the refresh
+    transaction.on_commit(functools.partial(_schedule_refresh, sweet_id, interval))
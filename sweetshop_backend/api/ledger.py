@@ -0,0 +1,295 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import Throttled
+
+from .analytics import record_sales
+from .inventory import adjust_stock, stock_levels
+from .models import LedgerCheckpoint, Purchase, Sweet
+
+# Flash-sale mode (FLASH_SALE_MODE): purchase_sweet checks stock against an
+# in-memory copy, appends the purchase to a local journal and queues it,
+# instead of committing a transaction per purchase. A flusher thread commits
+# whatever is queued every FLASH_SALE_FLUSH_MS as one transaction, together
+# with the journal sequence it reached (LedgerCheckpoint). After a crash,
+# reconcile() replays the journal entries past the checkpoint.
+#
+# The in-memory stock belongs to one process, so flash-sale mode needs a
+# single server process, and purchases should go through purchase_sweet while
+# it is on. Stock changed elsewhere (restocks) is picked up after each flush.
+#
+# A batch that keeps failing is retried entry by entry, and entries that still
+# cannot commit (their user or sweet was deleted meanwhile) are appended to a
+# .rejected file next to the journal, so they do not hold up the sale.
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'flash_sale'
+FLUSH_ATTEMPTS = 3
+
+PURCHASE_INSERT_SQL = f"""
+    INSERT INTO {Purchase._meta.db_table} (user_id, sweet_id, quantity, total_price, purchase_date)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+_STOP = object()
+
+
+class NotEnoughStock(Exception):
+    def __init__(self, available):
+        super().__init__(f'Not enough stock. Available: {available} kg')
+        self.available = available
+
+
+def read_journal(path):
+    """Entries of a journal file, skipping a last line torn by a crash"""
+    with open(path, encoding='utf-8') as journal:
+        for line in journal:
+            if not line.endswith('\n'):
+                logger.warning('torn journal entry skipped', extra={'journal': str(path)})
+                return
+            yield json.loads(line)
+
+
+def _checkpoint():
+    return LedgerCheckpoint.objects.filter(name=CHECKPOINT_NAME).values_list('sequence', flat=True).first() or 0
+
+
+def apply_entries(entries):
+    """Commit journal entries to sweets, purchases and the sales rollups in one transaction"""
+    sold = defaultdict(int)
+    for entry in entries:
+        sold[entry['sweet_id']] += entry['quantity']
+    # Entries keep the time they were accepted, which auto_now_add would overwrite
+    purchases = [
+        Purchase(
+            user_id=entry['user_id'], sweet=Sweet(id=entry['sweet_id'], category=entry['category']),
+            quantity=entry['quantity'], total_price=Decimal(entry['total_price']),
+            purchase_date=parse_datetime(entry['purchased_at'])
+        )
+        for entry in entries
+        if entry['user_id'] is not None  # anonymous purchases only take stock
+    ]
+    adapt = connection.ops.adapt_datetimefield_value
+    with transaction.atomic():
+        # Stock was checked when each entry was accepted
+        adjust_stock({sweet_id: -quantity for sweet_id, quantity in sold.items()})
+        if purchases:
+            with connection.cursor() as cursor:
+                cursor.executemany(PURCHASE_INSERT_SQL, [
+                    (purchase.user_id, purchase.sweet_id, purchase.quantity, str(purchase.total_price),
+                     adapt(purchase.purchase_date))
+                    for purchase in purchases
+                ])
+            record_sales(purchases)
+        LedgerCheckpoint.objects.update_or_create(name=CHECKPOINT_NAME, defaults={'sequence': entries[-1]['seq']})
+    return sold
+
+
+def reconcile(path, batch_size=500):
+    """Apply the journal entries that never reached the database, then remove the journal.
+
+    Returns how many entries were applied. Only safe while no ledger is writing
+    to the journal.
+    """
+    path = Path(path)
+    if not path.exists():
+        return 0
+    checkpoint = _checkpoint()
+    applied = 0
+    batch = []
+    for entry in read_journal(path):
+        if entry['seq'] <= checkpoint:
+            continue
+        batch.append(entry)
+        if len(batch) == batch_size:
+            apply_entries(batch)
+            applied += len(batch)
+            batch = []
+    if batch:
+        apply_entries(batch)
+        applied += len(batch)
+    path.unlink()
+    if applied:
+        logger.info('flash sale journal reconciled', extra={'entries': applied})
+    return applied
+
+
+class FlashSaleLedger:
+    def __init__(self, journal_path, queue_size=10000, batch_size=500, flush_interval=0.005, fsync=False):
+        self.journal_path = Path(journal_path)
+        self.rejected_path = self.journal_path.with_suffix('.rejected')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.stock = {}                  # sweet_id -> quantity left to sell
+        self.sweets = {}                 # sweet_id -> (name, category, price)
+        self.pending = defaultdict(int)  # sweet_id -> quantity accepted but not committed
+        self.sequence = 0
+        self.journal = None
+        self.thread = None
+        self.accepting = False
+
+    def start(self):
+        """Apply whatever a previous process left in the journal, then start the flusher"""
+        reconcile(self.journal_path, self.batch_size)
+        self.sequence = _checkpoint()
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        self.accepting = True
+        self.thread = threading.Thread(target=self._run, name='flash-sale-flusher', daemon=True)
+        self.thread.start()
+
+    def submit(self, user_id, sweet_id, quantity):
+        """Accept a purchase, journaled and queued; returns (entry, stock left).
+
+        Raises NotEnoughStock, Sweet.DoesNotExist, or Throttled when the queue is full.
+        """
+        with self.lock:
+            if not self.accepting or self.queue.full():
+                raise Throttled(wait=1)
+            if sweet_id not in self.stock:
+                sweet = Sweet.objects.only('id', 'name', 'category', 'price').get(id=sweet_id)
+                self.stock[sweet_id] = stock_levels([sweet_id])[sweet_id]
+                self.sweets[sweet_id] = (sweet.name, sweet.category, sweet.price)
+            available = self.stock[sweet_id]
+            if available < quantity:
+                raise NotEnoughStock(available)
+
+            name, category, price = self.sweets[sweet_id]
+            self.sequence += 1
+            entry = {
+                'seq': self.sequence, 'user_id': user_id, 'sweet_id': sweet_id, 'name': name,
+                'category': category, 'quantity': quantity, 'total_price': str(price * quantity),
+                'purchased_at': timezone.now().isoformat(),
+            }
+            # Journaled before it is acknowledged, so a crash cannot lose it
+            self.journal.write(json.dumps(entry) + '\n')
+            self.journal.flush()
+            if self.fsync:
+                os.fsync(self.journal.fileno())
+            self.stock[sweet_id] = available - quantity
+            self.pending[sweet_id] += quantity
+            self.queue.put_nowait(entry)
+            return entry, available - quantity
+
+    def drain(self, timeout=None):
+        """Stop accepting purchases and wait until everything queued is committed"""
+        with self.lock:
+            if not self.accepting:
+                return
+            self.accepting = False
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+        self.journal.close()
+
+    def _run(self):
+        try:
+            stopping = False
+            while not stopping:
+                entry = self.queue.get()
+                if entry is _STOP:
+                    break
+                batch = [entry]
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        entry = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if entry is _STOP:
+                        stopping = True
+                        break
+                    batch.append(entry)
+                self._flush(batch)
+        finally:
+            connection.close()
+
+    def _apply(self, entries):
+        """apply_entries() with a few retries; None if it keeps failing"""
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            try:
+                return apply_entries(entries)
+            except Exception:
+                logger.exception('flash sale flush failed', extra={'entries': len(entries), 'attempt': attempt})
+                if attempt < FLUSH_ATTEMPTS:
+                    time.sleep(0.01 * 2 ** attempt)
+        return None
+
+    def _reject(self, entry):
+        logger.error('flash sale purchase rejected', extra={'seq': entry['seq'], 'journal': str(self.rejected_path)})
+        with open(self.rejected_path, 'a', encoding='utf-8') as rejected:
+            rejected.write(json.dumps(entry) + '\n')
+
+    def _flush(self, batch):
+        sold = self._apply(batch)
+        rejected = defaultdict(int)
+        if sold is None:
+            # Find the entries that cannot commit and set them aside
+            sold = defaultdict(int)
+            for entry in batch:
+                applied = self._apply([entry])
+                if applied is None:
+                    self._reject(entry)
+                    rejected[entry['sweet_id']] += entry['quantity']
+                    continue
+                for sweet_id, quantity in applied.items():
+                    sold[sweet_id] += quantity
+
+        changed = set(sold) | set(rejected)
+        quantities = stock_levels(list(changed))
+        with self.lock:
+            for sweet_id in changed:
+                self.pending[sweet_id] -= sold.get(sweet_id, 0) + rejected.get(sweet_id, 0)
+                if sweet_id in quantities:
+                    self.stock[sweet_id] = quantities[sweet_id] - self.pending[sweet_id]
+                elif not self.pending[sweet_id]:
+                    # Deleted sweet: the next purchase looks it up again
+                    self.stock.pop(sweet_id, None)
+                    self.sweets.pop(sweet_id, None)
+            if not any(self.pending.values()):
+                # Everything journaled is committed or set aside
+                self.journal.truncate(0)
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    """The process's flash-sale ledger, started (and the journal reconciled) on first use"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = FlashSaleLedger(
+                settings.FLASH_SALE_JOURNAL,
+                queue_size=settings.FLASH_SALE_QUEUE_SIZE,
+                batch_size=settings.FLASH_SALE_BATCH_SIZE,
+                flush_interval=settings.FLASH_SALE_FLUSH_MS / 1000,
+                fsync=settings.FLASH_SALE_JOURNAL_FSYNC,
+            )
+            _ledger.start()
+            atexit.register(_ledger.drain, timeout=10)
+        return _ledger
+
+
+def drain_ledger():
+    """Commit everything queued and stop the ledger; the next purchase starts a new one"""
+    global _ledger
+    with _ledger_lock:
+        ledger, _ledger = _ledger, None
+    if ledger is not None:
+        ledger.drain()
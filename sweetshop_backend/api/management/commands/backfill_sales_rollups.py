@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.analytics import backfill_sales
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollups from the purchase history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Purchases aggregated per transaction')
+
+    def handle(self, *args, **options):
+        processed = 0
+        for processed in backfill_sales(batch_size=options['batch_size']):
+            self.stdout.write(f'Processed {processed} purchases')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully rebuilt sales rollups from {processed} purchases')
+        )
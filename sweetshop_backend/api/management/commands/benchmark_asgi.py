@@ -0,0 +1,128 @@
+import asyncio
+import importlib
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import clear_url_caches
+from api.models import Sweet
+from benchmarks.runner import percentile
+
+def reload_urlconf():
+    """Re-import the URLconf so it picks up the current ASYNC_VIEWS setting"""
+    clear_url_caches()
+    importlib.reload(importlib.import_module('api.urls'))
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+
+class Command(BaseCommand):
+    help = 'Compare WSGI and ASGI throughput and latency of the read endpoints in-process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000, help='Concurrent client connections')
+        parser.add_argument('--requests', type=int, default=20000, help='Requests per run')
+        parser.add_argument('--wsgi-threads', type=int, default=32, help='Worker threads of the WSGI server')
+        parser.add_argument('--path', action='append', dest='paths', help='Path to request (repeatable)')
+
+    def handle(self, *args, **options):
+        paths = options['paths']
+        if not paths:
+            sweet = Sweet.objects.order_by('id').first()
+            if sweet is None:
+                self.stdout.write(self.style.ERROR('No sweets found; seed the database first (create_sample_data)'))
+                return
+            paths = ['/api/sweets/public/', f'/api/sweets/public/{sweet.id}/']
+        connections.close_all()
+
+        runs = [
+            ('WSGI, sync views', False, self.run_wsgi),
+            ('ASGI, sync views', False, self.run_asgi),
+            ('ASGI, async views', True, self.run_asgi),
+        ]
+        self.stdout.write(f"{'server':<20}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for label, async_views, run in runs:
+            with override_settings(ASYNC_VIEWS=async_views):
+                reload_urlconf()
+                latencies, errors, elapsed = asyncio.run(run(paths, options))
+            reload_urlconf()
+            latencies.sort()
+            self.stdout.write(
+                f'{label:<20}{len(latencies) / elapsed:>10.0f}'
+                f'{percentile(latencies, 0.50) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}{errors:>8}'
+            )
+
+    async def drive(self, paths, options, call):
+        """Run --connections clients issuing --requests in total; call(path) returns a status code"""
+        latencies = []
+        errors = 0
+        remaining = iter(range(options['requests']))
+
+        async def client():
+            nonlocal errors
+            for number in remaining:
+                started = time.perf_counter()
+                status = await call(paths[number % len(paths)])
+                latencies.append(time.perf_counter() - started)
+                errors += status >= 400
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['connections'])))
+        return latencies, errors, time.perf_counter() - started
+
+    async def run_wsgi(self, paths, options):
+        application = get_wsgi_application()
+        loop = asyncio.get_running_loop()
+
+        def request(path):
+            statuses = []
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+                'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+                'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+            }
+            response = application(environ, lambda status, headers: statuses.append(int(status[:3])))
+            b''.join(response)
+            response.close()
+            return statuses[0]
+
+        with ThreadPoolExecutor(options['wsgi_threads']) as executor:
+            try:
+                return await self.drive(paths, options, lambda path: loop.run_in_executor(executor, request, path))
+            finally:
+                executor.submit(connections.close_all).result()
+
+    async def run_asgi(self, paths, options):
+        application = get_asgi_application()
+
+        async def request(path):
+            statuses = []
+            disconnected = asyncio.Event()
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+                'headers': [(b'host', b'localhost')], 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+            }
+            await application(scope, receive, send)
+            disconnected.set()
+            return statuses[0]
+
+        return await self.drive(paths, options, request)
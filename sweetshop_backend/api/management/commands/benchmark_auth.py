@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from api.authentication import forget_user
+from api.models import User
+from benchmarks.runner import percentile
+
+class Command(BaseCommand):
+    help = 'Compare queries and latency per request of session and cached JWT authentication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and auth method')
+        parser.add_argument('--path', action='append', dest='paths', help='Authenticated path to request (repeatable)')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/api/auth/profile/', '/api/purchases/']
+
+        # The benchmark user and its session only live inside this transaction
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            user = User.objects.create_user(email='benchmark-auth@example.com', name='Benchmark', password=None)
+            session_client = Client()
+            session_client.force_login(user)
+            token = RefreshToken.for_user(user).access_token
+            jwt_client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+            try:
+                self.stdout.write(f"{'auth':<10}{'path':<32}{'queries/req':>12}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+                for path in paths:
+                    results = {}
+                    for label, client in (('session', session_client), ('jwt', jwt_client)):
+                        results[label] = self.run(client, path, options['requests'])
+                        queries, rate, latencies = results[label]
+                        self.stdout.write(
+                            f'{label:<10}{path:<32}{queries:>12.2f}{rate:>10.0f}'
+                            f'{percentile(latencies, 0.50) * 1000:>10.2f}{percentile(latencies, 0.99) * 1000:>10.2f}'
+                        )
+                    saved = results['session'][0] - results['jwt'][0]
+                    self.stdout.write(self.style.SUCCESS(f'{path}: cached JWT saves {saved:.2f} queries per request'))
+            finally:
+                forget_user(user.id)
+                transaction.set_rollback(True)
+
+    def run(self, client, path, requests):
+        """(queries per request, requests per second, sorted latencies) of GET path"""
+        response = client.get(path)  # warm up caches
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {path} returned {response.status_code}')
+        latencies = []
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(requests):
+                request_started = time.perf_counter()
+                client.get(path)
+                latencies.append(time.perf_counter() - request_started)
+            elapsed = time.perf_counter() - started
+        latencies.sort()
+        return len(queries) / requests, requests / elapsed, latencies
@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from api.hashing import hashing_stats
+from api.models import User
+from benchmarks.runner import percentile
+
+EMAIL = 'benchmark-storm@example.com'
+PASSWORD = 'storm-password-123'
+
+class Command(BaseCommand):
+    help = 'Measure catalog latency while a login storm runs, with inline and pooled password hashing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per phase')
+        parser.add_argument('--catalog-clients', type=int, default=4, help='Threads requesting the catalog')
+        parser.add_argument('--login-clients', type=int, default=32, help='Threads posting logins')
+        parser.add_argument('--path', default='/api/sweets/public/', help='Catalog path to request')
+
+    def handle(self, *args, **options):
+        # Shed logins are expected here; keep the 429 warnings out of the report
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        User.objects.filter(email=EMAIL).delete()
+        user = User.objects.create_user(email=EMAIL, name='Benchmark', password=PASSWORD)
+        phases = [
+            ('idle', {}, 0),
+            ('storm, inline', {'PASSWORD_HASHING_WORKERS': 0}, options['login_clients']),
+            ('storm, pool', {}, options['login_clients']),
+        ]
+        try:
+            self.stdout.write(
+                f"{'phase':<16}{'catalog/s':>10}{'p50 ms':>9}{'p99 ms':>9}"
+                f"{'logins ok':>11}{'429':>7}{'hashed':>8}{'shed':>6}{'throttled':>11}"
+            )
+            for label, overrides, login_clients in phases:
+                with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], **overrides):
+                    before = hashing_stats()
+                    latencies, logins, elapsed = self.run_phase(options, login_clients)
+                    after = hashing_stats()
+                latencies.sort()
+                delta = {name: after[name] - before[name] for name in ('hashed', 'shed', 'throttled')}
+                self.stdout.write(
+                    f'{label:<16}{len(latencies) / elapsed:>10.0f}'
+                    f'{percentile(latencies, 0.50) * 1000:>9.1f}{percentile(latencies, 0.99) * 1000:>9.1f}'
+                    f"{logins[200]:>11}{logins[429]:>7}{delta['hashed']:>8}{delta['shed']:>6}{delta['throttled']:>11}"
+                )
+        finally:
+            user.delete()
+        self.stdout.write(self.style.SUCCESS('Login storm benchmark finished'))
+
+    def run_phase(self, options, login_clients):
+        """Run catalog and login threads for --duration; returns catalog latencies and login statuses"""
+        stop = threading.Event()
+        latencies = []
+        logins = Counter()
+        lock = threading.Lock()
+        addresses = iter(range(1 << 24))
+
+        def catalog_client():
+            client = Client()
+            try:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    client.get(options['path'])
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        def login_client():
+            client = Client()
+            try:
+                while not stop.is_set():
+                    with lock:
+                        number = next(addresses)
+                    # A fresh address per attempt, so the pool bound sheds load, not the per-client rate
+                    address = f'10.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}'
+                    response = client.post(
+                        '/api/auth/login/', {'email': EMAIL, 'password': PASSWORD},
+                        content_type='application/json', REMOTE_ADDR=address
+                    )
+                    with lock:
+                        logins[response.status_code] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=catalog_client) for _ in range(options['catalog_clients'])]
+        threads += [threading.Thread(target=login_client) for _ in range(login_clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return latencies, logins, time.perf_counter() - started
@@ -0,0 +1,58 @@
+import logging
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from benchmarks.runner import run_scenario
+from benchmarks.scenarios import SCENARIOS, Dataset
+from benchmarks.seed import seed
+
+# Django's stock SQLite behaviour: rollback journal, deferred transactions, no retries
+DEFAULT_OPTIONS = {'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 5000,
+                               'cache_size': -2000, 'mmap_size': 0, 'temp_store': 'DEFAULT'}}
+
+class Command(BaseCommand):
+    help = 'Compare mixed read/write throughput with default and tuned SQLite settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Users to seed')
+        parser.add_argument('--sweets', type=int, default=200, help='Sweets to seed')
+        parser.add_argument('--purchases', type=int, default=5000, help='Purchases to seed')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per configuration')
+        parser.add_argument('--write-ratio', type=float, default=0.3, help='Fraction of requests that purchase')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The default database is not SQLite')
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        database = settings.DATABASES['default']
+        tuned_options = database['OPTIONS']
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                user_ids, sweet_ids = seed(options['users'], options['sweets'], options['purchases'])
+                data = Dataset(user_ids, sweet_ids)
+
+                def mixed(rng, data):
+                    name = 'purchase_sweet' if rng.random() < options['write_ratio'] else 'get_sweet_detail'
+                    return SCENARIOS[name](rng, data)
+
+                self.stdout.write(f"{'settings':<10}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+                for label, database_options in (('default', DEFAULT_OPTIONS), ('tuned', tuned_options)):
+                    # Threads of run_scenario open new connections from these settings
+                    database['OPTIONS'] = database_options
+                    connection.close()
+                    result = run_scenario(mixed, data, options['concurrency'], options['duration'])
+                    self.stdout.write(
+                        f"{label:<10}{result['requests']:>9}{result['errors']:>8}{result['req_per_s']:>9.1f}"
+                        f"{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+                    )
+        finally:
+            database['OPTIONS'] = tuned_options
+            connection.close()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
@@ -0,0 +1,51 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from api.inventory import shard_stock
+from benchmarks.runner import run_scenario
+from benchmarks.scenarios import Dataset
+from benchmarks.seed import seed
+
+class Command(BaseCommand):
+    help = 'Measure purchases per second of one hot sweet for several stock shard counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, nargs='+', default=[0, 1, 2, 4, 8],
+                            help='Shard counts to compare (0: stock in the sweet row)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent buyers')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per shard count')
+
+    def handle(self, *args, **options):
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        user_ids, sweet_ids = seed(users=options['concurrency'] * 4, sweets=1, purchases=0)
+        data = Dataset(user_ids, sweet_ids)
+        hot_sweet = sweet_ids[0]
+
+        def purchase_hot_sweet(rng, data):
+            return 'post', f'/api/sweets/{hot_sweet}/purchase/', {
+                'data': {'quantity': 1}, 'content_type': 'application/json',
+                'HTTP_AUTHORIZATION': rng.choice(data.authorizations),
+            }
+
+        self.stdout.write(f"{'shards':>6}{'purchases':>11}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+        for shards in options['shards']:
+            shard_stock(hot_sweet, shards, quantity=10_000_000)
+            connection.close()
+            result = run_scenario(purchase_hot_sweet, data, options['concurrency'], options['duration'])
+            self.stdout.write(
+                f"{shards:>6}{result['requests']:>11}{result['errors']:>8}{result['req_per_s']:>9.1f}"
+                f"{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Benchmarked {len(options['shards'])} shard counts"))
@@ -0,0 +1,33 @@
+from contextlib import nullcontext
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from api.exports import RENDERERS, export_rows
+
+class Command(BaseCommand):
+    help = 'Stream purchases with sweet and user names to a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=date.fromisoformat, help='First day (YYYY-MM-DD), inclusive')
+        parser.add_argument('--to', dest='end', type=date.fromisoformat, help='Last day (YYYY-MM-DD), inclusive')
+        parser.add_argument('--format', choices=sorted(RENDERERS), default='csv', help='Output format')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        if options['start'] and options['end'] and options['start'] > options['end']:
+            raise CommandError('--from cannot be after --to')
+
+        rows = export_rows(options['start'], options['end'], chunk_size=options['chunk_size'])
+        written = -1 if options['format'] == 'csv' else 0  # the CSV header is not a purchase
+        if options['output']:
+            output = open(options['output'], 'w', newline='', encoding='utf-8')
+        else:
+            output = nullcontext(self.stdout)
+        with output as stream:
+            for line in RENDERERS[options['format']](rows):
+                stream.write(line)
+                written += 1
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Exported {written} purchases to {options['output']}"))
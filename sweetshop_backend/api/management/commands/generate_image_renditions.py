@@ -0,0 +1,41 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from api.models import Sweet
+from api.renditions import needs_renditions, render_renditions, store_renditions
+
+class Command(BaseCommand):
+    help = 'Generate thumb/card/full renditions for existing sweet images, in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that already exist')
+
+    def handle(self, *args, **options):
+        sweets = [
+            sweet for sweet in Sweet.objects.exclude(image='').exclude(image=None).only('id', 'image', 'renditions')
+            if options['force'] or needs_renditions(sweet)
+        ]
+        if not sweets:
+            self.stdout.write(self.style.SUCCESS('All sweet images already have renditions'))
+            return
+
+        # Workers only resize and write files; this process records the results
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            futures = {executor.submit(render_renditions, sweet.image.name): sweet for sweet in sweets}
+            for future in as_completed(futures):
+                sweet = futures[future]
+                try:
+                    store_renditions(sweet.id, future.result())
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'Sweet {sweet.id} ({sweet.image.name}): {e}')
+                self.stdout.write(f'{done + failed}/{len(sweets)} images processed')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully generated renditions for {done} images ({failed} failed)')
+        )
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from benchmarks.seed import PASSWORD, seed
+
+class Command(BaseCommand):
+    help = 'Generate users, sweets and skewed purchases at production scale (deterministic per --seed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='Users to generate')
+        parser.add_argument('--sweets', type=int, default=1000, help='Sweets to generate')
+        parser.add_argument('--purchases', type=int, default=1000000, help='Purchases to generate')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Zipf exponent of sweet popularity (0 for uniform, higher for fewer hot sweets)')
+        parser.add_argument('--days', type=int, default=365, help='Spread purchases over this many past days')
+        parser.add_argument('--batch-size', type=int, default=50000, help='Rows inserted per transaction')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        seed(
+            users=options['users'], sweets=options['sweets'], purchases=options['purchases'],
+            seed=options['seed'], skew=options['skew'], days=options['days'], batch_size=options['batch_size'],
+            progress=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {options['users']} users, {options['sweets']} sweets and {options['purchases']} purchases "
+            f"in {time.perf_counter() - started:.1f}s (user password: {PASSWORD})"
+        ))
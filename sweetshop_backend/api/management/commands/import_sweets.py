@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from api.cache import bump_catalog_version
+from api.catalog_import import import_sweets, read_rows
+
+class Command(BaseCommand):
+    help = 'Create or update sweets (matched by name) from a CSV or NDJSON file, streaming it in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or NDJSON file, or - for stdin')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='File format (default: from the extension, csv for stdin)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows upserted per transaction')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format']
+        if file_format is None:
+            file_format = 'ndjson' if Path(path).suffix.lower() in ('.ndjson', '.jsonl') else 'csv'
+
+        if path == '-':
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(path, newline='', encoding='utf-8-sig')
+            except OSError as e:
+                raise CommandError(f'Cannot open {path}: {e}')
+
+        progress = {'rows': 0, 'created': 0, 'updated': 0}
+        failed = 0
+        try:
+            for progress in import_sweets(read_rows(stream, file_format), batch_size=options['batch_size']):
+                for number, message in progress['errors']:
+                    self.stderr.write(f'Row {number}: {message}')
+                failed += len(progress['errors'])
+                self.stdout.write(
+                    f"Processed {progress['rows']} rows: {progress['created']} created, "
+                    f"{progress['updated']} updated, {failed} failed"
+                )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            # Once for the whole import; batches that committed before an error stay visible
+            bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {progress['created'] + progress['updated']} sweets "
+            f"({progress['created']} created, {progress['updated']} updated, {failed} rows failed)"
+        ))
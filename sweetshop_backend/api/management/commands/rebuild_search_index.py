@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from api.search import fts_available, rebuild_search_index
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of sweets'
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            self.stdout.write(self.style.WARNING('Full-text search needs SQLite FTS5; nothing to rebuild'))
+            return
+
+        rebuild_search_index()
+
+        self.stdout.write(
+            self.style.SUCCESS('Successfully rebuilt the sweet search index')
+        )
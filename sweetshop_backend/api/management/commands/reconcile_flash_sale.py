@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.ledger import reconcile
+
+class Command(BaseCommand):
+    help = 'Commit flash-sale purchases left in the journal by a server that stopped before flushing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--journal', default=settings.FLASH_SALE_JOURNAL, help='Journal file')
+        parser.add_argument('--batch-size', type=int, default=500, help='Journal entries committed per transaction')
+
+    def handle(self, *args, **options):
+        applied = reconcile(options['journal'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Committed {applied} purchases from {options['journal']}"))
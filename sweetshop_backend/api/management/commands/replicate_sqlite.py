@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.replicas import copy_to_replicas
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the replica files (a local stand-in for replication)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help='Keep copying, pausing this many seconds between copies, which is the replica lag '
+                                 '(default: copy once)')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured; set SQLITE_REPLICAS to the number of replica files')
+        while True:
+            started = time.perf_counter()
+            aliases = copy_to_replicas()
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(self.style.SUCCESS(f'Copied the primary to {", ".join(aliases)} in {elapsed:.0f} ms'))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,88 @@
+import json
+import logging
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+import benchmarks
+from benchmarks.runner import calibrate, compare, run_scenario
+from benchmarks.scenarios import SCENARIOS, Dataset
+from benchmarks.seed import seed
+
+DEFAULT_BASELINE = Path(benchmarks.__file__).resolve().parent / 'baseline.json'
+SCALE_OPTIONS = ('users', 'sweets', 'purchases', 'concurrency', 'duration')
+
+class Command(BaseCommand):
+    help = 'Load-test the API endpoints on seeded data and compare the results with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Users to seed')
+        parser.add_argument('--sweets', type=int, default=200, help='Sweets to seed')
+        parser.add_argument('--purchases', type=int, default=5000, help='Purchases to seed')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients per scenario')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per scenario')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(SCENARIOS),
+                            help='Scenario to run (repeatable, default all)')
+        parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE, help='Baseline JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed regression as a fraction of the baseline (req/s and p95)')
+        parser.add_argument('--write-baseline', action='store_true', help='Save the results as the new baseline')
+        parser.add_argument('--current-database', action='store_true',
+                            help='Seed the configured database instead of a throwaway test database')
+
+    def handle(self, *args, **options):
+        # Expected 4xx answers should not flood the report
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        # Before the load, while nothing else competes for the CPU
+        calibration_ms = calibrate()
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            if options['current_database']:
+                results = self.run(options)
+            else:
+                old_name = connection.settings_dict['NAME']
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    results = self.run(options)
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        scale = {name: options[name] for name in SCALE_OPTIONS}
+        if options['write_baseline']:
+            baseline = {'scale': scale, 'calibration_ms': calibration_ms, 'results': results}
+            options['baseline'].write_text(json.dumps(baseline, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+
+        if not options['baseline'].exists():
+            raise CommandError(f"No baseline at {options['baseline']}; create one with --write-baseline")
+        baseline = json.loads(options['baseline'].read_text())
+        if baseline['scale'] != scale:
+            self.stdout.write(self.style.WARNING(f"Baseline was recorded at a different scale: {baseline['scale']}"))
+        if 'calibration_ms' in baseline:
+            # Scale the baseline to this machine, so it holds on other hardware
+            speed = baseline['calibration_ms'] / calibration_ms
+            self.stdout.write(f'This machine runs the calibration workload {speed:.2f}x as fast as the baseline machine')
+        else:
+            speed = 1.0
+            self.stdout.write(self.style.WARNING('Baseline has no calibration; comparing raw numbers'))
+        regressions = compare(results, baseline['results'], options['tolerance'], speed)
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def run(self, options):
+        user_ids, sweet_ids = seed(options['users'], options['sweets'], options['purchases'])
+        data = Dataset(user_ids, sweet_ids)
+        connection.close()
+
+        results = {}
+        self.stdout.write(f"{'scenario':<18}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for name in options['scenarios'] or SCENARIOS:
+            result = results[name] = run_scenario(SCENARIOS[name], data, options['concurrency'], options['duration'])
+            self.stdout.write(
+                f"{name:<18}{result['requests']:>9}{result['errors']:>8}{result['req_per_s']:>9.1f}"
+                f"{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+            )
+        return results
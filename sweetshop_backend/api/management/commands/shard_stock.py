@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.inventory import shard_stock
+from api.models import Sweet
+
+class Command(BaseCommand):
+    help = "Split a hot sweet's stock over several counter rows, or merge it back with --shards 0"
+
+    def add_arguments(self, parser):
+        parser.add_argument('sweet_id', type=int, help='Sweet to (un)shard')
+        parser.add_argument('--shards', type=int, required=True, help='Number of stock shards (0 to unshard)')
+        parser.add_argument('--quantity', type=int, help='New total stock (default: keep the current stock)')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['shards'] <= 256:
+            raise CommandError('--shards must be between 0 and 256')
+        try:
+            quantity = shard_stock(options['sweet_id'], options['shards'], options['quantity'])
+        except Sweet.DoesNotExist:
+            raise CommandError(f"Sweet {options['sweet_id']} does not exist")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sweet {options['sweet_id']}: {quantity} in stock over {options['shards']} shards"
+        ))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from api.reservations import sweep_reservations
+
+class Command(BaseCommand):
+    help = 'Return the stock of expired cart reservations, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Reservations released per transaction')
+        parser.add_argument('--every', type=float, default=0,
+                            help='Keep sweeping, pausing this many seconds between sweeps (default: sweep once)')
+
+    def handle(self, *args, **options):
+        while True:
+            released = 0
+            for released in sweep_reservations(batch_size=options['batch_size']):
+                pass
+            self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservations'))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,174 @@
+"""In-process request metrics, exported in the Prometheus text format.
+
+MetricsMiddleware records every request under its URL route pattern (not the
+raw path, which would explode the number of series): a latency histogram, a
+count per status code, and a histogram of the time spent in database queries.
+Recording is a few dict updates under a lock, cheap enough to stay on in
+production. Each process keeps its own numbers; Prometheus sums the workers.
+
+metrics_view only answers scrapes that send METRICS_TOKEN as a bearer token.
+"""
+import hmac
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .hashing import hashing_stats
+from .idempotency import idempotency_stats
+from .profiling import QueryRecorder, recording_queries
+
+# Upper bounds in seconds, as in the Prometheus client defaults
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}   # (route, method) -> Histogram
+            self.db_time = {}   # (route, method) -> Histogram
+            self.requests = {}  # (route, method, status) -> count
+
+    def record(self, route, method, status, seconds, db_seconds=None):
+        with self._lock:
+            key = (route, method)
+            if key not in self.latency:
+                self.latency[key] = Histogram()
+            self.latency[key].observe(seconds)
+            if db_seconds is not None:
+                if key not in self.db_time:
+                    self.db_time[key] = Histogram()
+                self.db_time[key].observe(db_seconds)
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            latency = {key: (list(h.counts), h.sum) for key, h in self.latency.items()}
+            db_time = {key: (list(h.counts), h.sum) for key, h in self.db_time.items()}
+            requests = dict(self.requests)
+
+        lines = [
+            '# HELP sweetshop_http_requests_total Requests handled, by route, method and status code.',
+            '# TYPE sweetshop_http_requests_total counter',
+        ]
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append(f'sweetshop_http_requests_total{{{_labels(route, method)},status="{status}"}} {count}')
+        lines += _render_histogram(
+            'sweetshop_http_request_duration_seconds', 'Time to produce a response, by route and method.', latency
+        )
+        lines += _render_histogram(
+            'sweetshop_http_request_db_duration_seconds', 'Time spent in database queries per request.', db_time
+        )
+
+        stats = hashing_stats()
+        for name, key, help_text in (
+            ('password_hashes', 'hashed', 'Passwords hashed or checked on the hashing pool.'),
+            ('password_attempts_shed', 'shed', 'Login and registration attempts rejected because the pool was full.'),
+            ('password_attempts_throttled', 'throttled', 'Login and registration attempts over the per-client rate.'),
+        ):
+            lines += [
+                f'# HELP sweetshop_{name}_total {help_text}',
+                f'# TYPE sweetshop_{name}_total counter',
+                f'sweetshop_{name}_total {stats[key]}',
+            ]
+
+        stats = idempotency_stats()
+        lines += [
+            '# HELP sweetshop_idempotent_requests_total Requests with an Idempotency-Key, by outcome.',
+            '# TYPE sweetshop_idempotent_requests_total counter',
+        ]
+        for outcome in ('executed', 'replayed', 'coalesced', 'conflicts'):
+            lines.append(f'sweetshop_idempotent_requests_total{{outcome="{outcome}"}} {stats[outcome]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(route, method):
+    return f'route="{_escape(route)}",method="{method}"'
+
+
+def _render_histogram(name, help_text, histograms):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for (route, method), (counts, total) in sorted(histograms.items()):
+        labels = _labels(route, method)
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, '+Inf'), counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {total}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+    return lines
+
+
+REGISTRY = Registry()
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Records latency, status code and DB time of every request in REGISTRY.
+
+    Database time is only recorded for requests served synchronously: async
+    views run their queries on another thread, out of reach of the wrapper.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with recording_queries(recorder):
+            response = self.get_response(request)
+        REGISTRY.record(_route(request), request.method, response.status_code, time.perf_counter() - started, recorder.seconds)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        REGISTRY.record(_route(request), request.method, response.status_code, time.perf_counter() - started)
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint"""
+    token = settings.METRICS_TOKEN
+    given = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not token or not hmac.compare_digest(given.encode(), token.encode()):
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_remove_purchase_delivery_address_and_more'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['user', '-purchase_date', 'id'], name='purchases_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['-purchase_date', 'id'], name='purchases_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sweet',
+            index=models.Index(fields=['name'], name='sweets_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sweet',
+            index=models.Index(fields=['category', 'created_at'], name='sweets_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sweet',
+            index=models.Index(fields=['created_at', 'id'], name='sweets_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['created_at', 'id'], name='users_created_idx'),
+        ),
+    ]
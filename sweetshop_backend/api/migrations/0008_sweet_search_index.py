@@ -0,0 +1,65 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:40
+
+from django.db import migrations
+
+# FTS5 index over sweets, kept in sync by triggers so every write path
+# (save(), update(), bulk_create(), raw SQL) maintains it incrementally.
+# The update trigger only fires for the indexed columns, so stock changes
+# in purchase_sweet do not touch the index.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS sweets_fts USING fts5(
+        name, description, category,
+        content='sweets', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS sweets_fts_insert AFTER INSERT ON sweets BEGIN
+        INSERT INTO sweets_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS sweets_fts_delete AFTER DELETE ON sweets BEGIN
+        INSERT INTO sweets_fts(sweets_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS sweets_fts_update AFTER UPDATE OF name, description, category ON sweets BEGIN
+        INSERT INTO sweets_fts(sweets_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+        INSERT INTO sweets_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END
+    """,
+    "INSERT INTO sweets_fts(sweets_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS sweets_fts_update',
+    'DROP TRIGGER IF EXISTS sweets_fts_delete',
+    'DROP TRIGGER IF EXISTS sweets_fts_insert',
+    'DROP TABLE IF EXISTS sweets_fts',
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_purchase_purchases_user_date_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_SQL), run_on_sqlite(DROP_SQL)),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_sweet_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorySalesDaily',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('category', models.CharField(blank=True, default='', max_length=50)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('purchases', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'sales_daily_category',
+                'constraints': [models.UniqueConstraint(fields=('day', 'category'), name='sales_daily_category_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SweetSalesDaily',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('purchases', models.IntegerField(default=0)),
+                ('sweet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='api.sweet')),
+            ],
+            options={
+                'db_table': 'sales_daily_sweet',
+                'constraints': [models.UniqueConstraint(fields=('day', 'sweet'), name='sales_daily_sweet_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+# Adding a NOT NULL column makes SQLite rebuild the sweets table, which drops
+# the search index triggers of migration 0008. Recreate them and rebuild the
+# index, since writes made meanwhile were not indexed.
+RESTORE_SEARCH_TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS sweets_fts_insert AFTER INSERT ON sweets BEGIN
+        INSERT INTO sweets_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS sweets_fts_delete AFTER DELETE ON sweets BEGIN
+        INSERT INTO sweets_fts(sweets_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS sweets_fts_update AFTER UPDATE OF name, description, category ON sweets BEGIN
+        INSERT INTO sweets_fts(sweets_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+        INSERT INTO sweets_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END
+    """,
+    "INSERT INTO sweets_fts(sweets_fts) VALUES ('rebuild')",
+]
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in RESTORE_SEARCH_TRIGGERS_SQL:
+        schema_editor.execute(statement)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_categorysalesdaily_sweetsalesdaily'),
+    ]
+
+    operations = [
+        # Unapplying the AddField rebuilds the table again; this runs after it
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='sweet',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_sweet_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sweet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='api.sweet')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'reservations',
+                'ordering': ['expires_at'],
+                'indexes': [models.Index(fields=['expires_at'], name='reservations_expires_idx'), models.Index(fields=['user', 'expires_at'], name='reservations_user_idx')],
+            },
+        ),
+    ]
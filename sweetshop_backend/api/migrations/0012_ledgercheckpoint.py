@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('sequence', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'ledger_checkpoints',
+            },
+        ),
+    ]
@@ -58,6 +58,10 @@ class User(AbstractUser):
     
     class Meta:
         db_table = 'users'
+        indexes = [
+            # Cursor pagination and admin ordering
+            models.Index(fields=['created_at', 'id'], name='users_created_idx'),
+        ]
     
     def get_username(self):
         return self.email
@@ -70,6 +74,12 @@ class Sweet(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.IntegerField(default=0)
     image = models.ImageField(upload_to='sweets/', blank=True, null=True)
+    # Resized copies of image, filled in by api.renditions off the request thread:
+    # {"source": <image name>, "thumb": {"webp": <name>, "fallback": <name>}, "card": ..., "full": ...}
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # 0: the stock is in quantity. Otherwise it is split over this many StockShard
+    # rows and quantity is their sum, refreshed by api.inventory shortly after changes.
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -78,6 +88,20 @@ class Sweet(models.Model):
     
     class Meta:
         db_table = 'sweets'
+        indexes = [
+            models.Index(fields=['name'], name='sweets_name_idx'),
+            # Admin category filter ordered by -created_at
+            models.Index(fields=['category', 'created_at'], name='sweets_category_created_idx'),
+            # Cursor pagination and admin ordering
+            models.Index(fields=['created_at', 'id'], name='sweets_created_idx'),
+        ]
+
+class PurchaseQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Only what PurchaseSerializer reads, with the user and sweet names joined in"""
+        return self.select_related('user', 'sweet').only(
+            'id', 'quantity', 'total_price', 'purchase_date', 'user__name', 'sweet__name'
+        )
 
 class Purchase(models.Model):
     id = models.AutoField(primary_key=True)
@@ -87,9 +111,113 @@ class Purchase(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     purchase_date = models.DateTimeField(auto_now_add=True)
     
+    objects = PurchaseQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.user.name} - {self.sweet.name} ({self.quantity})"
     
     class Meta:
         db_table = 'purchases'
         ordering = ['-purchase_date']
+        indexes = [
+            # A user's history, newest first (get_user_purchases, PurchaseViewSet)
+            models.Index(fields=['user', '-purchase_date', 'id'], name='purchases_user_date_idx'),
+            # All purchases newest first (admin, PurchaseViewSet for admins)
+            models.Index(fields=['-purchase_date', 'id'], name='purchases_date_idx'),
+        ]
+
+class StockShard(models.Model):
+    """Part of a hot sweet's stock, so concurrent purchases update different rows"""
+    id = models.AutoField(primary_key=True)
+    sweet = models.ForeignKey(Sweet, on_delete=models.CASCADE, related_name='shards')
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.sweet_id}/{self.shard}: {self.quantity}"
+    
+    class Meta:
+        db_table = 'stock_shards'
+        constraints = [
+            models.UniqueConstraint(fields=['sweet', 'shard'], name='stock_shards_unique'),
+        ]
+
+class Reservation(models.Model):
+    """Stock held for a customer's cart until expires_at.
+
+    The held quantity is taken out of Sweet.quantity when the reservation is
+    made, so the catalog always shows what is left to sell. Buying the cart
+    turns reservations into purchases; releasing or expiring them gives the
+    stock back (api.reservations).
+    """
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservations')
+    sweet = models.ForeignKey(Sweet, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.IntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.sweet_id} ({self.quantity}) until {self.expires_at}"
+    
+    class Meta:
+        db_table = 'reservations'
+        ordering = ['expires_at']
+        indexes = [
+            # The sweeper reads the oldest expired reservations first
+            models.Index(fields=['expires_at'], name='reservations_expires_idx'),
+            # A user's cart
+            models.Index(fields=['user', 'expires_at'], name='reservations_user_idx'),
+        ]
+
+class LedgerCheckpoint(models.Model):
+    """Last journal entry of a write-behind ledger that is in the database.
+
+    Updated in the transaction that commits the entries, so after a crash the
+    journal can be replayed from here without applying anything twice.
+    """
+    id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=50, unique=True)
+    sequence = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.sequence}"
+    
+    class Meta:
+        db_table = 'ledger_checkpoints'
+
+class SweetSalesDaily(models.Model):
+    """Revenue and quantity sold per (day, sweet), maintained with each purchase"""
+    id = models.AutoField(primary_key=True)
+    day = models.DateField()
+    sweet = models.ForeignKey(Sweet, on_delete=models.CASCADE, related_name='daily_sales')
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    purchases = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.day} - {self.sweet_id}: {self.revenue}"
+    
+    class Meta:
+        db_table = 'sales_daily_sweet'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'sweet'], name='sales_daily_sweet_unique'),
+        ]
+
+class CategorySalesDaily(models.Model):
+    """Revenue and quantity sold per (day, category), maintained with each purchase"""
+    id = models.AutoField(primary_key=True)
+    day = models.DateField()
+    category = models.CharField(max_length=50, blank=True, default='')
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    purchases = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.day} - {self.category}: {self.revenue}"
+    
+    class Meta:
+        db_table = 'sales_daily_category'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='sales_daily_category_unique'),
+        ]
@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination
+
+
+def cursor_requested(request):
+    """Whether a list endpoint that is unpaginated by default was asked for a page"""
+    return 'cursor' in request.GET or 'page_size' in request.GET
+
+
+class PurchaseCursorPagination(CursorPagination):
+    """Keyset pagination for purchases, newest first"""
+    ordering = ('-purchase_date', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """Keyset pagination for sweets and users, oldest first"""
+    ordering = ('created_at', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
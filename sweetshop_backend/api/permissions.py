@@ -0,0 +1,9 @@
+from rest_framework.permissions import BasePermission
+
+
+class IsShopAdmin(BasePermission):
+    """Users with the admin role, or Django staff"""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (user.role == 'admin' or user.is_staff))
@@ -0,0 +1,83 @@
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """connection.execute_wrapper() that counts queries and adds up their time.
+
+    Also keeps queries slower than slow_ms, when given.
+    """
+
+    def __init__(self, slow_ms=None):
+        self.slow_ms = slow_ms
+        self.count = 0
+        self.seconds = 0.0
+        self.slow = []  # (seconds, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.seconds += duration
+            if self.slow_ms is not None and duration * 1000 >= self.slow_ms:
+                self.slow.append((duration, sql))
+
+
+@contextmanager
+def recording_queries(recorder):
+    """Run recorder around the queries of every database connection of this thread"""
+    with ExitStack() as stack:
+        for alias in settings.DATABASES:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
+
+
+class QueryProfilingMiddleware:
+    """Counts queries and DB time of a sample of requests.
+
+    Sampled responses get a Server-Timing header (shown in the browser's
+    network panel), and each query slower than SQL_SLOW_QUERY_MS is logged to
+    api.profiling with its SQL and view. Off unless SQL_PROFILING_SAMPLE_RATE
+    is above 0. Queries run while a streaming response is consumed, or by
+    async views, are not seen.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SQL_PROFILING_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SQL_PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        recorder = QueryRecorder(slow_ms=settings.SQL_SLOW_QUERY_MS)
+        started = time.perf_counter()
+        with recording_queries(recorder):
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        timings = f'db;desc="{recorder.count} queries";dur={recorder.seconds * 1000:.2f}, total;dur={total * 1000:.2f}'
+        if response.has_header('Server-Timing'):
+            timings = f"{response['Server-Timing']}, {timings}"
+        response['Server-Timing'] = timings
+
+        if recorder.slow:
+            match = getattr(request, 'resolver_match', None)
+            view = (match.view_name or match._func_path) if match is not None else None
+            for duration, sql in recorder.slow:
+                logger.warning('slow query', extra={
+                    'view': view, 'path': request.path, 'duration_ms': round(duration * 1000, 2), 'sql': sql,
+                })
+        return response
@@ -0,0 +1,132 @@
+import atexit
+import hashlib
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, ImageOps
+
+from .cache import bump_catalog_version
+from .models import Sweet
+
+logger = logging.getLogger(__name__)
+
+# name: (width, height, crop). Cropped renditions fill the box exactly (the admin
+# preview is square), the others are scaled down to fit inside it.
+RENDITION_SIZES = {
+    'thumb': (100, 100, True),
+    'card': (400, 400, False),
+    'full': (1200, 1200, False),
+}
+
+RENDITION_DIR = 'sweets/renditions'
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_RENDITION_WORKERS, thread_name_prefix='renditions'
+        )
+        atexit.register(_executor.shutdown, wait=False)
+    return _executor
+
+
+def render_renditions(image_name):
+    """Write every rendition of a stored image and return their storage names.
+
+    Touches only the storage, never the database, so it can run in a worker
+    process (see the generate_image_renditions command).
+    """
+    with default_storage.open(image_name) as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    # The source's storage name is unique, so its hash keeps images that share
+    # a file stem (Barfi.jpg and Barfi.webp, or other upload dirs) apart
+    stem = posixpath.splitext(posixpath.basename(image_name))[0]
+    stem = f'{stem}_{hashlib.sha1(image_name.encode()).hexdigest()[:10]}'
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    fallback_format, fallback_ext = ('PNG', 'png') if has_alpha else ('JPEG', 'jpg')
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    renditions = {'source': image_name}
+    for size_name, (width, height, crop) in RENDITION_SIZES.items():
+        if crop:
+            resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail((width, height), Image.LANCZOS)
+
+        renditions[size_name] = {}
+        for key, image_format, ext, options in (
+            ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+            ('fallback', fallback_format, fallback_ext, {'quality': 85, 'optimize': True}),
+        ):
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+            name = f'{RENDITION_DIR}/{stem}_{size_name}.{ext}'
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            renditions[size_name][key] = default_storage.save(name, ContentFile(buffer.getvalue()))
+    return renditions
+
+
+def store_renditions(sweet_id, renditions):
+    """Attach renditions to a sweet unless its image changed in the meantime"""
+    updated = Sweet.objects.filter(id=sweet_id, image=renditions['source']).update(renditions=renditions)
+    if updated:
+        # update() skips post_save, so invalidate the catalog explicitly
+        bump_catalog_version()
+    return bool(updated)
+
+
+def generate_renditions(sweet_id):
+    """Render and store the renditions of one sweet's current image"""
+    try:
+        image_name = Sweet.objects.filter(id=sweet_id).values_list('image', flat=True).first()
+        if image_name:
+            store_renditions(sweet_id, render_renditions(image_name))
+    except Exception:
+        logger.exception('Could not generate image renditions for sweet %s', sweet_id)
+
+
+def _generate_on_worker(sweet_id):
+    try:
+        generate_renditions(sweet_id)
+    finally:
+        connection.close()
+
+
+def schedule_renditions(sweet_id):
+    """Generate renditions on the worker pool, or inline when IMAGE_RENDITION_WORKERS is 0"""
+    if settings.IMAGE_RENDITION_WORKERS:
+        return _get_executor().submit(_generate_on_worker, sweet_id)
+    generate_renditions(sweet_id)
+
+
+def needs_renditions(sweet):
+    return bool(sweet.image) and sweet.renditions.get('source') != sweet.image.name
+
+
+def rendition_urls(sweet, request=None):
+    """{size: {"webp": url, "fallback": url}}, absolute when given a request, or {} until they exist"""
+    if not sweet.image or sweet.renditions.get('source') != sweet.image.name:
+        return {}
+    build_url = request.build_absolute_uri if request is not None else str
+    return {
+        size_name: {
+            key: build_url(default_storage.url(name))
+            for key, name in sweet.renditions[size_name].items()
+        }
+        for size_name in RENDITION_SIZES
+        if size_name in sweet.renditions
+    }
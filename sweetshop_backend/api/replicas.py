@@ -0,0 +1,180 @@
+"""Read replicas with read-your-writes.
+
+ReplicaRouter sends reads to a random alias of DATABASE_REPLICAS, but only
+inside views marked with @replica_reads (catalog and purchase history), and
+only for clients that have not written recently: ReplicaPinMiddleware notes
+every write a request makes and pins the client to the primary for
+REPLICA_PIN_SECONDS afterwards, through a cookie and, for signed-in users,
+the cache. Everything else reads and writes the primary ('default').
+
+Locally, SQLite files stand in for replicas: copy_to_replicas() (the
+replicate_sqlite command) refreshes them from the primary.
+"""
+import contextlib
+import contextvars
+import functools
+import random
+import sqlite3
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import LazyObject, empty
+
+PIN_COOKIE = 'pin_primary'
+
+_state = contextvars.ContextVar('replica_routing', default=None)
+
+
+class _RequestState:
+    __slots__ = ('use_replica', 'wrote')
+
+    def __init__(self):
+        self.use_replica = False
+        self.wrote = False
+
+
+def _user_pin_key(user_id):
+    return f'replica-pin:user:{user_id}'
+
+
+def is_pinned(request):
+    """True if the client wrote within the last REPLICA_PIN_SECONDS"""
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated and cache.get(_user_pin_key(user.pk)))
+
+
+def reading_replica():
+    """True while reads of the current request may go to a replica"""
+    state = _state.get()
+    return bool(state is not None and state.use_replica and not state.wrote)
+
+
+@contextlib.contextmanager
+def _replica_reads(allowed):
+    state = _state.get()
+    token = None
+    if state is None:
+        token = _state.set(state := _RequestState())
+    state.use_replica = bool(settings.DATABASE_REPLICAS) and allowed
+    try:
+        yield
+    finally:
+        state.use_replica = False
+        if token is not None:
+            _state.reset(token)
+
+
+def replica_reads(view):
+    """Let the view's reads go to a replica, unless the client is pinned to the primary.
+
+    Goes below @api_view (or through method_decorator), so the user is authenticated.
+    Async views authenticate inside the view, so only the cookie pins them.
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with _replica_reads(PIN_COOKIE not in request.COOKIES):
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with _replica_reads(not is_pinned(request)):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not reading_replica():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads inside a transaction must see its writes
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPinMiddleware:
+    """Tracks writes per request and pins clients that wrote to the primary for a while"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = _RequestState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        # DRF authenticates inside the view and copies the user onto the Django request
+        return self._pin(response, state, getattr(request, 'user', None))
+
+    async def __acall__(self, request):
+        # Sync views and ORM calls run in a copy of this context, which shares the state object
+        state = _RequestState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        user = getattr(request, 'user', None)
+        if isinstance(user, LazyObject) and user._wrapped is empty:
+            # The session user nobody asked for; loading it here would block the event loop
+            user = None
+        return self._pin(response, state, user)
+
+    def _pin(self, response, state, user):
+        if state.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+            if user is not None and user.is_authenticated:
+                cache.set(_user_pin_key(user.pk), 1, timeout=settings.REPLICA_PIN_SECONDS)
+        return response
+
+
+def copy_to_replicas(aliases=None):
+    """Copy the primary SQLite database into each replica file with the online backup API.
+
+    Stands in for replication when developing locally. The copy is a
+    consistent snapshot even while the primary is being written.
+    """
+    aliases = settings.DATABASE_REPLICAS if aliases is None else aliases
+    source = sqlite3.connect(connections[DEFAULT_DB_ALIAS].settings_dict['NAME'])
+    try:
+        for alias in aliases:
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+    finally:
+        source.close()
+    return list(aliases)
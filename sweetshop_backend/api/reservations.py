@@ -0,0 +1,114 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .analytics import record_sales
+from .cache import invalidate_catalog
+from .inventory import adjust_stock, take_stock
+from .models import Purchase, Reservation
+
+# Held stock lives outside Sweet.quantity: reserving moves it from the sweet
+# into a Reservation row, and releasing or expiring moves it back. Catalog
+# reads therefore never look at reservations, and purchases of a reserved
+# cart cannot fail for lack of stock.
+
+
+def _return_stock(rows):
+    """Add (sweet_id, quantity) rows back to their sweets, with one UPDATE for unsharded ones"""
+    returned = defaultdict(int)
+    for sweet_id, quantity in rows:
+        returned[sweet_id] += quantity
+    adjust_stock(returned)
+
+
+def reserve(user, sweet_id, quantity, now=None):
+    """Hold quantity of a sweet for the user's cart; None if there is not enough stock"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        if not take_stock(sweet_id, quantity):
+            # Holds that expired since the last sweep may be all that is in the way
+            if not release_expired(sweet_id=sweet_id, now=now) or not take_stock(sweet_id, quantity):
+                return None
+        invalidate_catalog()
+        return Reservation.objects.create(
+            user=user, sweet_id=sweet_id, quantity=quantity,
+            expires_at=now + timedelta(seconds=settings.RESERVATION_TTL_SECONDS)
+        )
+
+
+def release(user, reservation_id):
+    """Give a reservation's stock back; False if the user has no such reservation"""
+    with transaction.atomic():
+        row = Reservation.objects.select_for_update().filter(id=reservation_id, user=user).values_list(
+            'sweet_id', 'quantity'
+        ).first()
+        if row is None:
+            return False
+        Reservation.objects.filter(id=reservation_id).delete()
+        _return_stock([row])
+    return True
+
+
+def checkout_cart(user, now=None):
+    """Turn the user's unexpired reservations into purchases, all in one transaction.
+
+    The stock was taken when each reservation was made, so this only writes
+    purchases and sales rollups. Expired reservations are left to the sweeper.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        held = list(
+            Reservation.objects.select_for_update(of=('self',)).filter(user=user, expires_at__gt=now)
+            .select_related('sweet').only('id', 'quantity', 'sweet__id', 'sweet__name', 'sweet__category', 'sweet__price')
+        )
+        if not held:
+            return []
+        Reservation.objects.filter(id__in=[reservation.id for reservation in held]).delete()
+        purchases = Purchase.objects.bulk_create([
+            Purchase(
+                user=user,
+                sweet=reservation.sweet,
+                quantity=reservation.quantity,
+                total_price=reservation.sweet.price * reservation.quantity
+            )
+            for reservation in held
+        ])
+        # bulk_create sends no post_save, so update the sales rollups here
+        record_sales(purchases)
+    return purchases
+
+
+def release_expired(batch_size=500, now=None, sweet_id=None):
+    """Release one batch of expired reservations, oldest first; returns how many.
+
+    The batch is read, deleted and its stock returned in one transaction.
+    Concurrent sweepers skip each other's rows where the database can lock them.
+    """
+    now = now or timezone.now()
+    expired = Reservation.objects.filter(expires_at__lte=now)
+    if sweet_id is not None:
+        expired = expired.filter(sweet_id=sweet_id)
+    with transaction.atomic():
+        rows = list(
+            expired.select_for_update(skip_locked=True).order_by('expires_at')
+            .values_list('id', 'sweet_id', 'quantity')[:batch_size]
+        )
+        if rows:
+            Reservation.objects.filter(id__in=[row[0] for row in rows]).delete()
+            _return_stock(row[1:] for row in rows)
+    return len(rows)
+
+
+def sweep_reservations(batch_size=500, now=None):
+    """Release every expired reservation batch by batch, yielding the running count"""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        count = release_expired(batch_size, now)
+        released += count
+        yield released
+        if count < batch_size:
+            return
@@ -0,0 +1,55 @@
+import re
+
+from django.db import connection
+
+from .models import Sweet
+
+# Sweets are indexed in the sweets_fts FTS5 table (created by migration 0008),
+# which triggers keep in sync on every write path (save(), update(),
+# bulk_create(), raw SQL). The update trigger only fires for the indexed
+# columns, so stock changes do not touch the index. SQLite drops the triggers
+# when a migration rebuilds the sweets table, so those migrations (0010, 0013)
+# recreate them. Other databases fall back to a plain LIKE search so the
+# endpoint keeps working, just without ranking.
+SEARCH_TABLE = 'sweets_fts'
+
+REBUILD_SQL = f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"
+
+# bm25 column weights: name, description, category
+RANK = f'bm25({SEARCH_TABLE}, 10.0, 1.0, 5.0)'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query that prefix-matches every word"""
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(text))
+
+
+def match_sweets(text, limit=20):
+    """Sweets matching text, best match first"""
+    match = build_match_query(text)
+    if not match:
+        return []
+    if not fts_available():
+        return list(Sweet.objects.filter(name__icontains=text)[:limit])
+    return list(Sweet.objects.raw(
+        f'SELECT sweets.* FROM {SEARCH_TABLE} '
+        f'JOIN sweets ON sweets.id = {SEARCH_TABLE}.rowid '
+        f'WHERE {SEARCH_TABLE} MATCH %s ORDER BY {RANK} LIMIT %s',
+        [match, limit]
+    ))
+
+
+def rebuild_search_index():
+    """Rebuild the whole index from the sweets table"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(REBUILD_SQL)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+
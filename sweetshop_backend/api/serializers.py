@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import User, Sweet, Purchase
+from .hashing import hash_password
+from .models import User, Sweet, Purchase, Reservation
+from .renditions import rendition_urls
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -17,26 +19,32 @@ class UserCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         password = validated_data.pop('password')
-        user = User.objects.create_user(
-            email=validated_data['email'],
+        user = User(
+            email=User.objects.normalize_email(validated_data['email']),
             name=validated_data['name'],
-            password=password,
             role=validated_data.get('role', 'customer')
         )
+        # Hash on the bounded hashing pool instead of in create_user()
+        user.password = hash_password(password)
+        user.save()
         return user
 
 class SweetSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    image_renditions = serializers.SerializerMethodField()
     
     class Meta:
         model = Sweet
-        fields = ['id', 'name', 'description', 'category', 'price', 'quantity', 'image', 'created_at']
+        fields = ['id', 'name', 'description', 'category', 'price', 'quantity', 'image', 'image_url', 'image_renditions', 'created_at']
         read_only_fields = ['id', 'created_at']
     
     def get_image_url(self, obj):
         if obj.image:
             return self.context['request'].build_absolute_uri(obj.image.url)
         return None
+    
+    def get_image_renditions(self, obj):
+        return rendition_urls(obj, self.context.get('request'))
 
 class SweetCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -57,4 +65,53 @@ class PurchaseCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Purchase
         fields = ['id', 'user', 'sweet', 'quantity', 'total_price']
-        read_only_fields = ['id'] 
\ No newline at end of file
+        read_only_fields = ['id'] 
+
+class ReservationSerializer(serializers.ModelSerializer):
+    sweet_name = serializers.CharField(source='sweet.name', read_only=True)
+    
+    class Meta:
+        model = Reservation
+        fields = ['id', 'sweet', 'sweet_name', 'quantity', 'expires_at', 'created_at']
+        read_only_fields = fields
+
+class ReservationCreateSerializer(serializers.Serializer):
+    sweet_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class SweetImportSerializer(serializers.Serializer):
+    """One row of an import_sweets file; name is the natural key"""
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    category = serializers.CharField(max_length=50, required=False, allow_blank=True, allow_null=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+class CheckoutItemSerializer(serializers.Serializer):
+    sweet_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class CheckoutSerializer(serializers.Serializer):
+    items = CheckoutItemSerializer(many=True, allow_empty=False, max_length=100)
+
+class DateRangeQuerySerializer(serializers.Serializer):
+    """Optional, inclusive ?from=&to= dates"""
+    to = serializers.DateField(required=False)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # "from" is a keyword, so it cannot be declared as a class attribute
+        fields['from'] = serializers.DateField(required=False)
+        return fields
+
+    def validate(self, attrs):
+        if 'from' in attrs and 'to' in attrs and attrs['from'] > attrs['to']:
+            raise serializers.ValidationError('from cannot be after to')
+        return attrs
+
+class SalesReportQuerySerializer(DateRangeQuerySerializer):
+    group_by = serializers.ChoiceField(choices=['day', 'sweet', 'category'], default='day')
+
+class PurchaseExportQuerySerializer(DateRangeQuerySerializer):
+    # Not "format", which DRF reserves for picking a renderer
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
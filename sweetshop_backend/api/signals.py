@@ -0,0 +1,56 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .analytics import record_sales
+from .authentication import invalidate_user
+from .cache import invalidate_catalog
+from .models import Purchase, Sweet, User
+from .renditions import needs_renditions, schedule_renditions
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Sweet)
+@receiver(post_delete, sender=Sweet)
+def sweet_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=Sweet)
+def sweet_saved(sender, instance, raw=False, **kwargs):
+    # Resize new uploads on the rendition worker pool once the row is committed
+    if not raw and needs_renditions(instance):
+        transaction.on_commit(lambda: schedule_renditions(instance.pk))
+
+
+# Sales rollups follow every purchase written through the ORM. bulk_create()
+# sends no signals, so callers that use it call record_sales() themselves.
+
+@receiver(pre_save, sender=Purchase)
+def purchase_changing(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    previous = Purchase.objects.select_related('sweet').filter(pk=instance.pk).first()
+    if previous is not None:
+        record_sales([previous], sign=-1)
+
+
+@receiver(post_save, sender=Purchase)
+def purchase_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_sales([instance])
+
+
+@receiver(post_delete, sender=Purchase)
+def purchase_deleted(sender, instance, origin=None, **kwargs):
+    # Purchases cascading from a deleted user still count as sales, and a
+    # deleted sweet takes its own rollup rows with it
+    if isinstance(origin, Purchase) or (isinstance(origin, QuerySet) and origin.model is Purchase):
+        record_sales([instance], sign=-1)
+
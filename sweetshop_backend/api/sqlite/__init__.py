@@ -0,0 +1 @@
+# SQLite database backend package __init__.py
@@ -1,3 +1,1776 @@
-from django.test import TestCase
+import csv
+import json
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from copy import deepcopy
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib import admin
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.http import JsonResponse
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.decorators import api_view
+from rest_framework.exceptions import Throttled
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from benchmarks.runner import compare
+
+from . import async_views, hashing
+from .admin import PurchaseAdmin, SweetAdmin, UserAdmin
+from .cache import bump_catalog_version, get_catalog_cache, get_catalog_version
+from .idempotency import idempotency_stats, idempotent
+from .inventory import adjust_stock, rebalance, refresh_summed_quantity, shard_stock, stock_levels, take_stock
+from .ledger import FlashSaleLedger, apply_entries, drain_ledger, reconcile
+from .log import JSONFormatter
+from .metrics import REGISTRY
+from .models import User, Sweet, Purchase, Reservation, StockShard, LedgerCheckpoint, SweetSalesDaily, CategorySalesDaily
+from .pagination import CreatedAtCursorPagination, PurchaseCursorPagination
+from .renditions import RENDITION_SIZES
+from .replicas import PIN_COOKIE, ReplicaPinMiddleware, ReplicaRouter, copy_to_replicas, replica_reads
+from .reservations import release_expired, sweep_reservations
+from .search import match_sweets
 
 # Create your tests here.
+
+class PurchaseSweetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='buyer@example.com', name='Buyer', password='pass12345')
+        self.sweet = Sweet.objects.create(name='Gulab Jamun', category='traditional', price='150.00', quantity=10)
+
+    def purchase(self, quantity, sweet_id=None):
+        return self.client.post(f'/api/sweets/{sweet_id or self.sweet.id}/purchase/', {'quantity': quantity}, format='json')
+
+    def test_purchase_decrements_stock_and_records_purchase(self):
+        self.client.force_authenticate(self.user)
+        response = self.purchase(3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['remaining_quantity'], 7)
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 7)
+        purchase = Purchase.objects.get()
+        self.assertEqual(purchase.quantity, 3)
+        self.assertEqual(str(purchase.total_price), '450.00')
+
+    def test_purchase_more_than_stock_is_rejected(self):
+        response = self.purchase(11)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Not enough stock. Available: 10 kg')
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 10)
+
+    def test_purchase_unknown_sweet(self):
+        response = self.purchase(1, sweet_id=9999)
+        self.assertEqual(response.status_code, 404)
+
+    def test_purchase_invalid_quantity(self):
+        self.assertEqual(self.purchase(0).status_code, 400)
+        self.assertEqual(self.purchase('abc').status_code, 400)
+
+    def test_purchase_query_count(self):
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(7):
+            # SAVEPOINT, UPDATE, SELECT, INSERT, 2 rollup upserts, RELEASE
+            self.purchase(1)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='buyer@example.com', name='Buyer', password='pass12345')
+        self.client.force_authenticate(self.user)
+        self.sweets = [
+            Sweet.objects.create(name=f'Sweet {i}', category='traditional', price='10.00', quantity=5)
+            for i in range(10)
+        ]
+
+    def checkout(self, items):
+        return self.client.post('/api/checkout/', {'items': items}, format='json')
+
+    def test_checkout_creates_all_purchases(self):
+        response = self.checkout([{'sweet_id': sweet.id, 'quantity': 2} for sweet in self.sweets])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['purchases']), 10)
+        self.assertEqual(response.data['total_price'], Decimal('200.00'))
+        self.assertEqual(response.data['purchases'][0]['sweet_name'], 'Sweet 0')
+        self.assertEqual(Purchase.objects.filter(user=self.user).count(), 10)
+        self.assertEqual(set(Sweet.objects.values_list('quantity', flat=True)), {3})
+
+    def test_checkout_is_all_or_nothing(self):
+        response = self.checkout([
+            {'sweet_id': self.sweets[0].id, 'quantity': 1},
+            {'sweet_id': self.sweets[1].id, 'quantity': 6},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['unavailable'], [
+            {'sweet_id': self.sweets[1].id, 'name': 'Sweet 1', 'requested': 6, 'available': 5}
+        ])
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(set(Sweet.objects.values_list('quantity', flat=True)), {5})
+
+    def test_checkout_merges_repeated_lines_for_stock_check(self):
+        response = self.checkout([
+            {'sweet_id': self.sweets[0].id, 'quantity': 3},
+            {'sweet_id': self.sweets[0].id, 'quantity': 3},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['unavailable'][0]['requested'], 6)
+
+    def test_checkout_unknown_sweet(self):
+        response = self.checkout([{'sweet_id': 9999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['missing'], [9999])
+
+    def test_checkout_rejects_bad_payloads(self):
+        self.assertEqual(self.checkout([]).status_code, 400)
+        self.assertEqual(self.checkout([{'sweet_id': self.sweets[0].id, 'quantity': 0}]).status_code, 400)
+
+    def test_checkout_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertIn(self.checkout([{'sweet_id': self.sweets[0].id, 'quantity': 1}]).status_code, (401, 403))
+
+    def test_checkout_query_count_does_not_grow_with_items(self):
+        with self.assertNumQueries(7):
+            # SAVEPOINT, SELECT, UPDATE, INSERT, 2 rollup upserts, RELEASE
+            self.checkout([{'sweet_id': sweet.id, 'quantity': 1} for sweet in self.sweets])
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client = APIClient()
+        self.sweet = Sweet.objects.create(name='Jalebi', category='traditional', price='80.00', quantity=30)
+
+    def test_cache_hit_does_not_touch_the_database(self):
+        self.client.get('/api/sweets/public/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/sweets/public/')
+            simple = self.client.get('/api/sweets/simple/')
+        self.assertEqual(response.data[0]['name'], 'Jalebi')
+        self.assertEqual(simple.json()['sweets'][0]['name'], 'Jalebi')
+
+    def test_saving_a_sweet_bumps_the_version(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sweet.name = 'Kesar Jalebi'
+            self.sweet.save()
+        self.assertNotEqual(get_catalog_version(), version)
+        self.assertEqual(self.client.get('/api/sweets/public/').data[0]['name'], 'Kesar Jalebi')
+
+    def test_deleting_a_sweet_bumps_the_version(self):
+        self.client.get('/api/sweets/public/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sweet.delete()
+        self.assertEqual(self.client.get('/api/sweets/public/').data, [])
+
+    def test_purchase_bumps_the_version(self):
+        self.client.get('/api/sweets/public/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/sweets/{self.sweet.id}/purchase/', {'quantity': 5}, format='json')
+        self.assertEqual(self.client.get('/api/sweets/public/').data[0]['quantity'], 25)
+
+
+    def test_pages_are_cached_per_filters_not_per_url(self):
+        Sweet.objects.create(name='Imarti', category='traditional', price='90.00', quantity=10)
+        first = self.client.get('/api/sweets/public/', {'page_size': 1, 'min_price': '10'})
+        with self.assertNumQueries(0):
+            again = self.client.get('/api/sweets/public/', {'min_price': '10.0', 'page_size': '1', 'utm_source': 'mail'})
+        self.assertEqual(again.data, first.data)
+        self.assertEqual(again.data['next'].split('?')[0], 'http://testserver/api/sweets/public/')
+        self.assertNotIn('utm_source', again.data['next'])
+        self.assertEqual(self.client.get(again.data['next']).data['results'][0]['name'], 'Imarti')
+
+    def test_payloads_do_not_evict_the_version(self):
+        version = get_catalog_version()
+        for number in range(400):  # over LocMemCache's MAX_ENTRIES
+            get_catalog_cache().set(f'payload-{number}', number)
+        self.assertEqual(get_catalog_version(), version)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='buyer@example.com', name='Buyer', password='pass12345')
+        self.client.force_authenticate(self.user)
+        sweets = [Sweet(name=f'Sweet {i}', price='10.00', quantity=5) for i in range(25)]
+        self.sweets = Sweet.objects.bulk_create(sweets)
+        Purchase.objects.bulk_create([
+            Purchase(user=self.user, sweet=sweet, quantity=1, total_price='10.00') for sweet in self.sweets
+        ])
+
+    def walk(self, url):
+        """Follow next links, returning every page's results"""
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append(data.get('results', data.get('sweets')))
+            url = data['next']
+        return pages
+
+    def test_purchase_viewset_pages_newest_first_without_count(self):
+        response = self.client.get('/api/purchases/')
+        self.assertNotIn('count', response.data)
+        pages = self.walk('/api/purchases/?page_size=10')
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        dates = [purchase['purchase_date'] for page in pages for purchase in page]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        first = self.client.get('/api/purchases/?page_size=5')
+        url = first.data['next']
+        for _ in range(3):
+            url = self.client.get(url).data['next']
+        with CaptureQueriesContext(connection) as first_page:
+            self.client.get('/api/purchases/?page_size=5')
+        with CaptureQueriesContext(connection) as deep_page:
+            self.client.get(url)
+        self.assertEqual(len(deep_page), len(first_page))
+        page_query = next(query['sql'] for query in deep_page if 'FROM "purchases"' in query['sql'])
+        self.assertNotIn('OFFSET', page_query)
+        self.assertIn('"purchases"."purchase_date" <', page_query)
+
+    def test_user_purchases_are_paginated_on_request(self):
+        self.assertEqual(len(self.client.get('/api/purchases/user/').data), 25)
+        pages = self.walk('/api/purchases/user/?page_size=20')
+        self.assertEqual([len(page) for page in pages], [20, 5])
+
+    def test_public_catalog_pages(self):
+        self.assertEqual(len(self.client.get('/api/sweets/public/').data), 25)
+        pages = self.walk('/api/sweets/public/?page_size=10')
+        names = [sweet['name'] for page in pages for sweet in page]
+        self.assertEqual(names, [f'Sweet {i}' for i in range(25)])
+        pages = self.walk('/api/sweets/simple/?page_size=10')
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/api/sweets/public/?cursor=bogus').status_code, 404)
+        self.assertEqual(self.client.get('/api/sweets/simple/?cursor=bogus').status_code, 404)
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN the hot queries of api.views and api.admin against a seeded database."""
+
+    FULL_SCAN = re.compile(r'\bSCAN (\w+)$')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='buyer@example.com', name='Buyer', password='pass12345')
+        User.objects.bulk_create([User(email=f'user{i}@example.com', username=f'user{i}', name=f'User {i}') for i in range(200)])
+        sweets = Sweet.objects.bulk_create([
+            Sweet(name=f'Sweet {i}', category=f'category {i % 5}', price='10.00', quantity=5) for i in range(500)
+        ])
+        Purchase.objects.bulk_create([
+            Purchase(user=cls.user, sweet=sweets[i % len(sweets)], quantity=1, total_price='10.00') for i in range(2000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            self.assertIsNone(self.FULL_SCAN.search(line), f'Full table scan in:\n{queryset.query}\n{plan}')
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', line, f'Unindexed sort in:\n{queryset.query}\n{plan}')
+
+    def test_user_purchase_history(self):
+        now = timezone.now()
+        self.assertUsesIndex(Purchase.objects.for_listing().filter(user=self.user))
+        self.assertUsesIndex(
+            Purchase.objects.for_listing().filter(user=self.user).order_by(*PurchaseCursorPagination.ordering)[:11]
+        )
+        self.assertUsesIndex(
+            Purchase.objects.filter(user=self.user, purchase_date__lt=now).order_by(*PurchaseCursorPagination.ordering)[:11]
+        )
+
+    def test_all_purchases_newest_first(self):
+        self.assertUsesIndex(Purchase.objects.order_by(*PurchaseCursorPagination.ordering)[:11])
+        self.assertUsesIndex(Purchase.objects.order_by(*PurchaseAdmin.ordering)[:PurchaseAdmin.list_per_page])
+
+    def test_sweet_pages_and_admin_filters(self):
+        now = timezone.now()
+        self.assertUsesIndex(Sweet.objects.order_by(*CreatedAtCursorPagination.ordering)[:11])
+        self.assertUsesIndex(Sweet.objects.filter(created_at__gt=now).order_by(*CreatedAtCursorPagination.ordering)[:11])
+        self.assertUsesIndex(Sweet.objects.order_by(*SweetAdmin.ordering)[:SweetAdmin.list_per_page])
+        self.assertUsesIndex(
+            Sweet.objects.filter(category='category 1').order_by(*SweetAdmin.ordering)[:SweetAdmin.list_per_page]
+        )
+        self.assertUsesIndex(Sweet.objects.filter(name='Sweet 1'))
+
+    def test_user_pages(self):
+        self.assertUsesIndex(User.objects.order_by(*CreatedAtCursorPagination.ordering)[:11])
+        self.assertUsesIndex(User.objects.order_by(*UserAdmin.ordering)[:UserAdmin.list_per_page])
+
+
+class QueryBudgetTests(TestCase):
+    """Per-endpoint query budgets; none of them may grow with the number of rows returned.
+
+    Budgets exclude authentication, which force_authenticate skips.
+    """
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email='admin@example.com', name='Admin', password='pass12345')
+        self.user = User.objects.create_user(email='buyer@example.com', name='Buyer', password='pass12345')
+        self.client.force_authenticate(self.user)
+        self.seed(5)
+
+    def seed(self, count):
+        sweets = Sweet.objects.bulk_create([Sweet(name=f'Sweet {i}', price='10.00', quantity=50) for i in range(count)])
+        Purchase.objects.bulk_create([
+            Purchase(user=user, sweet=sweet, quantity=1, total_price='10.00')
+            for sweet in sweets for user in (self.user, self.admin)
+        ])
+        bump_catalog_version()  # bulk_create sends no post_save
+        return sweets
+
+    def assertBudget(self, budget, method, url, data=None):
+        """The endpoint stays within budget both before and after the tables grow"""
+        for _ in range(2):
+            with self.assertNumQueries(budget):
+                response = getattr(self.client, method)(url, data, format='json')
+            self.assertLess(response.status_code, 300, response.content)
+            self.seed(10)
+        return response
+
+    def test_list_purchases(self):
+        self.assertBudget(1, 'get', '/api/purchases/?page_size=50')
+        self.client.force_authenticate(self.admin)
+        self.assertBudget(1, 'get', '/api/purchases/?page_size=50')
+
+    def test_retrieve_purchase(self):
+        purchase = Purchase.objects.filter(user=self.user).first()
+        self.assertBudget(1, 'get', f'/api/purchases/{purchase.id}/')
+
+    def test_user_purchases(self):
+        self.assertBudget(1, 'get', '/api/purchases/user/')
+        self.assertBudget(1, 'get', '/api/purchases/user/?page_size=50')
+
+    def test_list_users(self):
+        self.assertBudget(1, 'get', '/api/users/?page_size=50')
+
+    def test_list_admin_sweets(self):
+        self.assertBudget(1, 'get', '/api/admin-sweets/?page_size=50')
+
+    def test_public_catalog(self):
+        # One query on a miss; a hit is checked by CatalogCacheTests
+        self.assertBudget(1, 'get', '/api/sweets/public/')
+        self.assertBudget(1, 'get', '/api/sweets/simple/')
+
+    def test_public_sweet_detail(self):
+        sweet = Sweet.objects.first()
+        self.assertBudget(1, 'get', f'/api/sweets/public/{sweet.id}/')
+
+    def test_profile(self):
+        self.assertBudget(0, 'get', '/api/auth/profile/')
+
+    def test_create_purchase(self):
+        sweet = Sweet.objects.first()
+        # SELECT user, SELECT sweet, SAVEPOINT, INSERT, 2 rollup upserts, RELEASE
+        self.assertBudget(7, 'post', '/api/purchases/create/', {
+            'user': self.user.id, 'sweet': sweet.id, 'quantity': 1, 'total_price': '10.00'
+        })
+
+    def test_purchase_changelist(self):
+        self.client.force_authenticate(None)
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/admin/api/purchase/')
+        self.seed(30)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get('/admin/api/purchase/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(large), len(small))
+
+
+class SweetSearchTests(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client = APIClient()
+        self.jamun = Sweet.objects.create(
+            name='Gulab Jamun', category='traditional', price='150.00', quantity=50,
+            description='Milk-solid balls soaked in rose syrup'
+        )
+        self.barfi = Sweet.objects.create(
+            name='Mango Barfi', category='fruit', price='180.00', quantity=35,
+            description='Fudge made from mango pulp, a summer gulab alternative'
+        )
+
+    def search(self, query):
+        return [sweet['name'] for sweet in self.client.get('/api/sweets/search/', {'q': query}).data]
+
+    def test_prefix_match_ranks_name_above_description(self):
+        self.assertEqual(self.search('gul'), ['Gulab Jamun', 'Mango Barfi'])
+        self.assertEqual(self.search('mango bar'), ['Mango Barfi'])
+        self.assertEqual(self.search('fruit'), ['Mango Barfi'])
+
+    def test_index_follows_updates_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.barfi.name = 'Kaju Katli'
+            self.barfi.save()
+        self.assertEqual(self.search('kaju'), ['Kaju Katli'])
+        self.assertEqual(self.search('mango'), ['Kaju Katli'])  # still in the description
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jamun.delete()
+        self.assertEqual(self.search('jamun'), [])
+
+    def test_stock_changes_keep_the_index(self):
+        Sweet.objects.filter(id=self.jamun.id).update(quantity=1)
+        self.assertEqual(self.search('jamun'), ['Gulab Jamun'])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('"jamun" OR NEAR('), [])
+        self.assertEqual(self.search(''), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO sweets_fts(sweets_fts) VALUES ('delete-all')")
+        self.assertEqual(match_sweets('jamun'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual([sweet.name for sweet in match_sweets('jamun')], ['Gulab Jamun'])
+
+
+class CatalogFilterTests(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client = APIClient()
+        Sweet.objects.create(name='Jalebi', category='traditional', price='80.00', quantity=30)
+        Sweet.objects.create(name='Gulab Jamun', category='traditional', price='150.00', quantity=0)
+        Sweet.objects.create(name='Chocolate Truffle', category='chocolate', price='200.00', quantity=25)
+        Sweet.objects.create(name='Pista Burfi', category='nut', price='650.00', quantity=20)
+
+    def names(self, params):
+        response = self.client.get('/api/sweets/public/', params)
+        self.assertEqual(response.status_code, 200)
+        return [sweet['name'] for sweet in response.data]
+
+    def test_filters(self):
+        self.assertEqual(self.names({'category': 'traditional'}), ['Jalebi', 'Gulab Jamun'])
+        self.assertEqual(self.names({'min_price': '100', 'max_price': '200'}), ['Gulab Jamun', 'Chocolate Truffle'])
+        self.assertEqual(self.names({'category': 'traditional', 'in_stock': 'true'}), ['Jalebi'])
+        self.assertEqual(self.names({'in_stock': 'false'}), ['Gulab Jamun'])
+
+    def test_invalid_filters(self):
+        self.assertEqual(self.client.get('/api/sweets/public/', {'min_price': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/sweets/public/', {'min_price': '5', 'max_price': '1'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/sweets/simple/', {'in_stock': 'maybe'}).status_code, 400)
+
+    def test_facets_come_from_one_cached_query(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/sweets/public/', {'category': 'chocolate', 'facets': 'true'})
+        self.assertEqual([sweet['name'] for sweet in response.data['results']], ['Chocolate Truffle'])
+        self.assertEqual(response.data['facets'], {
+            'category': {'traditional': 2, 'chocolate': 1, 'nut': 1},
+            'price': {'0-100': 1, '100-200': 1, '200-500': 1, '500+': 1},
+            'stock': {'in_stock': 3, 'sold_out': 1},
+        })
+        with self.assertNumQueries(1):
+            self.client.get('/api/sweets/public/', {'category': 'nut', 'facets': 'true'})
+
+    def test_filtered_pages_and_simple_endpoint(self):
+        response = self.client.get('/api/sweets/public/', {'category': 'traditional', 'page_size': 1, 'facets': 'true'})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNotNone(response.data['next'])
+        self.assertIn('facets', response.data)
+        data = self.client.get('/api/sweets/simple/', {'category': 'nut', 'facets': 'true'}).json()
+        self.assertEqual([sweet['name'] for sweet in data['sweets']], ['Pista Burfi'])
+        self.assertEqual(data['facets']['stock'], {'in_stock': 3, 'sold_out': 1})
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email='admin@example.com', name='Admin', password='pass12345')
+        self.user = User.objects.create_user(email='buyer@example.com', name='Buyer', password='pass12345')
+        self.jalebi = Sweet.objects.create(name='Jalebi', category='traditional', price='80.00', quantity=100)
+        self.truffle = Sweet.objects.create(name='Chocolate Truffle', category='chocolate', price='200.00', quantity=100)
+
+    def buy(self):
+        self.client.force_authenticate(self.user)
+        self.client.post(f'/api/sweets/{self.jalebi.id}/purchase/', {'quantity': 2}, format='json')
+        self.client.post('/api/checkout/', {'items': [
+            {'sweet_id': self.jalebi.id, 'quantity': 1},
+            {'sweet_id': self.truffle.id, 'quantity': 3},
+        ]}, format='json')
+        self.client.post('/api/purchases/create/', {
+            'user': self.user.id, 'sweet': self.truffle.id, 'quantity': 1, 'total_price': '200.00'
+        }, format='json')
+
+    def report(self, **params):
+        self.client.force_authenticate(self.admin)
+        return self.client.get('/api/analytics/sales/', params)
+
+    def rollups(self):
+        return (
+            sorted(SweetSalesDaily.objects.values_list('sweet__name', 'quantity', 'revenue', 'purchases')),
+            sorted(CategorySalesDaily.objects.values_list('category', 'quantity', 'revenue', 'purchases')),
+        )
+
+    def test_every_purchase_path_updates_the_rollups(self):
+        self.buy()
+        self.assertEqual(self.rollups(), (
+            [('Chocolate Truffle', 4, Decimal('800.00'), 2), ('Jalebi', 3, Decimal('240.00'), 2)],
+            [('chocolate', 4, Decimal('800.00'), 2), ('traditional', 3, Decimal('240.00'), 2)],
+        ))
+
+    def test_edits_and_deletes_are_reflected(self):
+        self.buy()
+        purchase = Purchase.objects.filter(sweet=self.truffle).order_by('id').first()
+        purchase.quantity = 1
+        purchase.total_price = Decimal('200.00')
+        purchase.save()
+        Purchase.objects.filter(sweet=self.jalebi).delete()
+        self.assertEqual(self.rollups(), (
+            [('Chocolate Truffle', 2, Decimal('400.00'), 2), ('Jalebi', 0, Decimal('0.00'), 0)],
+            [('chocolate', 2, Decimal('400.00'), 2), ('traditional', 0, Decimal('0.00'), 0)],
+        ))
+
+    def test_deleting_a_sweet_or_user_keeps_past_sales(self):
+        self.buy()
+        self.jalebi.delete()
+        connection.check_constraints()
+        self.assertEqual(self.rollups(), (
+            [('Chocolate Truffle', 4, Decimal('800.00'), 2)],
+            [('chocolate', 4, Decimal('800.00'), 2), ('traditional', 3, Decimal('240.00'), 2)],
+        ))
+        self.user.delete()
+        connection.check_constraints()
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(self.rollups()[1], [('chocolate', 4, Decimal('800.00'), 2), ('traditional', 3, Decimal('240.00'), 2)])
+
+    def test_backfill_matches_incremental_rollups(self):
+        self.buy()
+        incremental = self.rollups()
+        SweetSalesDaily.objects.update(quantity=0)
+        call_command('backfill_sales_rollups', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_report_is_answered_from_rollups(self):
+        self.buy()
+        today = timezone.localdate().isoformat()
+        self.client.force_authenticate(self.admin)
+        with self.assertNumQueries(1):
+            response = self.report(group_by='category')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], {'quantity': 7, 'revenue': Decimal('1040.00'), 'purchases': 4})
+        self.assertEqual([row['category'] for row in response.data['results']], ['chocolate', 'traditional'])
+        by_sweet = self.report(group_by='sweet', **{'from': today, 'to': today}).data['results']
+        self.assertEqual([row['sweet_name'] for row in by_sweet], ['Jalebi', 'Chocolate Truffle'])
+        by_day = self.report().data['results']
+        self.assertEqual([(str(row['day']), row['quantity']) for row in by_day], [(today, 7)])
+
+    def test_report_validation_and_permissions(self):
+        self.assertEqual(self.report(group_by='hour').status_code, 400)
+        self.assertEqual(self.report(**{'from': '2024-02-01', 'to': '2024-01-01'}).status_code, 400)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/analytics/sales/').status_code, 403)
+
+
+class AsyncViewTests(TestCase):
+    """api.async_views must answer exactly like the sync views they replace."""
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client = APIClient()
+        self.factory = AsyncRequestFactory()
+        self.user = User.objects.create_user(email='buyer@example.com', name='Buyer', password='pass12345')
+        self.sweet = Sweet.objects.create(name='Jalebi', category='traditional', price='80.00', quantity=30)
+        Sweet.objects.create(name='Pista Burfi', category='nut', price='250.00', quantity=0)
+        Purchase.objects.create(user=self.user, sweet=self.sweet, quantity=2, total_price='160.00')
+
+    def call(self, view, path, *args, user=None, **params):
+        request = self.factory.get(path, params)
+
+        async def auser():
+            return user or AnonymousUser()
+        request.auser = auser
+        return async_to_sync(view)(request, *args)
+
+    def test_get_sweets(self):
+        for params in ({}, {'category': 'nut'}, {'in_stock': 'true', 'facets': 'true'}):
+            get_catalog_cache().clear()
+            expected = self.client.get('/api/sweets/public/', params).json()
+            get_catalog_cache().clear()
+            response = self.call(async_views.get_sweets, '/api/sweets/public/', **params)
+            self.assertEqual(json.loads(response.content), expected)
+        self.assertEqual(self.call(async_views.get_sweets, '/api/sweets/public/', min_price='x').status_code, 400)
+
+    def test_get_sweets_delegates_cursor_pages(self):
+        response = self.call(async_views.get_sweets, '/api/sweets/public/', page_size=1)
+        response.render()
+        self.assertEqual(len(json.loads(response.content)['results']), 1)
+
+    def test_get_sweet_detail(self):
+        expected = self.client.get(f'/api/sweets/public/{self.sweet.id}/').json()
+        response = self.call(async_views.get_sweet_detail, '/', self.sweet.id)
+        self.assertEqual(json.loads(response.content), expected)
+        self.assertEqual(self.call(async_views.get_sweet_detail, '/', 9999).status_code, 404)
+
+    def test_get_user_purchases(self):
+        self.client.force_authenticate(self.user)
+        expected = self.client.get('/api/purchases/user/').json()
+        response = self.call(async_views.get_user_purchases, '/api/purchases/user/', user=self.user)
+        self.assertEqual(json.loads(response.content), expected)
+
+    def test_get_user_purchases_anonymously(self):
+        expected = self.client.get('/api/purchases/user/')
+        response = self.call(async_views.get_user_purchases, '/api/purchases/user/')
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response['WWW-Authenticate'], expected['WWW-Authenticate'])
+        self.assertEqual(json.loads(response.content), expected.json())
+
+
+@override_settings(IMAGE_RENDITION_WORKERS=0)
+class ImageRenditionTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        get_catalog_cache().clear()
+        self.client = APIClient()
+
+    def upload(self, name='ladoo.png', size=(800, 600), mode='RGBA'):
+        buffer = BytesIO()
+        Image.new(mode, size, 'orange').save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_upload_generates_all_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sweet = Sweet.objects.create(name='Ladoo', price='90.00', quantity=5, image=self.upload())
+        sweet.refresh_from_db()
+        self.assertEqual(sweet.renditions['source'], sweet.image.name)
+        sizes = {}
+        for size_name in RENDITION_SIZES:
+            self.assertTrue(sweet.renditions[size_name]['webp'].endswith('.webp'))
+            self.assertTrue(sweet.renditions[size_name]['fallback'].endswith('.png'))  # keeps transparency
+            with default_storage.open(sweet.renditions[size_name]['webp']) as rendition:
+                sizes[size_name] = Image.open(rendition).size
+        self.assertEqual(sizes, {'thumb': (100, 100), 'card': (400, 300), 'full': (800, 600)})
+
+    def test_urls_are_exposed_per_size(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sweet = Sweet.objects.create(name='Ladoo', price='90.00', quantity=5, image=self.upload(mode='RGB'))
+        detail = self.client.get(f'/api/sweets/public/{sweet.id}/').data
+        self.assertEqual(set(detail['image_renditions']), {'thumb', 'card', 'full'})
+        self.assertTrue(detail['image_renditions']['card']['fallback'].startswith('http://testserver/media/'))
+        self.assertTrue(detail['image_renditions']['card']['fallback'].endswith('_card.jpg'))
+        catalog = self.client.get('/api/sweets/public/').data
+        self.assertEqual(catalog[0]['image_renditions'], detail['image_renditions'])
+        self.assertIn('_thumb.webp', SweetAdmin(Sweet, None).image_preview(Sweet.objects.get()))
+
+    def test_renditions_are_hidden_until_the_new_image_is_processed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sweet = Sweet.objects.create(name='Ladoo', price='90.00', quantity=5, image=self.upload())
+        sweet.refresh_from_db()
+        with override_settings(IMAGE_RENDITION_WORKERS=1), mock.patch('api.signals.schedule_renditions') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                sweet.image = self.upload('barfi.png')
+                sweet.save()
+        schedule.assert_called_once_with(sweet.id)
+        self.assertEqual(self.client.get(f'/api/sweets/public/{sweet.id}/').data['image_renditions'], {})
+
+    def test_images_with_the_same_stem_keep_their_own_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Sweet.objects.create(name='Barfi', price='90.00', quantity=5, image=self.upload('barfi.png'))
+        with self.captureOnCommitCallbacks(execute=True):
+            second = Sweet.objects.create(name='Kaju Barfi', price='95.00', quantity=5, image=self.upload('barfi.webp'))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        names = [
+            {name for size_name in RENDITION_SIZES for name in sweet.renditions[size_name].values()}
+            for sweet in (first, second)
+        ]
+        self.assertFalse(names[0] & names[1])
+        self.assertTrue(all(default_storage.exists(name) for name in names[0] | names[1]))
+
+    def test_backfill_command(self):
+        sweet = Sweet.objects.create(name='Ladoo', price='90.00', quantity=5, image=self.upload())
+        self.assertEqual(Sweet.objects.get().renditions, {})
+        call_command('generate_image_renditions', '--workers', '1', stdout=StringIO())
+        self.assertEqual(Sweet.objects.get().renditions['source'], sweet.image.name)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='buyer@example.com', name='Buyer', password='pass12345')
+        other = User.objects.create_user(email='other@example.com', name='Other', password='pass12345')
+        sweet = Sweet.objects.create(name='Jalebi', category='traditional', price='80.00', quantity=30)
+        Purchase.objects.create(user=other, sweet=sweet, quantity=1, total_price='80.00')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_warm_requests_skip_the_database(self):
+        self.client.get('/api/auth/profile/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['email'], 'buyer@example.com')
+        self.assertEqual(response.data['role'], 'customer')
+        with self.assertNumQueries(1):
+            # Only the purchases; request.user.role comes from the cache
+            self.assertEqual(self.client.get('/api/purchases/').data['results'], [])
+
+    def test_user_changes_invalidate_the_cache(self):
+        self.client.get('/api/auth/profile/')
+        self.user.role = 'admin'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(len(self.client.get('/api/purchases/').data['results']), 1)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+
+        self.user.delete()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+
+    def test_async_user_purchases_accept_the_token(self):
+        token = RefreshToken.for_user(self.user).access_token
+        request = AsyncRequestFactory().get('/api/purchases/user/', headers={'Authorization': f'Bearer {token}'})
+        response = async_to_sync(async_views.get_user_purchases)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [])
+
+        request = AsyncRequestFactory().get('/api/purchases/user/', headers={'Authorization': 'Bearer nonsense'})
+        self.assertEqual(async_to_sync(async_views.get_user_purchases)(request).status_code, 401)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_auth', requests=5, paths=['/api/auth/profile/'], stdout=out)
+        self.assertIn('cached JWT saves 2.00 queries per request', out.getvalue())
+
+
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        User.objects.create_user(email='buyer@example.com', name='Buyer', password='pass12345')
+
+    def login(self, password='pass12345', address='10.0.0.1'):
+        return self.client.post(
+            '/api/auth/login/', {'email': 'buyer@example.com', 'password': password}, format='json', REMOTE_ADDR=address
+        )
+
+    def test_login_and_registration_hash_on_the_pool(self):
+        before = hashing.hashing_stats()
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login('wrong').status_code, 401)
+        response = self.client.post('/api/auth/register/', {
+            'email': 'new@example.com', 'name': 'New', 'password': 'pass12345'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(email='new@example.com').check_password('pass12345'))
+        self.assertEqual(hashing.hashing_stats()['hashed'] - before['hashed'], 3)
+
+    def test_login_goes_through_the_auth_framework(self):
+        failures = []
+        user_login_failed.connect(lambda sender, credentials, **kwargs: failures.append(credentials), weak=False,
+                                  dispatch_uid='test-login-failed')
+        self.addCleanup(user_login_failed.disconnect, dispatch_uid='test-login-failed')
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.assertEqual(failures[0]['email'], 'buyer@example.com')
+
+        # Passwords stored with an older hasher are upgraded on login
+        User.objects.filter(email='buyer@example.com').update(password=make_password('pass12345', hasher='pbkdf2_sha1'))
+        self.assertEqual(self.login().status_code, 200)
+        self.assertTrue(User.objects.get(email='buyer@example.com').password.startswith('pbkdf2_sha256$'))
+
+        with override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend']), \
+                mock.patch.object(hashing, 'run_hashing') as run_hashing:
+            self.assertEqual(self.login().status_code, 200)
+            run_hashing.assert_not_called()
+
+    def test_clients_over_the_rate_are_throttled(self):
+        for _ in range(10):
+            self.assertEqual(self.login('wrong').status_code, 401)
+        with mock.patch.object(hashing, 'run_hashing') as run_hashing:
+            response = self.login()
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response)
+            run_hashing.assert_not_called()
+        self.assertEqual(self.login(address='10.0.0.2').status_code, 200)
+
+    def test_full_pool_sheds_attempts(self):
+        _, slots = hashing._get_pool()
+        taken = 0
+        while slots.acquire(blocking=False):
+            taken += 1
+        try:
+            before = hashing.hashing_stats()
+            self.assertEqual(self.login().status_code, 429)
+            response = self.client.post('/api/auth/register/', {
+                'email': 'new@example.com', 'name': 'New', 'password': 'pass12345'
+            }, format='json')
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(hashing.hashing_stats()['shed'] - before['shed'], 2)
+        finally:
+            for _ in range(taken):
+                slots.release()
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_admin_login_is_refused_while_the_pool_is_full(self):
+        User.objects.create_user(email='staff@example.com', name='Staff', password='pass12345', is_staff=True)
+        _, slots = hashing._get_pool()
+        taken = 0
+        while slots.acquire(blocking=False):
+            taken += 1
+        try:
+            response = self.client.post('/admin/login/', {'username': 'staff@example.com', 'password': 'pass12345'})
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'Please enter the correct')
+        finally:
+            for _ in range(taken):
+                slots.release()
+        response = self.client.post('/admin/login/', {'username': 'staff@example.com', 'password': 'pass12345'})
+        self.assertEqual(response.status_code, 302)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        REGISTRY.reset()
+        get_catalog_cache().clear()
+        self.client = APIClient()
+        Sweet.objects.create(name='Jalebi', category='traditional', price='80.00', quantity=30)
+
+    def metrics(self):
+        with override_settings(METRICS_TOKEN='scrape-token'):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode()
+
+    def test_requests_are_recorded_per_route(self):
+        self.client.get('/api/sweets/public/')
+        self.client.get('/api/sweets/public/')
+        self.client.get('/api/sweets/public/9999/')
+        self.client.get('/nowhere/')
+        metrics = self.metrics()
+
+        route = 'route="api/sweets/public/",method="GET"'
+        self.assertIn(f'sweetshop_http_requests_total{{{route},status="200"}} 2', metrics)
+        self.assertIn('sweetshop_http_requests_total{route="api/sweets/public/<int:sweet_id>/",method="GET",status="404"} 1', metrics)
+        self.assertIn('sweetshop_http_requests_total{route="<unmatched>",method="GET",status="404"} 1', metrics)
+        self.assertIn(f'sweetshop_http_request_duration_seconds_bucket{{{route},le="+Inf"}} 2', metrics)
+        self.assertIn(f'sweetshop_http_request_duration_seconds_count{{{route}}} 2', metrics)
+        db_seconds = float(re.search(rf'sweetshop_http_request_db_duration_seconds_sum{{{route}}} (\S+)', metrics).group(1))
+        self.assertGreater(db_seconds, 0)
+        self.assertIn('sweetshop_password_hashes_total ', metrics)
+
+    def test_scrapes_need_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape-token'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+    def test_async_requests_are_recorded(self):
+        async_to_sync(AsyncClient().get)('/api/test-simple/')
+        self.assertIn('sweetshop_http_requests_total{route="api/test-simple/",method="GET",status="200"} 1', self.metrics())
+
+    def test_catalog_views_log_instead_of_printing(self):
+        with mock.patch('sys.stdout', new_callable=StringIO) as stdout, self.assertLogs('api.views', 'DEBUG') as logs:
+            self.client.get('/api/sweets/public/', {'category': 'traditional'})
+            self.client.get('/api/sweets/simple/')
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertEqual(logs.records[0].params, {'category': 'traditional'})
+
+        line = json.loads(JSONFormatter().format(logs.records[0]))
+        self.assertEqual(line['level'], 'DEBUG')
+        self.assertEqual(line['message'], 'get_sweets')
+        self.assertEqual(line['params'], {'category': 'traditional'})
+
+
+class QueryProfilingTests(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        Sweet.objects.create(name='Jalebi', category='traditional', price='80.00', quantity=30)
+
+    def test_off_by_default(self):
+        self.assertFalse(APIClient().get('/api/sweets/public/').has_header('Server-Timing'))
+
+    @override_settings(SQL_PROFILING_SAMPLE_RATE=1.0, SQL_SLOW_QUERY_MS=10_000)
+    def test_server_timing_header(self):
+        response = APIClient().get('/api/sweets/public/')
+        self.assertRegex(response['Server-Timing'], r'^db;desc="1 queries";dur=[\d.]+, total;dur=[\d.]+$')
+
+    @override_settings(SQL_PROFILING_SAMPLE_RATE=1.0, SQL_SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged_with_view(self):
+        with self.assertLogs('api.profiling', 'WARNING') as logs:
+            APIClient().get('/api/sweets/public/')
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].view, 'public_sweets')
+        self.assertIn('FROM "sweets"', logs.records[0].sql)
+
+    @override_settings(SQL_PROFILING_SAMPLE_RATE=0.5)
+    def test_sampling(self):
+        client = APIClient()
+        with mock.patch('api.profiling.random.random', side_effect=[0.7, 0.2]):
+            self.assertFalse(client.get('/api/sweets/public/').has_header('Server-Timing'))
+            self.assertTrue(client.get('/api/sweets/public/').has_header('Server-Timing'))
+
+
+class ImportSweetsTests(TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.jalebi = Sweet.objects.create(name='Jalebi', description='Crispy', category='traditional', price='80.00', quantity=3)
+
+    def write(self, name, content):
+        path = self.directory / name
+        path.write_text(content)
+        return str(path)
+
+    def run_import(self, path, **options):
+        out, err = StringIO(), StringIO()
+        with mock.patch('api.management.commands.import_sweets.bump_catalog_version') as bump:
+            call_command('import_sweets', path, stdout=out, stderr=err, **options)
+        self.assertEqual(bump.call_count, 1)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_upserts_by_name_in_batches(self):
+        path = self.write('sweets.csv', (
+            'name,description,category,price,quantity\n'
+            'Jalebi,,traditional,90.00,\n'
+            'Kaju Katli,Cashew fudge,nut,400.00,12\n'
+            'Rasgulla,,traditional,-1,5\n'
+            'Barfi,,,150,\n'
+            'Kaju Katli,Cashew fudge,nut,420.00,10\n'
+        ))
+        with self.assertNumQueries(12):
+            # Two batches of SAVEPOINT, SELECT, INSERT, UPDATE, RELEASE; the second
+            # also changes the stock of Kaju Katli (SELECT sharded sweets, UPDATE)
+            out, err = self.run_import(path, batch_size=2)
+
+        self.assertIn('Row 3: price:', err)
+        self.assertIn('2 created, 2 updated, 1 rows failed', out)
+        self.jalebi.refresh_from_db()
+        self.assertEqual((self.jalebi.price, self.jalebi.description, self.jalebi.quantity), (Decimal('90.00'), 'Crispy', 3))
+        katli = Sweet.objects.get(name='Kaju Katli')
+        self.assertEqual((katli.price, katli.quantity), (Decimal('420.00'), 10))
+        self.assertEqual(Sweet.objects.get(name='Barfi').quantity, 0)
+        self.assertFalse(Sweet.objects.filter(name='Rasgulla').exists())
+
+    def test_ndjson(self):
+        path = self.write('sweets.ndjson', (
+            '{"name": "Jalebi", "price": "85.50", "quantity": 40}\n'
+            '\n'
+            'not json\n'
+            '["Barfi"]\n'
+            '{"name": "Ladoo", "category": "traditional", "price": 60}\n'
+        ))
+        out, err = self.run_import(path)
+        self.assertIn('Row 3: invalid JSON', err)
+        self.assertIn('Row 4: expected a JSON object', err)
+        self.assertIn('1 created, 1 updated, 2 rows failed', out)
+        self.jalebi.refresh_from_db()
+        self.assertEqual((self.jalebi.price, self.jalebi.quantity), (Decimal('85.50'), 40))
+        self.assertEqual(match_sweets('ladoo')[0].name, 'Ladoo')
+
+
+    def test_stock_changes_do_not_invalidate_per_batch(self):
+        imarti = Sweet.objects.create(name='Imarti', category='traditional', price='90.00', quantity=1)
+        path = self.write('sweets.csv', 'name,price,quantity\nJalebi,80.00,10\nImarti,90.00,20\n')
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_import(path, batch_size=1)
+        # Only the command's final bump (counted by run_import) invalidates the catalog
+        self.assertEqual(get_catalog_version(), version)
+        self.assertEqual(stock_levels([self.jalebi.id, imarti.id]), {self.jalebi.id: 10, imarti.id: 20})
+
+    def test_stock_changes_keep_concurrent_purchases(self):
+        path = self.write('sweets.csv', 'name,price,quantity\nJalebi,80.00,40\n')
+
+        def purchase_first(changes, **kwargs):
+            # A purchase commits between the import's SELECT and its stock update
+            take_stock(self.jalebi.id, 1)
+            adjust_stock(changes, **kwargs)
+
+        with mock.patch('api.catalog_import.adjust_stock', side_effect=purchase_first):
+            self.run_import(path)
+        self.jalebi.refresh_from_db()
+        self.assertEqual(self.jalebi.quantity, 39)
+
+        shard_stock(self.jalebi.id, 2)
+        Sweet.objects.filter(id=self.jalebi.id).update(quantity=0)  # lagging sum
+        self.run_import(self.write('more.csv', 'name,price,quantity\nJalebi,80.00,50\n'))
+        self.assertEqual(stock_levels([self.jalebi.id]), {self.jalebi.id: 50})
+
+class PurchaseExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(email='admin@example.com', name='Admin', password='pass12345', role='admin')
+        self.buyer = User.objects.create_user(email='buyer@example.com', name='Buyer', password='pass12345')
+        jalebi = Sweet.objects.create(name='Jalebi', category='traditional', price='80.00', quantity=30)
+        barfi = Sweet.objects.create(name='Barfi, Kaju', category='nut', price='400.00', quantity=30)
+        for day, sweet, quantity in ((1, jalebi, 2), (2, barfi, 1), (3, jalebi, 5)):
+            purchase = Purchase.objects.create(user=self.buyer, sweet=sweet, quantity=quantity, total_price=Decimal(sweet.price) * quantity)
+            Purchase.objects.filter(id=purchase.id).update(
+                purchase_date=timezone.make_aware(timezone.datetime(2024, 3, day, 12, 0))
+            )
+
+    def export(self, **params):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/purchases/export/', params)
+        self.assertTrue(response.streaming)
+        with self.assertNumQueries(1):
+            # One joined SELECT, fetched in chunks; no COUNT, no per-row lookups
+            content = b''.join(response.streaming_content).decode()
+        return response, content
+
+    def test_csv_export(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="purchases.csv"')
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual([row['sweet_name'] for row in rows], ['Jalebi', 'Barfi, Kaju', 'Jalebi'])
+        self.assertEqual(rows[1]['user_email'], 'buyer@example.com')
+        self.assertEqual(rows[1]['total_price'], '400.00')
+        self.assertEqual(rows[0]['purchase_date'], '2024-03-01T12:00:00+00:00')
+
+    def test_csv_cells_are_not_formulas(self):
+        self.buyer.name = '=HYPERLINK("http://evil.example","Buyer")'
+        self.buyer.save()
+        Sweet.objects.filter(name='Jalebi').update(name='@SUM(1+1)', category='-traditional')
+        rows = list(csv.DictReader(StringIO(self.export()[1])))
+        self.assertEqual(rows[0]['user_name'], '\'=HYPERLINK("http://evil.example","Buyer")')
+        self.assertEqual(rows[0]['sweet_name'], "'@SUM(1+1)")
+        self.assertEqual(rows[0]['category'], "'-traditional")
+        self.assertEqual(rows[1]['sweet_name'], 'Barfi, Kaju')
+        content = self.export(output='ndjson')[1]
+        self.assertEqual(json.loads(content.splitlines()[0])['sweet_name'], '@SUM(1+1)')
+
+    def test_ndjson_export_between_dates(self):
+        response, content = self.export(**{'from': '2024-03-02', 'to': '2024-03-03', 'output': 'ndjson'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="purchases-2024-03-02-2024-03-03.ndjson"')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([(row['sweet_name'], row['quantity']) for row in rows], [('Barfi, Kaju', 1), ('Jalebi', 5)])
+
+    def test_admins_only_and_validation(self):
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get('/api/purchases/export/').status_code, 403)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get('/api/purchases/export/', {'from': '2024-03-02', 'to': '2024-03-01'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/purchases/export/', {'output': 'xlsx'}).status_code, 400)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_purchases', '--from', '2024-03-03', '--format', 'ndjson', stdout=out)
+        self.assertEqual([json.loads(line)['quantity'] for line in out.getvalue().splitlines()], [5])
+
+        path = Path(tempfile.mkdtemp()) / 'purchases.csv'
+        self.addCleanup(shutil.rmtree, path.parent)
+        out = StringIO()
+        call_command('export_purchases', '--output', str(path), stdout=out)
+        self.assertIn('Exported 3 purchases', out.getvalue())
+        self.assertEqual(len(list(csv.DictReader(path.open(newline='')))), 3)
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='cart@example.com', name='Cart', password='pass12345')
+        self.other = User.objects.create_user(email='other@example.com', name='Other', password='pass12345')
+        self.sweet = Sweet.objects.create(name='Kaju Katli', category='nut', price='400.00', quantity=10)
+        self.client.force_authenticate(self.user)
+
+    def reserve(self, quantity, sweet_id=None):
+        return self.client.post('/api/cart/', {'sweet_id': sweet_id or self.sweet.id, 'quantity': quantity}, format='json')
+
+    def expire(self, *reservations):
+        Reservation.objects.filter(id__in=[reservation.id for reservation in reservations]).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+    def test_reserving_takes_stock_out_of_the_catalog(self):
+        response = self.reserve(4)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['sweet_name'], 'Kaju Katli')
+        self.assertEqual(self.client.get(f'/api/sweets/public/{self.sweet.id}/').data['quantity'], 6)
+        self.assertEqual([row['quantity'] for row in self.client.get('/api/cart/').data], [4])
+
+        # Held stock cannot be bought by anyone else
+        response = self.client.post(f'/api/sweets/{self.sweet.id}/purchase/', {'quantity': 7}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.reserve(7).data['error'], 'Not enough stock. Available: 6 kg')
+        self.assertEqual(self.reserve(1, sweet_id=999999).status_code, 404)
+
+    def test_release_returns_stock(self):
+        reservation_id = self.reserve(4).data['id']
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.delete(f'/api/cart/{reservation_id}/').status_code, 404)
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.delete(f'/api/cart/{reservation_id}/').status_code, 204)
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 10)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_checkout_turns_reservations_into_purchases(self):
+        self.reserve(2)
+        self.reserve(3)
+        expired = Reservation.objects.create(
+            user=self.user, sweet=self.sweet, quantity=1, expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        response = self.client.post('/api/cart/checkout/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_price'], Decimal('2000.00'))
+        self.assertEqual(sorted(Purchase.objects.values_list('quantity', flat=True)), [2, 3])
+        self.assertEqual(SweetSalesDaily.objects.get().quantity, 5)
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 5)  # taken when reserving, not again at checkout
+        # The expired hold is not bought; it waits for the sweeper
+        self.assertEqual(list(Reservation.objects.all()), [expired])
+        self.assertEqual(self.client.post('/api/cart/checkout/').status_code, 400)
+
+    def test_sweeper_releases_expired_reservations_in_batches(self):
+        for quantity in (1, 1, 2):
+            self.reserve(quantity)
+        live = Reservation.objects.create(
+            user=self.other, sweet=self.sweet, quantity=1, expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        self.expire(*Reservation.objects.filter(user=self.user))
+
+        with self.assertNumQueries(6):
+            # SELECT the batch, DELETE it, look for sharded sweets and one UPDATE for the stock, in a savepoint
+            self.assertEqual(release_expired(batch_size=2), 2)
+        self.assertEqual(list(sweep_reservations(batch_size=2)), [1])
+        self.assertEqual(list(Reservation.objects.all()), [live])
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 10)
+
+        self.expire(live)
+        out = StringIO()
+        call_command('sweep_reservations', stdout=out)
+        self.assertIn('Released 1 expired reservations', out.getvalue())
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 11)
+
+    def test_reserving_reclaims_expired_holds(self):
+        self.client.force_authenticate(self.other)
+        self.reserve(8)
+        self.expire(*Reservation.objects.all())
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.reserve(5).status_code, 201)
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 5)
+        self.assertEqual(list(Reservation.objects.values_list('user', flat=True)), [self.user.id])
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='retry@example.com', name='Retry', password='pass12345')
+        self.sweet = Sweet.objects.create(name='Rasgulla', category='traditional', price='50.00', quantity=10)
+        self.client.force_authenticate(self.user)
+
+    def purchase(self, quantity=2, key='order-1'):
+        return self.client.post(
+            f'/api/sweets/{self.sweet.id}/purchase/', {'quantity': quantity}, format='json',
+            headers={'Idempotency-Key': key}
+        )
+
+    def test_retry_is_answered_from_the_store(self):
+        first = self.purchase()
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            retry = self.purchase()
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 8)
+        self.assertEqual(Purchase.objects.count(), 1)
+
+        # A new key, or no key at all, is a new purchase
+        self.purchase(key='order-2')
+        self.client.post(f'/api/sweets/{self.sweet.id}/purchase/', {'quantity': 2}, format='json')
+        self.assertEqual(Purchase.objects.count(), 3)
+
+    def test_keys_are_per_user_and_per_request(self):
+        self.purchase()
+        self.assertEqual(self.purchase(quantity=3).status_code, 422)
+
+        other = User.objects.create_user(email='other@example.com', name='Other', password='pass12345')
+        self.client.force_authenticate(other)
+        self.assertNotIn('Idempotent-Replayed', self.purchase())
+        self.assertEqual(Purchase.objects.count(), 2)
+
+    def test_checkout_and_create_purchase_are_idempotent(self):
+        headers = {'Idempotency-Key': 'cart-7'}
+        items = {'items': [{'sweet_id': self.sweet.id, 'quantity': 1}]}
+        self.client.post('/api/checkout/', items, format='json', headers=headers)
+        self.assertEqual(self.client.post('/api/checkout/', items, format='json', headers=headers).status_code, 201)
+
+        data = {'user': self.user.id, 'sweet': self.sweet.id, 'quantity': 1, 'total_price': '50.00'}
+        self.client.post('/api/purchases/create/', data, format='json', headers=headers)
+        response = self.client.post('/api/purchases/create/', data, format='json', headers=headers)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Purchase.objects.count(), 2)
+
+    def test_server_errors_are_not_stored(self):
+        with mock.patch('api.views.Purchase.objects.create', side_effect=RuntimeError('disk full')):
+            self.assertEqual(self.purchase().status_code, 500)
+        response = self.purchase()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_concurrent_duplicates_wait_for_the_first_request(self):
+        calls = []
+        release = threading.Event()
+
+        @api_view(['POST'])
+        @idempotent
+        def slow_view(request):
+            calls.append(request.data)
+            release.wait(5)
+            return Response({'charged': len(calls)}, status=201)
+
+        factory = APIRequestFactory()
+        before = idempotency_stats()
+        responses = []
+
+        def send():
+            request = factory.post('/pay/', {'amount': 5}, format='json', headers={'Idempotency-Key': 'storm'})
+            responses.append(slow_view(request))
+
+        threads = [threading.Thread(target=send) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while not calls:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([response.data for response in responses], [{'charged': 1}] * 5)
+        after = idempotency_stats()
+        self.assertEqual(after['executed'] - before['executed'], 1)
+        self.assertEqual(after['coalesced'] - before['coalesced'], 4)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_duplicate_of_a_running_request_gets_409(self):
+        @api_view(['POST'])
+        @idempotent
+        def nested_view(request):
+            # A duplicate arriving while this request is still running
+            duplicate = nested_view(APIRequestFactory().post('/pay/', {}, format='json', headers={'Idempotency-Key': 'k'}))
+            return Response({'duplicate_status': duplicate.status_code})
+
+        request = APIRequestFactory().post('/pay/', {}, format='json', headers={'Idempotency-Key': 'k'})
+        self.assertEqual(nested_view(request).data, {'duplicate_status': 409})
+
+
+@override_settings(STOCK_SHARD_REFRESH_SECONDS=0)
+class StockShardTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='hot@example.com', name='Hot', password='pass12345')
+        self.sweet = Sweet.objects.create(name='Gulab Jamun', category='traditional', price='20.00', quantity=10)
+        self.plain = Sweet.objects.create(name='Peda', category='traditional', price='15.00', quantity=10)
+        self.client.force_authenticate(self.user)
+
+    def shards(self):
+        return list(StockShard.objects.filter(sweet=self.sweet).order_by('shard').values_list('quantity', flat=True))
+
+    def test_sharding_splits_the_stock(self):
+        out = StringIO()
+        call_command('shard_stock', self.sweet.id, shards=4, stdout=out)
+        self.assertIn('10 in stock over 4 shards', out.getvalue())
+        self.assertEqual(self.shards(), [3, 3, 2, 2])
+        self.sweet.refresh_from_db()
+        self.assertEqual((self.sweet.quantity, self.sweet.stock_shards), (10, 4))
+
+        shard_stock(self.sweet.id, 3, quantity=30)
+        self.assertEqual(self.shards(), [10, 10, 10])
+        shard_stock(self.sweet.id, 0)
+        self.assertEqual(self.shards(), [])
+        self.sweet.refresh_from_db()
+        self.assertEqual((self.sweet.quantity, self.sweet.stock_shards), (30, 0))
+        with self.assertRaises(CommandError):
+            call_command('shard_stock', 999999, shards=2, stdout=StringIO())
+
+    def test_purchase_takes_from_one_shard(self):
+        shard_stock(self.sweet.id, 4)
+        with override_settings(STOCK_SHARD_REFRESH_SECONDS=60), CaptureQueriesContext(connection) as queries:
+            self.assertTrue(take_stock(self.sweet.id, 2))
+        # The conditional UPDATE of unsharded sweets misses, then one shard is decremented;
+        # the summed quantity is refreshed later
+        self.assertEqual([query['sql'].split()[:2] for query in queries], [['UPDATE', '"sweets"'], ['UPDATE', '"stock_shards"']])
+        self.assertIn('"stock_shards" = 0', queries[0]['sql'])
+        self.assertEqual(sum(self.shards()), 8)
+        self.assertEqual(stock_levels([self.sweet.id])[self.sweet.id], 8)
+
+        response = self.client.post(f'/api/sweets/{self.sweet.id}/purchase/', {'quantity': 1}, format='json')
+        self.assertEqual(response.data['remaining_quantity'], 7)
+        self.assertEqual(self.client.get(f'/api/sweets/public/{self.sweet.id}/').data['quantity'], 7)
+
+    def test_rebalances_when_no_shard_has_enough(self):
+        shard_stock(self.sweet.id, 4)
+        self.assertTrue(take_stock(self.sweet.id, 5))
+        self.assertEqual(self.shards(), [2, 1, 1, 1])
+        self.assertFalse(take_stock(self.sweet.id, 6))
+        self.assertEqual(self.shards(), [2, 1, 1, 1])
+        self.assertTrue(rebalance(self.sweet.id))
+
+        response = self.client.post(f'/api/sweets/{self.sweet.id}/purchase/', {'quantity': 6}, format='json')
+        self.assertEqual(response.data['error'], 'Not enough stock. Available: 5 kg')
+
+    def test_checkout_and_returns_use_the_shards(self):
+        shard_stock(self.sweet.id, 2)
+        items = [{'sweet_id': self.sweet.id, 'quantity': 4}, {'sweet_id': self.plain.id, 'quantity': 3}]
+        response = self.client.post('/api/checkout/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(stock_levels([self.sweet.id, self.plain.id]), {self.sweet.id: 6, self.plain.id: 7})
+
+        # A sharded line that cannot be filled rolls back the whole order
+        items = [{'sweet_id': self.plain.id, 'quantity': 1}, {'sweet_id': self.sweet.id, 'quantity': 7}]
+        self.assertEqual(self.client.post('/api/checkout/', {'items': items}, format='json').status_code, 400)
+        self.assertEqual(stock_levels([self.sweet.id, self.plain.id]), {self.sweet.id: 6, self.plain.id: 7})
+
+        self.assertEqual(sorted(self.shards()), [1, 5])
+        adjust_stock({self.sweet.id: 3, self.plain.id: -2})
+        self.assertEqual(sorted(self.shards()), [4, 5])
+        self.plain.refresh_from_db()
+        self.assertEqual(self.plain.quantity, 5)
+
+        reservation = self.client.post('/api/cart/', {'sweet_id': self.sweet.id, 'quantity': 9}, format='json')
+        self.assertEqual(reservation.status_code, 201)
+        self.client.delete(f"/api/cart/{reservation.data['id']}/")
+        self.assertEqual(sum(self.shards()), 9)
+
+    def test_checkout_reads_the_shards_not_the_lagging_quantity(self):
+        shard_stock(self.sweet.id, 2)
+        Sweet.objects.filter(id=self.sweet.id).update(quantity=0)
+        response = self.client.post('/api/checkout/', {'items': [{'sweet_id': self.sweet.id, 'quantity': 20}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['unavailable'][0]['available'], 10)
+        response = self.client.post('/api/checkout/', {'items': [{'sweet_id': self.sweet.id, 'quantity': 4}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sum(self.shards()), 6)
+
+    def test_stock_edits_go_to_the_shards(self):
+        shard_stock(self.sweet.id, 2)
+        self.client.patch(f'/api/admin-sweets/{self.sweet.id}/', {'quantity': 100}, format='json')
+        self.assertEqual(self.shards(), [50, 50])
+        self.client.patch(f'/api/admin-sweets/{self.sweet.id}/', {'name': 'Kala Jamun'}, format='json')
+        self.assertEqual(self.shards(), [50, 50])
+
+        sweet = Sweet.objects.get(id=self.sweet.id)
+        sweet.quantity = 40
+        SweetAdmin(Sweet, admin.site).save_model(None, sweet, mock.Mock(changed_data=['quantity']), change=True)
+        self.assertEqual(self.shards(), [20, 20])
+        refresh_summed_quantity(self.sweet.id)
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 40)
+
+    @override_settings(STOCK_SHARD_REFRESH_SECONDS=60)
+    def test_rolled_back_change_does_not_hold_off_the_refresh(self):
+        shard_stock(self.sweet.id, 2)
+        cache.clear()
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                take_stock(self.sweet.id, 1)
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertIsNone(cache.get(f'stock-shards:refresh:{self.sweet.id}'))
+
+
+class SQLiteTuningTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connections_are_tuned(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('foreign_keys'), 1)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_begin_is_retried_while_the_database_is_locked(self):
+        locked = OperationalError('database is locked')
+        with mock.patch.object(SQLiteDatabaseWrapper, '_start_transaction_under_autocommit',
+                               side_effect=[locked, locked, None]) as begin, \
+                mock.patch('api.sqlite.base.time.sleep') as sleep:
+            connection._start_transaction_under_autocommit()
+        self.assertEqual(begin.call_count, 3)
+        first, second = (call.args[0] for call in sleep.call_args_list)
+        self.assertTrue(0.025 <= first <= 0.075 and 0.05 <= second <= 0.15)
+
+        with mock.patch.object(SQLiteDatabaseWrapper, '_start_transaction_under_autocommit', side_effect=locked), \
+                mock.patch('api.sqlite.base.time.sleep'):
+            with self.assertRaisesMessage(OperationalError, 'database is locked'):
+                connection._start_transaction_under_autocommit()
+        with mock.patch.object(SQLiteDatabaseWrapper, '_start_transaction_under_autocommit',
+                               side_effect=OperationalError('disk I/O error')) as begin:
+            with self.assertRaises(OperationalError):
+                connection._start_transaction_under_autocommit()
+        self.assertEqual(begin.call_count, 1)
+
+
+class PurchaseSweetConcurrencyTests(TransactionTestCase):
+    """Hammer one hot sweet from many threads; stock must never go negative."""
+
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 25
+    STOCK = 100
+
+    def test_concurrent_buyers_never_oversell(self):
+        sweet = Sweet.objects.create(name='Gulab Jamun', category='traditional', price='150.00', quantity=self.STOCK)
+        users = [
+            User.objects.create_user(email=f'buyer{i}@example.com', name=f'Buyer {i}', password='pass12345')
+            for i in range(self.THREADS)
+        ]
+        results = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.THREADS)
+
+        def buyer(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            codes = []
+            try:
+                barrier.wait()
+                for _ in range(self.ATTEMPTS_PER_THREAD):
+                    response = client.post(f'/api/sweets/{sweet.id}/purchase/', {'quantity': 1}, format='json')
+                    codes.append(response.status_code)
+            finally:
+                connection.close()
+            with lock:
+                results.extend(codes)
+
+        threads = [threading.Thread(target=buyer, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        sold = results.count(200)
+        print(f"\n{len(results)} purchase attempts from {self.THREADS} threads in {elapsed:.2f}s "
+              f"({len(results) / elapsed:.0f} purchases/s), {sold} succeeded")
+
+        sweet.refresh_from_db()
+        self.assertEqual(set(results) - {200, 400}, set())
+        self.assertEqual(sold, self.STOCK)
+        self.assertEqual(sweet.quantity, 0)
+        self.assertEqual(Purchase.objects.filter(sweet=sweet).count(), self.STOCK)
+
+
+class LoadTestTests(TransactionTestCase):
+    def test_run_and_compare_with_baseline(self):
+        baseline = Path(tempfile.mkdtemp()) / 'baseline.json'
+        self.addCleanup(shutil.rmtree, baseline.parent)
+        options = {
+            'users': 5, 'sweets': 5, 'purchases': 20, 'concurrency': 2, 'duration': 0.1,
+            'current_database': True, 'baseline': baseline, 'stdout': StringIO(),
+        }
+        call_command('run_benchmarks', write_baseline=True, **options)
+        recorded = json.loads(baseline.read_text())
+        self.assertGreater(recorded['calibration_ms'], 0)
+        results = recorded['results']
+        self.assertEqual(set(results), {'get_sweets', 'get_sweet_detail', 'purchase_sweet', 'login_user', 'list_purchases'})
+        self.assertTrue(all(result['requests'] and not result['errors'] for result in results.values()))
+
+        results['get_sweets']['req_per_s'] *= 1000
+        baseline.write_text(json.dumps({'scale': {}, 'results': results}))
+        with self.assertRaisesRegex(CommandError, 'get_sweets: req_per_s'):
+            call_command('run_benchmarks', scenarios=['get_sweets'], **{**options, 'users': 1, 'sweets': 1, 'purchases': 1})
+
+    def test_compare(self):
+        baseline = {'get_sweets': {'req_per_s': 100.0, 'p95_ms': 10.0}}
+        ok = {'get_sweets': {'req_per_s': 80.0, 'p95_ms': 12.0, 'errors': 0}}
+        self.assertEqual(compare(ok, baseline, 0.25), [])
+        slow = {'get_sweets': {'req_per_s': 70.0, 'p95_ms': 13.0, 'errors': 1}}
+        self.assertEqual(len(compare(slow, baseline, 0.25)), 3)
+        # On a machine half as fast the same numbers are fine, on one twice as fast they are not
+        self.assertEqual(compare(slow, baseline, 0.25, speed=0.5), ['get_sweets: 1 failed requests'])
+        self.assertEqual(len(compare(ok, baseline, 0.25, speed=2.0)), 2)
+
+
+class SyntheticDataTests(TestCase):
+    def generate(self, **options):
+        call_command('generate_synthetic_data', users=20, sweets=50, purchases=2000, batch_size=300, stdout=StringIO(), **options)
+        return list(Purchase.objects.order_by('id').values_list('sweet__name', 'user__email', 'quantity', 'total_price'))
+
+    def test_data_is_skewed_and_deterministic(self):
+        rows = self.generate()
+        self.assertEqual(len(rows), 2000)
+        self.assertEqual(User.objects.count(), 20)
+        per_sweet = sorted(Counter(name for name, *_ in rows).values(), reverse=True)
+        # The hottest 10% of sweets sell about half of all units; uniform would be 10%
+        self.assertGreater(sum(per_sweet[:5]), 800)
+        self.assertEqual(sum(SweetSalesDaily.objects.values_list('purchases', flat=True)), 2000)
+        oldest = Purchase.objects.order_by('purchase_date').first().purchase_date
+        self.assertLess(oldest, timezone.now() - timedelta(days=300))
+
+        Purchase.objects.all().delete()
+        Sweet.objects.all().delete()
+        self.assertEqual(self.generate(), rows)
+        self.assertEqual(User.objects.count(), 20)
+
+
+class LoginStormBenchmarkTests(TransactionTestCase):
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_login_storm', duration=0.2, catalog_clients=1, login_clients=2, stdout=out)
+        self.assertRegex(out.getvalue(), r'storm, pool\s+\d+')
+        self.assertFalse(User.objects.exists())
+
+
+class FlashSaleLedgerTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='flash@example.com', name='Flash', password='pass12345')
+        self.sweet = Sweet.objects.create(name='Motichoor Ladoo', category='traditional', price='30.00', quantity=5)
+        self.journal = Path(tempfile.mkdtemp()) / 'flash_sale.journal'
+        self.addCleanup(shutil.rmtree, self.journal.parent)
+
+    def test_purchases_are_committed_in_batches(self):
+        ledger = FlashSaleLedger(self.journal, flush_interval=0.05)
+        ledger.start()
+        self.addCleanup(ledger.drain)
+        for quantity in (1, 2):
+            ledger.submit(self.user.id, self.sweet.id, quantity)
+        entry, remaining = ledger.submit(None, self.sweet.id, 1)
+        self.assertEqual((entry['seq'], remaining), (3, 1))
+        with self.assertRaisesMessage(Exception, 'Not enough stock. Available: 1 kg'):
+            ledger.submit(self.user.id, self.sweet.id, 2)
+        with self.assertRaises(Sweet.DoesNotExist):
+            ledger.submit(self.user.id, 999999, 1)
+
+        ledger.drain()
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 1)
+        # The anonymous purchase only took stock
+        self.assertEqual(sorted(Purchase.objects.values_list('quantity', flat=True)), [1, 2])
+        self.assertEqual(SweetSalesDaily.objects.get().revenue, Decimal('90.00'))
+        self.assertEqual(LedgerCheckpoint.objects.get().sequence, 3)
+        self.assertEqual(self.journal.read_text(), '')
+
+    def test_full_queue_sheds_purchases(self):
+        ledger = FlashSaleLedger(self.journal, queue_size=1)
+        # Journal and queue, but no flusher yet
+        ledger.journal = open(self.journal, 'a', encoding='utf-8')
+        ledger.accepting = True
+        ledger.submit(self.user.id, self.sweet.id, 1)
+        with self.assertRaises(Throttled):
+            ledger.submit(self.user.id, self.sweet.id, 1)
+        ledger.journal.close()
+
+    def test_entries_that_cannot_commit_are_set_aside(self):
+        gone = User.objects.create_user(email='gone@example.com', name='Gone', password='pass12345')
+        ledger = FlashSaleLedger(self.journal)
+        ledger.journal = open(self.journal, 'a', encoding='utf-8')
+        ledger.accepting = True
+        ledger.submit(self.user.id, self.sweet.id, 1)
+        ledger.submit(gone.id, self.sweet.id, 2)
+        gone.delete()
+
+        with mock.patch('api.ledger.time.sleep'), self.assertLogs('api.ledger', 'ERROR'):
+            ledger._flush(list(ledger.queue.queue))
+        ledger.journal.close()
+        self.assertEqual(list(Purchase.objects.values_list('user_id', flat=True)), [self.user.id])
+        rejected = [json.loads(line) for line in ledger.rejected_path.read_text().splitlines()]
+        self.assertEqual([(entry['seq'], entry['quantity']) for entry in rejected], [(2, 2)])
+        # The rejected quantity is for sale again
+        self.assertEqual(ledger.stock[self.sweet.id], 4)
+        self.assertEqual(self.journal.read_text(), '')
+
+    def test_reconcile_replays_the_journal_after_a_crash(self):
+        ledger = FlashSaleLedger(self.journal)
+        ledger.journal = open(self.journal, 'a', encoding='utf-8')
+        ledger.accepting = True
+        for quantity in (1, 1, 2):
+            ledger.submit(self.user.id, self.sweet.id, quantity)
+        # The flusher committed the first entry, then the process died halfway through a fourth
+        first = json.loads(self.journal.read_text().splitlines()[0])
+        apply_entries([first])
+        ledger.journal.write('{"seq": 4, "user')
+        ledger.journal.close()
+
+        out = StringIO()
+        call_command('reconcile_flash_sale', journal=str(self.journal), stdout=out)
+        self.assertIn('Committed 2 purchases', out.getvalue())
+        self.assertFalse(self.journal.exists())
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 1)
+        self.assertEqual(Purchase.objects.count(), 3)
+        self.assertEqual(
+            Purchase.objects.order_by('id').first().purchase_date.isoformat(), first['purchased_at']
+        )
+        self.assertEqual(reconcile(self.journal), 0)
+
+    def test_purchase_sweet_in_flash_sale_mode(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with override_settings(FLASH_SALE_MODE=True, FLASH_SALE_JOURNAL=self.journal):
+            self.addCleanup(drain_ledger)
+            response = client.post(f'/api/sweets/{self.sweet.id}/purchase/', {'quantity': 3}, format='json')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data['remaining_quantity'], 2)
+            response = client.post(f'/api/sweets/{self.sweet.id}/purchase/', {'quantity': 3}, format='json')
+            self.assertEqual(response.data['error'], 'Not enough stock. Available: 2 kg')
+            self.assertEqual(client.post('/api/sweets/999999/purchase/', {}, format='json').status_code, 404)
+            drain_ledger()
+
+        self.assertEqual(Purchase.objects.get().total_price, Decimal('90.00'))
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 2)
+
+    def test_flash_sale_rejects_quantities_it_cannot_charge(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with override_settings(FLASH_SALE_MODE=True, FLASH_SALE_JOURNAL=self.journal):
+            self.addCleanup(drain_ledger)
+            for quantity, error in (('0.5', 'Quantity must be a whole number'),
+                                    ('0', 'Quantity must be greater than 0'),
+                                    ('Infinity', 'Quantity must be a whole number')):
+                response = client.post(f'/api/sweets/{self.sweet.id}/purchase/', {'quantity': quantity}, format='json')
+                self.assertEqual((response.status_code, response.data['error']), (400, error))
+            response = client.post(f'/api/sweets/{self.sweet.id}/purchase/', {'quantity': '2.0'}, format='json')
+            self.assertEqual((response.status_code, response.data['purchased_quantity']), (202, 2))
+            drain_ledger()
+
+        self.assertEqual(Purchase.objects.get().total_price, Decimal('60.00'))
+        # Normal mode bills the same way
+        response = client.post(f'/api/sweets/{self.sweet.id}/purchase/', {'quantity': '0.5'}, format='json')
+        self.assertEqual((response.status_code, response.data['error']), (400, 'Quantity must be a whole number'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """A second SQLite file, refreshed by copy_to_replicas(), stands in for a replica"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added after the test runner has set up (and checked) the configured databases
+        directory = Path(tempfile.mkdtemp())
+        connections.settings['replica'] = {**deepcopy(connection.settings_dict), 'NAME': str(directory / 'replica.sqlite3')}
+        cls.databases = cls.databases | {'replica'}
+        cls.addClassCleanup(shutil.rmtree, directory)
+        cls.addClassCleanup(cls._drop_replica)
+
+    @classmethod
+    def _drop_replica(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        cache.clear()
+        get_catalog_cache().clear()
+        self.user = User.objects.create_user(email='replica@example.com', name='Replica', password='pass12345')
+        self.sweet = Sweet.objects.create(name='Kaju Katli', category='traditional', price='40.00', quantity=10)
+        copy_to_replicas()
+        # Only the primary sees this until the next copy
+        Sweet.objects.filter(id=self.sweet.id).update(name='Kaju Barfi')
+
+    def _client(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        return client
+
+    def _sweet_name(self, client):
+        return client.get(f'/api/sweets/public/{self.sweet.id}/').data['name']
+
+    def test_clients_read_their_own_writes(self):
+        client = self._client()
+        self.assertEqual(self._sweet_name(client), 'Kaju Katli')
+
+        response = client.post(f'/api/sweets/{self.sweet.id}/purchase/', {'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self._sweet_name(client), 'Kaju Barfi')
+        self.assertEqual(len(client.get('/api/purchases/').data['results']), 1)
+
+        # Without the cookie, the user is still pinned through the cache
+        client = self._client()
+        self.assertEqual(len(client.get('/api/purchases/').data['results']), 1)
+
+        # Once the pin expires, reads go back to the replica, which lags until the next copy
+        cache.clear()
+        self.assertEqual(client.get('/api/purchases/').data['results'], [])
+        copy_to_replicas()
+        self.assertEqual(len(client.get('/api/purchases/').data['results']), 1)
+        self.assertEqual(self._sweet_name(client), 'Kaju Barfi')
+
+    def test_reads_outside_replica_views_use_the_primary(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Sweet), 'default')
+        self.assertEqual(self._client().get('/api/purchases/user/').status_code, 200)
+        self.assertFalse(router.allow_migrate('replica', 'api'))
+
+        reads = []
+        view = replica_reads(lambda request: reads.append(router.db_for_read(Sweet)))
+        request = APIRequestFactory().get('/')
+        view(request)
+        with transaction.atomic():
+            view(request)
+        self.assertEqual(reads, ['replica', 'default'])
+
+    def test_async_views_stay_async(self):
+        async def view(request):
+            if request.method == 'POST':
+                await Sweet.objects.filter(id=self.sweet.id).aupdate(price='45.00')
+                return JsonResponse({})
+            return await async_views.get_sweet_detail(request, self.sweet.id)
+
+        middleware = ReplicaPinMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        factory = AsyncRequestFactory()
+        response = async_to_sync(middleware)(factory.get('/'))
+        self.assertEqual(json.loads(response.content)['name'], 'Kaju Katli')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        response = async_to_sync(middleware)(factory.post('/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        request = factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(json.loads(async_to_sync(middleware)(request).content)['name'], 'Kaju Barfi')
+
+        with override_settings(DATABASE_REPLICAS=[]), self.assertRaises(MiddlewareNotUsed):
+            ReplicaPinMiddleware(view)
+
+    def test_catalog_built_from_a_replica_expires_with_the_pin(self):
+        with mock.patch.object(get_catalog_cache(), 'set', wraps=get_catalog_cache().set) as cache_set:
+            response = APIClient().get('/api/sweets/public/')
+        self.assertEqual([sweet['name'] for sweet in response.data], ['Kaju Katli'])
+        self.assertEqual(cache_set.call_args.kwargs['timeout'], 5)
+
+    def test_async_catalog_built_from_a_replica_expires_with_the_pin(self):
+        with mock.patch.object(get_catalog_cache(), 'aset', wraps=get_catalog_cache().aset) as cache_set:
+            response = async_to_sync(async_views.get_sweets)(AsyncRequestFactory().get('/api/sweets/public/'))
+        self.assertEqual([sweet['name'] for sweet in json.loads(response.content)], ['Kaju Katli'])
+        self.assertEqual(cache_set.call_args.kwargs['timeout'], 5)
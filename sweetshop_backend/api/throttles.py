@@ -0,0 +1,18 @@
+from rest_framework.throttling import SimpleRateThrottle
+
+from .hashing import record
+
+
+class PasswordRateThrottle(SimpleRateThrottle):
+    """Per-client limit on login and registration attempts (the "password" rate).
+
+    Checked before the view runs, so rejected attempts never reach the hashing pool.
+    """
+    scope = 'password'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+    def throttle_failure(self):
+        record('throttled')
+        return False
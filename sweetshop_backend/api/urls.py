@@ -1,7 +1,11 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
-from . import views
+from . import async_views, views
+
+# Read-heavy endpoints that have an async implementation (see api.async_views)
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 router = DefaultRouter()
 router.register(r'users', views.UserViewSet)
@@ -9,9 +13,6 @@ router.register(r'admin-sweets', views.SweetViewSet)  # Changed to avoid conflic
 router.register(r'purchases', views.PurchaseViewSet)
 
 urlpatterns = [
-    # Router URLs for ViewSets
-    path('', include(router.urls)),
-    
     # Authentication endpoints
     path('auth/register/', views.register_user, name='register'),
     path('auth/login/', views.login_user, name='login'),
@@ -24,12 +25,26 @@ urlpatterns = [
     path('debug/', views.debug_request, name='debug_request'),
     
     # Public sweet endpoints
-    path('sweets/public/', views.get_sweets, name='public_sweets'),
-    path('sweets/public/<int:sweet_id>/', views.get_sweet_detail, name='public_sweet_detail'),
+    path('sweets/public/', read_views.get_sweets, name='public_sweets'),
+    path('sweets/public/<int:sweet_id>/', read_views.get_sweet_detail, name='public_sweet_detail'),
     path('sweets/simple/', views.get_sweets_simple, name='simple_sweets'),
+    path('sweets/search/', views.search_sweets, name='search_sweets'),
     
     # Purchase endpoints
-    path('purchases/user/', views.get_user_purchases, name='user_purchases'),
+    path('purchases/user/', read_views.get_user_purchases, name='user_purchases'),
     path('purchases/create/', views.create_purchase, name='create_purchase'),
     path('sweets/<int:sweet_id>/purchase/', views.purchase_sweet, name='purchase_sweet'),
+    path('checkout/', views.checkout, name='checkout'),
+    path('purchases/export/', views.export_purchases, name='export_purchases'),
+
+    # Cart reservations
+    path('cart/', views.cart, name='cart'),
+    path('cart/<int:reservation_id>/', views.release_reservation, name='release_reservation'),
+    path('cart/checkout/', views.checkout_cart, name='checkout_cart'),
+    
+    # Analytics endpoints
+    path('analytics/sales/', views.sales_analytics, name='sales_analytics'),
+
+    # Router URLs for ViewSets (last, so purchases/<pk>/ does not shadow purchases/user/)
+    path('', include(router.urls)),
 ]
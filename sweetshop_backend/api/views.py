@@ -1,16 +1,44 @@
+import logging
+
 from django.shortcuts import render
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import NotFound, Throttled, ValidationError
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.http import JsonResponse
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from datetime import timedelta
 from decimal import Decimal
-from .models import User, Sweet, Purchase
-from .serializers import UserSerializer, UserCreateSerializer, SweetSerializer, SweetCreateSerializer, PurchaseSerializer, PurchaseCreateSerializer
+from urllib.parse import urlencode
+from .analytics import record_sales, sales_report
+from .cache import get_cached_catalog, invalidate_catalog
+from .exports import CONTENT_TYPES, RENDERERS, export_rows
+from .filters import filter_sweets, get_catalog_facets, parse_catalog_filters
+from .hashing import PoolFull
+from .idempotency import idempotent
+from .inventory import set_stock, stock_levels, take_stock
+from .ledger import NotEnoughStock, get_ledger
+from .models import User, Sweet, Purchase, Reservation
+from .pagination import CreatedAtCursorPagination, PurchaseCursorPagination, cursor_requested
+from .permissions import IsShopAdmin
+from .renditions import rendition_urls
+from .replicas import replica_reads
+from . import reservations
+from .search import match_sweets
+from .serializers import UserSerializer, UserCreateSerializer, SweetSerializer, SweetCreateSerializer, PurchaseSerializer, PurchaseCreateSerializer, CheckoutSerializer, SalesReportQuerySerializer, PurchaseExportQuerySerializer, ReservationSerializer, ReservationCreateSerializer
+from .throttles import PasswordRateThrottle
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
@@ -18,16 +46,23 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]  # Keep admin operations protected
+    pagination_class = CreatedAtCursorPagination
     
     def get_serializer_class(self):
         if self.action == 'create':
             return UserCreateSerializer
         return UserSerializer
+    
+    def get_queryset(self):
+        if self.action == 'list':
+            return User.objects.only(*UserSerializer.Meta.fields)
+        return User.objects.all()
 
 class SweetViewSet(viewsets.ModelViewSet):
     queryset = Sweet.objects.all()
     serializer_class = SweetSerializer
     permission_classes = [IsAuthenticated]  # Keep admin operations protected
+    pagination_class = CreatedAtCursorPagination
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -38,11 +73,18 @@ class SweetViewSet(viewsets.ModelViewSet):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
+    
+    @transaction.atomic
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        if 'quantity' in serializer.validated_data:
+            set_stock(serializer.instance, serializer.instance.quantity)
 
 class PurchaseViewSet(viewsets.ModelViewSet):
-    queryset = Purchase.objects.all()
+    queryset = Purchase.objects.for_listing()
     serializer_class = PurchaseSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PurchaseCursorPagination
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -52,27 +94,48 @@ class PurchaseViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Filter purchases by current user if not admin"""
         if self.request.user.role == 'admin':
-            return Purchase.objects.all()
-        return Purchase.objects.filter(user=self.request.user)
+            return Purchase.objects.for_listing()
+        return Purchase.objects.for_listing().filter(user=self.request.user)
+    
+    @method_decorator(replica_reads)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    # Writes run in a transaction so the sales rollups change together with the purchase
+    @transaction.atomic
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+    
+    @transaction.atomic
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+    
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([PasswordRateThrottle])
 def register_user(request):
     """Register a new user"""
-    print("Registration request received:", request.data)
     serializer = UserCreateSerializer(data=request.data)
     if serializer.is_valid():
-        user = serializer.save()
-        print("User created successfully:", user.email)
+        try:
+            user = serializer.save()
+        except PoolFull:
+            raise _hashing_shed()
+        logger.info('user registered', extra={'user_id': user.id})
         return Response({
             'message': 'User created successfully',
             'user': UserSerializer(user).data
         }, status=status.HTTP_201_CREATED)
-    print("Registration validation errors:", serializer.errors)
+    logger.info('registration rejected', extra={'fields': sorted(serializer.errors)})
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([PasswordRateThrottle])
 def login_user(request):
     """Login user and return JWT tokens"""
     email = request.data.get('email')
@@ -83,7 +146,10 @@ def login_user(request):
             'error': 'Please provide both email and password'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    user = authenticate(username=email, password=password)
+    # Runs AUTHENTICATION_BACKENDS (api.hashing.PooledHashingBackend) and sends user_login_failed
+    user = authenticate(request, email=email, password=password)
+    if getattr(request, 'hashing_pool_full', False):
+        raise _hashing_shed()
     
     if user:
         refresh = RefreshToken.for_user(user)
@@ -97,6 +163,9 @@ def login_user(request):
             'error': 'Invalid credentials'
         }, status=status.HTTP_401_UNAUTHORIZED)
 
+def _hashing_shed():
+    return Throttled(wait=1, detail='Too many sign-in attempts in progress. Try again shortly.')
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_user_profile(request):
@@ -108,7 +177,6 @@ def get_user_profile(request):
 @authentication_classes([])  # Disable authentication for this endpoint
 def test_connection(request):
     """Test endpoint to check if backend is accessible"""
-    print("test_connection endpoint called")
     return Response({
         'message': 'Backend is working!',
         'status': 'success',
@@ -118,43 +186,27 @@ def test_connection(request):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 @authentication_classes([])  # Disable authentication for this endpoint
+@replica_reads
 def get_sweets(request):
     """Get all sweets (public endpoint)"""
-    print("=== get_sweets endpoint called ===")
-    print(f"Request method: {request.method}")
-    print(f"Request user: {request.user}")
-    print(f"Request auth: {request.auth}")
-    print(f"Request path: {request.path}")
-    print(f"Request GET params: {request.GET}")
-    
+    logger.debug('get_sweets', extra={'params': request.GET.dict()})
     try:
-        sweets = Sweet.objects.all()
-        print(f"Found {sweets.count()} sweets")
-        
-        # Use a simpler serializer approach
-        sweets_data = []
-        for sweet in sweets:
-            sweet_data = {
-                'id': sweet.id,
-                'name': sweet.name,
-                'description': sweet.description,
-                'category': sweet.category,
-                'price': str(sweet.price),
-                'quantity': sweet.quantity,
-                'created_at': sweet.created_at.isoformat(),
-            }
-            if sweet.image:
-                sweet_data['image'] = request.build_absolute_uri(sweet.image.url)
-            else:
-                sweet_data['image'] = None
-            sweets_data.append(sweet_data)
-        
-        print(f"Returning {len(sweets_data)} sweets")
+        filters = parse_catalog_filters(request)
+        if cursor_requested(request):
+            sweets_data = _public_catalog_page(request, filters)
+        else:
+            sweets_data = _public_catalog(request, filters)
+            logger.debug('public catalog served', extra={'sweets': len(sweets_data)})
+
+        if filters['facets']:
+            if isinstance(sweets_data, list):
+                sweets_data = {'results': sweets_data}
+            sweets_data = {**sweets_data, 'facets': get_catalog_facets()}
         return Response(sweets_data)
+    except (NotFound, ValidationError):
+        raise  # Invalid cursor or filters
     except Exception as e:
-        print(f"Error in get_sweets: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('get_sweets failed')
         return Response({
             'error': 'Failed to fetch sweets',
             'details': str(e)
@@ -162,39 +214,109 @@ def get_sweets(request):
 
 def get_sweets_simple(request):
     """Simple Django view for getting sweets (no DRF)"""
+    logger.debug('get_sweets_simple', extra={'params': request.GET.dict()})
     try:
-        print("get_sweets_simple endpoint called")
-        print(f"Request method: {request.method}")
-        print(f"Request user: {request.user}")
-        
-        sweets = Sweet.objects.all()
-        print(f"Found {sweets.count()} sweets")
-        
-        sweets_data = []
-        for sweet in sweets:
-            sweet_data = {
-                'id': sweet.id,
-                'name': sweet.name,
-                'description': sweet.description,
-                'category': sweet.category,
-                'price': str(sweet.price),
-                'quantity': sweet.quantity,
-                'created_at': sweet.created_at.isoformat(),
+        filters = parse_catalog_filters(request)
+        if cursor_requested(request):
+            page = _public_catalog_page(Request(request), filters)
+            response_data = {
+                'sweets': page['results'],
+                'next': page['next'],
+                'previous': page['previous']
             }
-            if sweet.image:
-                sweet_data['image'] = request.build_absolute_uri(sweet.image.url)
-            else:
-                sweet_data['image'] = None
-            sweets_data.append(sweet_data)
-        
-        print(f"Returning {len(sweets_data)} sweets")
-        return JsonResponse({'sweets': sweets_data})
+        else:
+            sweets_data = _public_catalog(request, filters)
+            logger.debug('public catalog served', extra={'sweets': len(sweets_data)})
+            response_data = {'sweets': sweets_data}
+
+        if filters['facets']:
+            response_data['facets'] = get_catalog_facets()
+        return JsonResponse(response_data)
+    except NotFound as e:
+        return JsonResponse({'error': str(e.detail)}, status=404)
+    except ValidationError as e:
+        return JsonResponse({'error': e.detail}, status=400)
     except Exception as e:
-        print(f"Error in get_sweets_simple: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('get_sweets_simple failed')
         return JsonResponse({'error': str(e)}, status=500)
 
+def _sweet_to_dict(sweet, request):
+    sweet_data = {
+        'id': sweet.id,
+        'name': sweet.name,
+        'description': sweet.description,
+        'category': sweet.category,
+        'price': str(sweet.price),
+        'quantity': sweet.quantity,
+        'created_at': sweet.created_at.isoformat(),
+    }
+    if sweet.image:
+        sweet_data['image'] = request.build_absolute_uri(sweet.image.url)
+    else:
+        sweet_data['image'] = None
+    sweet_data['image_renditions'] = rendition_urls(sweet, request)
+    return sweet_data
+
+def _public_catalog(request, filters):
+    """Serialized public catalog, served from the catalog cache when it is current"""
+    # Image URLs are absolute, so the payload is cached per scheme and host
+    return get_cached_catalog(
+        'public',
+        lambda: [_sweet_to_dict(sweet, request) for sweet in filter_sweets(Sweet.objects.all(), filters)],
+        request.build_absolute_uri('/'),
+        sorted((name, str(value)) for name, value in filters.items() if name != 'facets'),
+    )
+
+def _public_catalog_page(request, filters):
+    """One keyset page of the public catalog, cached per filters, page size and cursor"""
+    paginator = CreatedAtCursorPagination()
+    cursor = paginator.decode_cursor(request)  # NotFound for a cursor that does not decode
+    params = {
+        name: str(value).lower() if isinstance(value, bool) else value
+        for name, value in sorted(filters.items()) if name != 'facets' or value
+    }
+    if 'page_size' in request.query_params:
+        params['page_size'] = paginator.get_page_size(request)
+    # Other query parameters change neither the page nor its links, so leave
+    # them out of both rather than caching a copy per URL
+    base_url = request.build_absolute_uri(request.path)
+    if params:
+        base_url = f'{base_url}?{urlencode(params)}'
+
+    def build():
+        page = paginator.paginate_queryset(filter_sweets(Sweet.objects.all(), filters), request)
+        paginator.base_url = base_url
+        return {
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'results': [_sweet_to_dict(sweet, request) for sweet in page],
+        }
+
+    return get_cached_catalog('public-page', build, base_url, cursor)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@authentication_classes([])  # Disable authentication for this endpoint
+def search_sweets(request):
+    """Full-text search over sweet names, descriptions and categories (public endpoint)"""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        return Response({
+            'error': 'Invalid limit'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if not query:
+        return Response([])
+
+    results = get_cached_catalog(
+        'search',
+        lambda: [_sweet_to_dict(sweet, request) for sweet in match_sweets(query, limit)],
+        request.build_absolute_uri('/'), query.lower(), limit,
+    )
+    return Response(results)
+
 def test_simple(request):
     """Test endpoint without any DRF"""
     return JsonResponse({
@@ -219,6 +341,7 @@ def debug_request(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@replica_reads
 def get_sweet_detail(request, sweet_id):
     """Get specific sweet details (public endpoint)"""
     try:
@@ -234,18 +357,24 @@ def get_sweet_detail(request, sweet_id):
 @permission_classes([IsAuthenticated])
 def get_user_purchases(request):
     """Get purchases for current user"""
-    purchases = Purchase.objects.filter(user=request.user)
+    purchases = Purchase.objects.for_listing().filter(user=request.user)
+    if cursor_requested(request):
+        paginator = PurchaseCursorPagination()
+        page = paginator.paginate_queryset(purchases, request)
+        return paginator.get_paginated_response(PurchaseSerializer(page, many=True).data)
     serializer = PurchaseSerializer(purchases, many=True)
     return Response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_purchase(request):
     """Create a new purchase"""
     serializer = PurchaseCreateSerializer(data=request.data)
     if serializer.is_valid():
         # Set the user to current user
-        serializer.save(user=request.user)
+        with transaction.atomic():
+            serializer.save(user=request.user)
         return Response({
             'message': 'Purchase created successfully',
             'purchase': PurchaseSerializer(serializer.instance).data
@@ -254,45 +383,61 @@ def create_purchase(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])  # Allow anyone to purchase (for demo)
+@idempotent
 def purchase_sweet(request, sweet_id):
     """Purchase a sweet, decreasing its quantity"""
+    # Get quantity from request
+    quantity = request.data.get('quantity', 1)
     try:
-        sweet = Sweet.objects.get(id=sweet_id)
-        
-        # Get quantity from request
-        quantity = request.data.get('quantity', 1)
-        try:
-            quantity = Decimal(str(quantity))  # Convert to Decimal for precise calculations
-            if quantity <= 0:
-                return Response({
-                    'error': 'Quantity must be greater than 0'
-                }, status=status.HTTP_400_BAD_REQUEST)
-        except (ValueError, TypeError, Exception):
+        quantity = Decimal(str(quantity))  # Convert to Decimal for precise calculations
+        if quantity <= 0:
             return Response({
-                'error': 'Invalid quantity format'
+                'error': 'Quantity must be greater than 0'
             }, status=status.HTTP_400_BAD_REQUEST)
-        
-        if sweet.quantity < quantity:
-            return Response({
-                'error': f'Not enough stock. Available: {sweet.quantity} kg'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Calculate total price
-        total_price = sweet.price * quantity
-        
-        # Decrease quantity
-        sweet.quantity -= quantity
-        sweet.save()
-        
-        # Create purchase record if user is authenticated
-        if request.user.is_authenticated:
-            Purchase.objects.create(
-                user=request.user,
-                sweet=sweet,
-                quantity=quantity,
-                total_price=total_price
-            )
-        
+    except (ValueError, TypeError, Exception):
+        return Response({
+            'error': 'Invalid quantity format'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    # Stock and purchases count whole kilograms, in both modes
+    if not quantity.is_finite() or quantity != quantity.to_integral_value():
+        return Response({
+            'error': 'Quantity must be a whole number'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    quantity = int(quantity)
+
+    if settings.FLASH_SALE_MODE:
+        return _queue_purchase(request, sweet_id, quantity)
+
+    try:
+        with transaction.atomic():
+            # Single conditional UPDATE (on the sweet, or one of its stock shards):
+            # the stock check and the decrement happen in the database, so
+            # concurrent buyers can never oversell and no row is
+            # read-modified-written in Python.
+            if not take_stock(sweet_id, quantity):
+                sweet = Sweet.objects.only('id').get(id=sweet_id)
+                return Response({
+                    'error': f'Not enough stock. Available: {stock_levels([sweet.id])[sweet.id]} kg'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            sweet = Sweet.objects.only('id', 'name', 'category', 'price', 'quantity', 'stock_shards').get(id=sweet_id)
+            if sweet.stock_shards:
+                sweet.quantity = stock_levels([sweet.id])[sweet.id]
+            # update() skips post_save, so invalidate the catalog explicitly
+            invalidate_catalog()
+
+            # Calculate total price
+            total_price = sweet.price * quantity
+
+            # Create purchase record if user is authenticated
+            if request.user.is_authenticated:
+                Purchase.objects.create(
+                    user=request.user,
+                    sweet=sweet,
+                    quantity=quantity,
+                    total_price=total_price
+                )
+
         return Response({
             'message': f'Successfully purchased {quantity} kg of {sweet.name}',
             'purchased_quantity': quantity,
@@ -305,7 +450,7 @@ def purchase_sweet(request, sweet_id):
                 'quantity': sweet.quantity
             }
         }, status=status.HTTP_200_OK)
-        
+
     except Sweet.DoesNotExist:
         return Response({
             'error': 'Sweet not found'
@@ -314,3 +459,222 @@ def purchase_sweet(request, sweet_id):
         return Response({
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+def _queue_purchase(request, sweet_id, quantity):
+    """purchase_sweet in flash-sale mode: accepted now, committed by the ledger's next batch"""
+    user_id = request.user.pk if request.user.is_authenticated else None
+    try:
+        entry, remaining = get_ledger().submit(user_id, sweet_id, quantity)
+    except Sweet.DoesNotExist:
+        return Response({
+            'error': 'Sweet not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except NotEnoughStock as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'message': f"Successfully purchased {quantity} kg of {entry['name']}",
+        'purchased_quantity': quantity,
+        'total_price': entry['total_price'],
+        'remaining_quantity': remaining,
+        'sweet': {
+            'id': sweet_id,
+            'name': entry['name'],
+            'quantity': remaining
+        }
+    }, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent
+def checkout(request):
+    """Purchase several sweets at once, all-or-nothing"""
+    serializer = CheckoutSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    lines = serializer.validated_data['items']
+    requested = {}
+    for line in lines:
+        requested[line['sweet_id']] = requested.get(line['sweet_id'], 0) + line['quantity']
+
+    with transaction.atomic():
+        # One SELECT for prices and stock of every line item
+        sweets = Sweet.objects.only('id', 'name', 'category', 'price', 'quantity', 'stock_shards').in_bulk(list(requested))
+
+        missing = [sweet_id for sweet_id in requested if sweet_id not in sweets]
+        if missing:
+            return Response({
+                'error': 'Sweet not found',
+                'missing': missing
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        unavailable = _unavailable_lines(requested, sweets)
+        if unavailable:
+            return Response({
+                'error': 'Not enough stock',
+                'unavailable': unavailable
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # One conditional UPDATE for every unsharded sweet; each row only matches
+        # while it still has enough stock, so a concurrent buyer makes the count
+        # fall short. Sharded sweets take from their shards one by one.
+        plain = {sweet_id: quantity for sweet_id, quantity in requested.items() if not sweets[sweet_id].stock_shards}
+        in_stock = Q()
+        new_quantity = []
+        for sweet_id, quantity in plain.items():
+            in_stock |= Q(id=sweet_id, quantity__gte=quantity)
+            new_quantity.append(When(id=sweet_id, then=F('quantity') - quantity))
+        updated = 0
+        if plain:
+            updated = Sweet.objects.filter(in_stock, stock_shards=0).update(
+                quantity=Case(*new_quantity, default=F('quantity'))
+            )
+        updated += sum(
+            take_stock(sweet_id, quantity) for sweet_id, quantity in requested.items() if sweet_id not in plain
+        )
+
+        if updated != len(requested):
+            transaction.set_rollback(True)
+            sweets = Sweet.objects.only('id', 'name', 'quantity', 'stock_shards').in_bulk(list(requested))
+            return Response({
+                'error': 'Not enough stock',
+                'unavailable': _unavailable_lines(requested, sweets)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        invalidate_catalog()
+
+        purchases = Purchase.objects.bulk_create([
+            Purchase(
+                user=request.user,
+                sweet=sweets[line['sweet_id']],
+                quantity=line['quantity'],
+                total_price=sweets[line['sweet_id']].price * line['quantity']
+            )
+            for line in lines
+        ])
+        # bulk_create sends no post_save, so update the sales rollups here
+        record_sales(purchases)
+
+    return Response({
+        'message': 'Checkout completed successfully',
+        'total_price': sum(purchase.total_price for purchase in purchases),
+        'purchases': PurchaseSerializer(purchases, many=True).data
+    }, status=status.HTTP_201_CREATED)
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def cart(request):
+    """List the current user's reserved stock, or reserve more for a few minutes"""
+    if request.method == 'GET':
+        held = Reservation.objects.filter(user=request.user, expires_at__gt=timezone.now()).select_related('sweet')
+        return Response(ReservationSerializer(held, many=True).data)
+
+    serializer = ReservationCreateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    sweet_id = serializer.validated_data['sweet_id']
+    reservation = reservations.reserve(request.user, sweet_id, serializer.validated_data['quantity'])
+    if reservation is None:
+        sweet = Sweet.objects.only('quantity').filter(id=sweet_id).first()
+        if sweet is None:
+            return Response({
+                'error': 'Sweet not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'error': f'Not enough stock. Available: {sweet.quantity} kg'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    reservation = Reservation.objects.select_related('sweet').get(id=reservation.id)
+    return Response(ReservationSerializer(reservation).data, status=status.HTTP_201_CREATED)
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def release_reservation(request, reservation_id):
+    """Give reserved stock back before it expires"""
+    if not reservations.release(request.user, reservation_id):
+        return Response({
+            'error': 'Reservation not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent
+def checkout_cart(request):
+    """Buy everything the current user still has reserved"""
+    purchases = reservations.checkout_cart(request.user)
+    if not purchases:
+        return Response({
+            'error': 'No reserved stock to check out; reservations may have expired'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'message': 'Checkout completed successfully',
+        'total_price': sum(purchase.total_price for purchase in purchases),
+        'purchases': PurchaseSerializer(purchases, many=True).data
+    }, status=status.HTTP_201_CREATED)
+
+def _unavailable_lines(requested, sweets):
+    """Line items whose requested quantity exceeds the sweet's stock"""
+    # The quantity of a sharded sweet lags behind its shards
+    available = {sweet_id: sweet.quantity for sweet_id, sweet in sweets.items()}
+    sharded = [sweet_id for sweet_id, sweet in sweets.items() if sweet.stock_shards]
+    if sharded:
+        available.update(stock_levels(sharded))
+    return [
+        {
+            'sweet_id': sweet_id,
+            'name': sweets[sweet_id].name,
+            'requested': quantity,
+            'available': available[sweet_id]
+        }
+        for sweet_id, quantity in requested.items()
+        if available[sweet_id] < quantity
+    ]
+
+@api_view(['GET'])
+@permission_classes([IsShopAdmin])
+def sales_analytics(request):
+    """Revenue and quantity sold between two dates, answered from the daily rollups"""
+    serializer = SalesReportQuerySerializer(data=request.GET.dict())
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    end = serializer.validated_data.get('to', timezone.localdate())
+    start = serializer.validated_data.get('from', end - timedelta(days=29))
+    group_by = serializer.validated_data['group_by']
+    results = sales_report(start, end, group_by)
+
+    return Response({
+        'from': start,
+        'to': end,
+        'group_by': group_by,
+        'totals': {
+            'quantity': sum(row['quantity'] for row in results),
+            'revenue': sum((row['revenue'] for row in results), Decimal('0')),
+            'purchases': sum(row['purchases'] for row in results),
+        },
+        'results': results
+    })
+
+@api_view(['GET'])
+@permission_classes([IsShopAdmin])
+def export_purchases(request):
+    """Stream purchases with sweet and user names as CSV or NDJSON, optionally between two dates"""
+    serializer = PurchaseExportQuerySerializer(data=request.GET.dict())
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    start = serializer.validated_data.get('from')
+    end = serializer.validated_data.get('to')
+    output = serializer.validated_data['output']
+    response = StreamingHttpResponse(
+        RENDERERS[output](export_rows(start, end)), content_type=CONTENT_TYPES[output]
+    )
+    filename = '-'.join(['purchases', *(day.isoformat() for day in (start, end) if day)])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
@@ -0,0 +1,7 @@
+"""Repeatable load tests for the API.
+
+seed fills a database at a chosen scale, scenarios describes the requests
+each endpoint gets, and runner drives them from concurrent clients and
+compares the results with baseline.json. Run everything with
+`python manage.py run_benchmarks`.
+"""
@@ -0,0 +1,117 @@
+import hashlib
+import random
+import sqlite3
+import statistics
+import threading
+import time
+
+from django.db import connection
+from django.test import Client
+
+# Metrics compared with the baseline: (name, True if higher is better)
+COMPARED = (('req_per_s', True), ('p95_ms', False))
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_scenario(scenario, data, concurrency=8, duration=5.0, seed=0):
+    """Send scenario requests from concurrent clients for duration seconds; returns the summary"""
+    stop = threading.Event()
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def client_loop(rng):
+        nonlocal errors
+        client = Client()
+        try:
+            while not stop.is_set():
+                method, path, kwargs = scenario(rng, data)
+                started = time.perf_counter()
+                response = getattr(client, method)(path, **kwargs)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    errors += response.status_code >= 400
+        finally:
+            connection.close()
+
+    # Warm up caches and lazy imports outside the measurement
+    method, path, kwargs = scenario(random.Random(seed), data)
+    getattr(Client(), method)(path, **kwargs)
+
+    threads = [
+        threading.Thread(target=client_loop, args=(random.Random(seed * 1000 + number),))
+        for number in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def summarize(latencies, errors, seconds):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'requests': 0, 'errors': errors, 'req_per_s': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'req_per_s': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def calibrate(rounds=25):
+    """Milliseconds a fixed CPU and SQLite workload takes on this machine, median of rounds.
+
+    The workload does not touch the application, so comparing the timings of
+    two machines tells how much faster one runs the benchmarks than the other.
+    The median of many short rounds shrugs off the ones that were interrupted.
+    """
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        db = sqlite3.connect(':memory:')
+        db.execute('CREATE TABLE rows (id INTEGER PRIMARY KEY, bucket INTEGER, value TEXT)')
+        db.executemany('INSERT INTO rows (bucket, value) VALUES (?, ?)', ((n % 97, str(n)) for n in range(4000)))
+        for bucket in range(10):
+            db.execute('SELECT COUNT(*), MAX(value) FROM rows WHERE bucket = ?', (bucket,)).fetchone()
+        db.close()
+        hashlib.pbkdf2_hmac('sha256', b'password', b'salt', 20000)
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+def compare(results, baseline, tolerance, speed=1.0):
+    """Regressions beyond tolerance (a fraction) against the baseline, as messages.
+
+    speed is how many times faster this machine is than the one that recorded
+    the baseline; the expected numbers are scaled by it.
+    """
+    regressions = []
+    for name, result in results.items():
+        if result['errors']:
+            regressions.append(f"{name}: {result['errors']} failed requests")
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for metric, higher_is_better in COMPARED:
+            scaled = expected[metric] * speed if higher_is_better else expected[metric] / speed
+            limit = scaled * (1 - tolerance if higher_is_better else 1 + tolerance)
+            worse = result[metric] < limit if higher_is_better else result[metric] > limit
+            if worse:
+                regressions.append(
+                    f'{name}: {metric} {result[metric]} vs baseline {expected[metric]} '
+                    f'({scaled:.2f} on this machine, limit {limit:.2f} at {tolerance:.0%} tolerance)'
+                )
+    return regressions
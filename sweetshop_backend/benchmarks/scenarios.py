@@ -0,0 +1,59 @@
+"""The requests each benchmarked endpoint receives.
+
+A scenario takes a random.Random and the seeded Dataset and returns the
+(method, path, client kwargs) of one request.
+"""
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import User
+from .seed import PASSWORD
+
+
+class Dataset:
+    """Ids of the seeded rows, plus bearer tokens for some of the users"""
+
+    def __init__(self, user_ids, sweet_ids, token_users=50):
+        self.user_ids = user_ids
+        self.sweet_ids = sweet_ids
+        self.emails = list(User.objects.filter(id__in=user_ids).values_list('email', flat=True))
+        self.authorizations = [
+            f'Bearer {RefreshToken.for_user(user).access_token}'
+            for user in User.objects.filter(id__in=user_ids[:token_users])
+        ]
+
+
+def get_sweets(rng, data):
+    return 'get', '/api/sweets/public/', {}
+
+
+def get_sweet_detail(rng, data):
+    return 'get', f'/api/sweets/public/{rng.choice(data.sweet_ids)}/', {}
+
+
+def purchase_sweet(rng, data):
+    return 'post', f'/api/sweets/{rng.choice(data.sweet_ids)}/purchase/', {
+        'data': {'quantity': 1}, 'content_type': 'application/json',
+        'HTTP_AUTHORIZATION': rng.choice(data.authorizations),
+    }
+
+
+def login_user(rng, data):
+    # A random client address per attempt keeps the per-client login rate out of the way
+    address = '10.{}.{}.{}'.format(*rng.randbytes(3))
+    return 'post', '/api/auth/login/', {
+        'data': {'email': rng.choice(data.emails), 'password': PASSWORD}, 'content_type': 'application/json',
+        'REMOTE_ADDR': address,
+    }
+
+
+def list_purchases(rng, data):
+    return 'get', '/api/purchases/', {'HTTP_AUTHORIZATION': rng.choice(data.authorizations)}
+
+
+SCENARIOS = {
+    'get_sweets': get_sweets,
+    'get_sweet_detail': get_sweet_detail,
+    'purchase_sweet': purchase_sweet,
+    'login_user': login_user,
+    'list_purchases': list_purchases,
+}
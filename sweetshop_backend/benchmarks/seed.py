@@ -0,0 +1,131 @@
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.analytics import backfill_sales
+from api.cache import bump_catalog_version
+from api.models import Purchase, Sweet, User
+
+PASSWORD = 'benchmark-password'
+CATEGORIES = ['traditional', 'modern', 'chocolate', 'fruit', 'nut', 'other']
+FLAVOURS = ['Kesar', 'Pista', 'Mango', 'Rose', 'Cardamom', 'Coconut', 'Chocolate', 'Badam', 'Gulkand', 'Saffron']
+BASES = ['Barfi', 'Ladoo', 'Peda', 'Halwa', 'Katli', 'Jamun', 'Rasgulla', 'Sandesh', 'Truffle', 'Jalebi']
+
+PURCHASE_INSERT_SQL = f"""
+    INSERT INTO {Purchase._meta.db_table} (user_id, sweet_id, quantity, total_price, purchase_date)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+
+def zipf_cum_weights(count, skew):
+    """Cumulative weights of ranks 1..count under Zipf's law; skew 0 is uniform"""
+    return list(itertools.accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+@contextmanager
+def _large_page_cache():
+    """Give SQLite a 256 MB page cache while loading, so index inserts stay in memory"""
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA cache_size')
+        previous = cursor.fetchone()[0]
+        cursor.execute('PRAGMA cache_size = -262144')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA cache_size = {int(previous)}')
+
+
+def seed(users=100, sweets=200, purchases=5000, seed=0, skew=1.1, days=365, batch_size=10000, progress=None):
+    """Fill the database with synthetic data; every user's password is PASSWORD.
+
+    Sweet popularity follows Zipf's law with the given skew, so a few sweets
+    get most purchases and the rest form a long tail (which sweets are hot is
+    shuffled, not the lowest ids). Purchases are spread over the last `days`
+    days. The same arguments always produce the same rows. Returns the ids of
+    the generated users and sweets; users left over from an earlier run are
+    reused. progress, if given, is called with a message after every batch.
+    """
+    rng = random.Random(seed)
+    report = progress or (lambda message: None)
+
+    # One hash shared by every user, so seeding does not spend hours in PBKDF2
+    password = make_password(PASSWORD)
+    emails = [f'bench{i}@example.com' for i in range(users)]
+    for start in range(0, users, batch_size):
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(email=email, name=f'Bench User {start + i}', password=password)
+                for i, email in enumerate(emails[start:start + batch_size])
+            ], ignore_conflicts=True)
+        report(f'Users: {min(start + batch_size, users)}/{users}')
+    user_ids = []
+    for start in range(0, users, 500):
+        user_ids += User.objects.filter(email__in=emails[start:start + 500]).values_list('id', flat=True)
+
+    prices = {}
+    for start in range(0, sweets, batch_size):
+        with transaction.atomic():
+            created = Sweet.objects.bulk_create([
+                Sweet(
+                    name=f'{rng.choice(FLAVOURS)} {rng.choice(BASES)} {i}', description=f'Synthetic sweet number {i}',
+                    category=rng.choice(CATEGORIES), price=Decimal(rng.randrange(5000, 100000)) / 100,
+                    quantity=1_000_000,
+                )
+                for i in range(start, min(start + batch_size, sweets))
+            ])
+        prices.update((sweet.id, sweet.price) for sweet in created)
+        report(f'Sweets: {len(prices)}/{sweets}')
+    sweet_ids = list(prices)
+
+    if purchases:
+        with _large_page_cache():
+            _insert_purchases(rng, user_ids, sweet_ids, prices, purchases, skew, days, batch_size, report)
+
+    # None of the above sends signals, so refresh the rollups and the catalog by hand
+    for processed in backfill_sales(batch_size=100000):
+        report(f'Sales rollups: {processed}/{purchases}')
+    bump_catalog_version()
+    return user_ids, sweet_ids
+
+
+def _insert_purchases(rng, user_ids, sweet_ids, prices, purchases, skew, days, batch_size, report):
+    # Plain executemany rather than bulk_create(): no model instance per row, and
+    # purchase_date (auto_now_add) can be spread over the past instead of "now"
+    by_popularity = sweet_ids[:]
+    rng.shuffle(by_popularity)
+    sweet_weights = zipf_cum_weights(len(by_popularity), skew)
+    # Some customers buy a lot more than others, though less extremely than sweets sell
+    by_activity = user_ids[:]
+    rng.shuffle(by_activity)
+    user_weights = zipf_cum_weights(len(by_activity), skew / 2)
+
+    now = timezone.now()
+    span = days * 86400
+    adapt = connection.ops.adapt_datetimefield_value
+    done = 0
+    while done < purchases:
+        size = min(batch_size, purchases - done)
+        rows = []
+        for sweet_id, user_id, quantity, offset in zip(
+            rng.choices(by_popularity, cum_weights=sweet_weights, k=size),
+            rng.choices(by_activity, cum_weights=user_weights, k=size),
+            rng.choices((1, 1, 1, 2, 2, 3, 5), k=size),
+            (rng.random() * span for _ in range(size)),
+        ):
+            rows.append((
+                user_id, sweet_id, quantity, str(prices[sweet_id] * quantity), adapt(now - timedelta(seconds=offset))
+            ))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(PURCHASE_INSERT_SQL, rows)
+        done += size
+        report(f'Purchases: {done}/{purchases}')
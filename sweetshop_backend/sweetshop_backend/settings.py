@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its latency covers every other middleware
+    'api.metrics.MetricsMiddleware',
+    'api.profiling.QueryProfilingMiddleware',
+    'api.replicas.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -74,17 +79,89 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'sweetshop_backend.wsgi.application'
 
+# Serve get_sweets, get_sweet_detail and get_user_purchases from api.async_views.
+# Turn on when running under ASGI (e.g. `uvicorn sweetshop_backend.asgi:application`);
+# under WSGI the sync views avoid an event loop per request.
+ASYNC_VIEWS = False
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # Django's SQLite backend plus WAL and tuned pragmas (api/sqlite/base.py)
+        'ENGINE': 'api.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Writers take the lock when their transaction starts, so concurrent
+            # purchases queue on busy_timeout instead of failing mid-transaction
+            'transaction_mode': 'IMMEDIATE',
+            'lock_retries': 3,
+            'lock_backoff': 0.05,
+        },
+        # Use a file for the test database so concurrent-purchase tests get
+        # SQLite's busy timeout instead of shared-cache "table is locked" errors.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+# Read replicas (api.replicas): catalog and purchase-history reads go to one
+# of these aliases, all other queries to 'default'. Locally, SQLITE_REPLICAS=N
+# adds N SQLite files that `manage.py replicate_sqlite --every 1` keeps
+# copying from the primary, standing in for replication. In tests they mirror
+# the test database, which they only see once TestCase transactions commit,
+# so run the test suite without SQLITE_REPLICAS.
+for number in range(1, int(os.environ.get('SQLITE_REPLICAS', 0)) + 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / f'db.replica{number}.sqlite3',
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# After a request writes, its client (by cookie, and by user for signed-in
+# users) reads from the primary for this many seconds, so it sees its own
+# writes. Keep it above the replicas' worst lag.
+REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# The "catalog" alias holds the serialized public catalog, keyed by a catalog
+# version that is bumped whenever a Sweet changes. LocMemCache is per process;
+# with several workers switch it to FileBasedCache (or DatabaseCache after
+# `python manage.py createcachetable`) so every worker sees the same version.
+# The version itself lives in "catalog-version", which holds nothing else, so
+# payloads filling up "catalog" can never evict it; switch it together with
+# "catalog".
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sweetshop-catalog',
+        'TIMEOUT': 300,
+    },
+    'catalog-version': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sweetshop-catalog-version',
+        'TIMEOUT': None,
+    },
 }
 
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_VERSION_CACHE_ALIAS = 'catalog-version'
+
+# Seconds a JWT-authenticated user (id, role, flags) stays in the default cache
+# (api.authentication). Saving or deleting the user drops the entry right away.
+AUTH_USER_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -126,6 +203,80 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Threads that resize uploaded sweet images into thumb/card/full renditions
+# (api.renditions). 0 renders inline, which is only meant for tests.
+IMAGE_RENDITION_WORKERS = 2
+
+# Application logs go to stderr as one JSON object per line (api.log). Debug
+# lines, such as the catalog request parameters, need API_LOG_LEVEL=DEBUG.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'api.log.JSONFormatter'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': os.environ.get('API_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Bearer token Prometheus sends to scrape /metrics (api.metrics). Without one
+# the endpoint refuses every request.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Fraction of requests (0-1) whose queries are profiled by
+# api.profiling.QueryProfilingMiddleware: Server-Timing headers, and queries
+# slower than SQL_SLOW_QUERY_MS logged to api.profiling. 0 turns it off.
+SQL_PROFILING_SAMPLE_RATE = float(os.environ.get('SQL_PROFILING_SAMPLE_RATE', 0))
+SQL_SLOW_QUERY_MS = 100
+
+# Threads that hash passwords for login and registration (api.hashing), and how
+# many more requests may wait for them before the rest get a 429. 0 hashes
+# inline on the request thread without any bound.
+PASSWORD_HASHING_WORKERS = 2
+PASSWORD_HASHING_MAX_PENDING = 16
+
+# ModelBackend with the password check on that pool
+AUTHENTICATION_BACKENDS = ['api.hashing.PooledHashingBackend']
+
+# How long a cart holds reserved stock (api.reservations). Expired holds are
+# returned by `manage.py sweep_reservations`, or when someone else needs them.
+RESERVATION_TTL_SECONDS = 10 * 60
+
+# Idempotency-Key support on purchases and checkouts (api.idempotency): how
+# long a response is replayed for, how long a duplicate waits for a first
+# request that is still running before it gets a 409, and when a crashed first
+# request stops blocking its key. Responses are kept in this cache alias, which
+# must be shared by all workers (not LocMemCache) when there are several.
+IDEMPOTENCY_CACHE_ALIAS = 'default'
+IDEMPOTENCY_TTL = 24 * 60 * 60
+IDEMPOTENCY_WAIT_SECONDS = 5
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Flash-sale mode (api.ledger): purchase_sweet answers 202 after an in-memory
+# stock check and an append to FLASH_SALE_JOURNAL, and a background thread
+# commits queued purchases in batches every FLASH_SALE_FLUSH_MS. Needs a single
+# server process. Run `manage.py reconcile_flash_sale` after a crash if the
+# server is not coming back in flash-sale mode (which reconciles on its own).
+FLASH_SALE_MODE = os.environ.get('FLASH_SALE_MODE') == '1'
+FLASH_SALE_JOURNAL = BASE_DIR / 'flash_sale.journal'
+FLASH_SALE_JOURNAL_FSYNC = False  # True survives power loss, at one fsync per purchase
+FLASH_SALE_QUEUE_SIZE = 10000
+FLASH_SALE_BATCH_SIZE = 500
+FLASH_SALE_FLUSH_MS = 5
+
+# A sharded sweet's quantity (the sum of its stock shards, api.inventory) is
+# refreshed this many seconds after the first purchase that changes it, so
+# the catalog lags by at most this much. 0 refreshes within every purchase.
+STOCK_SHARD_REFRESH_SECONDS = 1
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -137,13 +288,18 @@ AUTH_USER_MODEL = 'api.User'
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'api.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    'DEFAULT_THROTTLE_RATES': {
+        # Login and registration attempts per client IP (api.throttles)
+        'password': '10/min',
+    },
 }
 
 # JWT Settings